@@ -0,0 +1,8 @@
+"""
+Load benchmarks for the API.
+
+`python -m benchmarks.run` (from api/) starts local stand-ins for PostgREST,
+the create-order Edge Function and Sentry ingest, runs main.py under uvicorn
+against them and drives /products, /orders and /tunnel at a fixed
+concurrency. See run.py for options.
+"""
@@ -0,0 +1,134 @@
+"""
+In-process stand-ins for the services the API talks to.
+
+One aiohttp server answers as PostgREST (/rest/v1/products), the
+create-order Edge Function (/functions/v1/create-order) and Sentry ingest
+(/api/<project>/envelope/), each after a configurable delay so upstream
+latency is reproducible. It runs on its own event loop in a background
+thread, so it never competes with the load generator's loop.
+"""
+
+import asyncio
+import threading
+import uuid
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+# Supabase client keys only need to look like a JWT
+FAKE_SERVICE_ROLE_KEY = "header.payload.signature"
+
+
+def make_products(count: int) -> List[Dict[str, Any]]:
+    """Deterministic product rows shaped like the products table."""
+    return [
+        {
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "name": f"Pineapple Product {i}",
+            "price": str(Decimal(1999 + i * 100) / 100),
+            "image_path": f"products/pineapple-{i}.jpg",
+            "description": f"Benchmark product {i}",
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def _filter_rows(rows: List[Dict[str, Any]], params) -> List[Dict[str, Any]]:
+    """The subset of PostgREST filters ProductRepository sends."""
+    for column, value in params.items():
+        if column in ("select", "order", "limit", "offset"):
+            continue
+        op, _, operand = value.partition(".")
+        if op == "gt":
+            rows = [r for r in rows if r[column] > operand]
+        elif op == "gte":
+            rows = [r for r in rows if Decimal(r[column]) >= Decimal(operand)]
+        elif op == "lte":
+            rows = [r for r in rows if Decimal(r[column]) <= Decimal(operand)]
+        elif op == "ilike":
+            needle = operand.strip("%").replace("\\", "").lower()
+            rows = [r for r in rows if needle in r[column].lower()]
+    if "order" in params:
+        rows = sorted(rows, key=lambda r: r[params["order"].split(".")[0]])
+    if "limit" in params:
+        rows = rows[:int(params["limit"])]
+    select = params.get("select", "*")
+    if select != "*":
+        columns = select.split(",")
+        rows = [{c: r[c] for c in columns} for r in rows]
+    return rows
+
+
+@dataclass
+class FakeUpstreams:
+    """PostgREST, Edge Function and Sentry ingest stand-ins on one port."""
+
+    products: int = 100
+    db_delay: float = 0.005
+    edge_delay: float = 0.02
+    sentry_delay: float = 0.005
+    counts: Dict[str, int] = field(default_factory=lambda: {"db": 0, "edge": 0, "sentry": 0})
+    port: int = 0
+
+    def __post_init__(self):
+        self._rows = make_products(self.products)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def _products(self, request: web.Request) -> web.Response:
+        self.counts["db"] += 1
+        await asyncio.sleep(self.db_delay)
+        return web.json_response(_filter_rows(self._rows, request.query))
+
+    async def _create_order(self, request: web.Request) -> web.Response:
+        self.counts["edge"] += 1
+        payload = await request.json()
+        await asyncio.sleep(self.edge_delay)
+        order = {"id": str(uuid.uuid4()), "user_id": payload.get("user_id"), "total": payload.get("total")}
+        return web.json_response({"order": order}, status=201)
+
+    async def _envelope(self, request: web.Request) -> web.Response:
+        self.counts["sentry"] += 1
+        await request.read()
+        await asyncio.sleep(self.sentry_delay)
+        return web.json_response({"id": uuid.uuid4().hex})
+
+    def _app(self) -> web.Application:
+        app = web.Application(client_max_size=10 * 1024 * 1024)
+        app.router.add_get("/rest/v1/products", self._products)
+        app.router.add_post("/functions/v1/create-order", self._create_order)
+        app.router.add_post("/api/{project}/envelope/", self._envelope)
+        return app
+
+    def start(self) -> "FakeUpstreams":
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._runner = web.AppRunner(self._app(), access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+            self._loop.run_until_complete(site.start())
+            self.port = self._runner.addresses[0][1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name="fake-upstreams", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop = None
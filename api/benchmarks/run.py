@@ -0,0 +1,296 @@
+"""
+Drive the API at a fixed concurrency and report latency percentiles.
+
+Run from api/:
+
+    python -m benchmarks.run --concurrency 50 --requests 2000 --save baseline.json
+    python -m benchmarks.run --compare baseline.json
+
+Unless --url is given, FakeUpstreams and a uvicorn process serving main:app
+are started locally, with SUPABASE_URL and the Sentry tunnel upstream
+pointed at the fakes and Sentry reporting disabled. Each scenario runs
+`--warmup` untimed requests, then `--requests` timed ones. With --compare,
+the exit status is 1 when a scenario's p95/p99 latency grew or its
+throughput dropped by more than --threshold against the baseline.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import aiohttp
+
+from benchmarks.fakes import FAKE_SERVICE_ROLE_KEY, FakeUpstreams
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(API_DIR)
+
+# Must match SENTRY_HOST / SENTRY_PROJECT_IDS in main.py
+TUNNEL_DSN = "https://key@o673219.ingest.us.sentry.io/4508059881242624"
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    method: str
+    path: str
+    body: Optional[Callable[[int], bytes]] = None
+    content_type: str = "application/json"
+
+
+def order_body(i: int) -> bytes:
+    return json.dumps({
+        "user_id": f"bench-user-{i % 100}",
+        "items": [{"product_id": "00000000-0000-0000-0000-000000000001", "quantity": 1 + i % 3, "price_at_purchase": 20.99}],
+    }).encode()
+
+
+def envelope_body(i: int) -> bytes:
+    header = json.dumps({"dsn": TUNNEL_DSN, "event_id": f"{i:032x}"})
+    item = json.dumps({"message": "benchmark event", "level": "info"})
+    return f'{header}\n{{"type":"event","length":{len(item)}}}\n{item}\n'.encode()
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "products": Scenario("products", "GET", "/products"),
+    "products-page": Scenario("products-page", "GET", "/products?limit=20&fields=id,name,price"),
+    "orders": Scenario("orders", "POST", "/orders", order_body),
+    "tunnel": Scenario("tunnel", "POST", "/tunnel", envelope_body, "application/x-sentry-envelope"),
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies: List[float], elapsed: float, statuses: Dict[int, int]) -> Dict[str, Any]:
+    """Latency percentiles (ms), throughput and status breakdown for one scenario."""
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if status >= 500 or status == 0)
+    summary = {f"p{p}_ms": round(percentile(ordered, p) * 1000, 3) for p in PERCENTILES}
+    summary.update({
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        "requests": len(ordered),
+        "rps": round(len(ordered) / elapsed, 1) if elapsed > 0 else 0.0,
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    })
+    return summary
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Describe every scenario that regressed by more than `threshold` (a fraction)."""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if base[key] > 0 and result[key] > base[key] * (1 + threshold):
+                regressions.append(f"{name}: {key} {base[key]} -> {result[key]}")
+        if result["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"{name}: rps {base['rps']} -> {result['rps']}")
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {result['errors']}")
+    return regressions
+
+
+async def run_scenario(
+    session: aiohttp.ClientSession, base_url: str, scenario: Scenario, concurrency: int, requests: int, warmup: int
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    url = base_url + scenario.path
+    headers = {"Content-Type": scenario.content_type} if scenario.body else {}
+
+    async def one(i: int, record: bool):
+        data = scenario.body(i) if scenario.body else None
+        started = time.perf_counter()
+        try:
+            async with session.request(scenario.method, url, data=data, headers=headers) as resp:
+                await resp.read()
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = 0
+        if record:
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    async def drive(total: int, record: bool):
+        counter = iter(range(total))
+
+        async def worker():
+            for i in counter:
+                await one(i, record)
+
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+
+    await drive(warmup, record=False)
+    started = time.perf_counter()
+    await drive(requests, record=True)
+    return summarize(latencies, time.perf_counter() - started, statuses)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_api(upstreams: FakeUpstreams, port: int, log_file) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        SUPABASE_URL=upstreams.url,
+        SUPABASE_SERVICE_ROLE_KEY=FAKE_SERVICE_ROLE_KEY,
+        SENTRY_DSN="",
+        SENTRY_TUNNEL_UPSTREAM=upstreams.url,
+        # Every benchmark request comes from one client; measure throughput, not the rate limits
+        ORDERS_RATE_LIMIT_RATE="1000000",
+        ORDERS_RATE_LIMIT_BURST="1000000",
+        ORDERS_USER_RATE_LIMIT_RATE="1000000",
+        ORDERS_USER_RATE_LIMIT_BURST="1000000",
+        ORDERS_BATCH_RATE_LIMIT_RATE="1000000",
+        ORDERS_BATCH_RATE_LIMIT_BURST="1000000",
+        TUNNEL_RATE_LIMIT_RATE="1000000",
+        TUNNEL_RATE_LIMIT_BURST="1000000",
+        ADMISSION_MAX_IN_FLIGHT="100000",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", API_DIR, "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=REPO_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_ready(base_url: str, process: Optional[subprocess.Popen], timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"API exited with status {process.returncode}")
+            try:
+                async with session.get(base_url + "/metrics") as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"API not ready at {base_url} after {timeout}s")
+
+
+async def run_all(base_url: str, names: List[str], concurrency: int, requests: int, warmup: int) -> Dict[str, Any]:
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=30)
+    results = {}
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        for name in names:
+            results[name] = await run_scenario(session, base_url, SCENARIOS[name], concurrency, requests, warmup)
+    return results
+
+
+def print_table(results: Dict[str, Any]):
+    print(f"{'scenario':<15}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>10}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<15}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['rps']:>10}{r['errors']:>8}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=1000, help="timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=100, help="untimed requests per scenario")
+    parser.add_argument("--url", help="benchmark an already running API instead of starting one")
+    parser.add_argument("--products", type=int, default=100, help="rows served by the fake products table")
+    parser.add_argument("--db-delay", type=float, default=0.005, help="fake PostgREST latency (s)")
+    parser.add_argument("--edge-delay", type=float, default=0.02, help="fake Edge Function latency (s)")
+    parser.add_argument("--sentry-delay", type=float, default=0.005, help="fake Sentry ingest latency (s)")
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed regression as a fraction")
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    upstreams = process = None
+    log_file = tempfile.TemporaryFile(mode="w+")
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            upstreams = FakeUpstreams(
+                products=args.products, db_delay=args.db_delay,
+                edge_delay=args.edge_delay, sentry_delay=args.sentry_delay,
+            ).start()
+            port = free_port()
+            process = start_api(upstreams, port, log_file)
+            base_url = f"http://127.0.0.1:{port}"
+        try:
+            asyncio.run(wait_ready(base_url, process))
+        except RuntimeError:
+            log_file.seek(0)
+            sys.stderr.write(log_file.read()[-4000:])
+            raise
+        results = asyncio.run(run_all(base_url, args.scenarios, args.concurrency, args.requests, args.warmup))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if upstreams is not None:
+            upstreams.stop()
+        log_file.close()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "upstream_delays": None if args.url else {
+                "db": args.db_delay, "edge": args.edge_delay, "sentry": args.sentry_delay,
+            },
+        },
+        "scenarios": results,
+    }
+    print_table(results)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Import-time and cold-start benchmark for main.py.
+
+Run from api/:
+
+    python -m benchmarks.startup --runs 5 --save startup.json
+    python -m benchmarks.startup --compare startup.json
+
+Reports the `-X importtime` breakdown of `import main` (heaviest top-level
+imports by cumulative time), then starts uvicorn against FakeUpstreams
+`--runs` times and measures, from process spawn, when the server first
+answers and when the first /products response (which builds the Supabase
+client lazily) arrives. Medians are compared against a saved baseline.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+import aiohttp
+
+from benchmarks.fakes import FakeUpstreams
+from benchmarks.run import API_DIR, REPO_DIR, free_port, start_api
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, int, str]]:
+    """(self_us, cumulative_us, module) rows, with the module keeping its indent."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # column header
+        rows.append((int(self_us), int(cumulative_us), module.rstrip()))
+    return rows
+
+
+def import_breakdown(top: int = 15) -> Dict[str, Any]:
+    """Cumulative time of `import main` and of its heaviest direct imports."""
+    env = dict(os.environ, SENTRY_DSN="")
+    code = f"import sys; sys.path.insert(0, {API_DIR!r}); import main"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = parse_importtime(result.stderr)
+    total = next(cumulative for _, cumulative, module in rows if module.strip() == "main")
+    # After the separator space, direct imports of main are indented by two more
+    direct = [(cumulative, module.strip()) for _, cumulative, module in rows
+              if module.startswith("   ") and not module.startswith("    ")]
+    heaviest = sorted(direct, reverse=True)[:top]
+    return {
+        "import_main_ms": round(total / 1000, 1),
+        "heaviest": {module: round(cumulative / 1000, 1) for cumulative, module in heaviest},
+    }
+
+
+async def poll(session: aiohttp.ClientSession, url: str, timeout: float) -> float:
+    """Time at which `url` first answered 200, polling every few milliseconds."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as resp:
+                await resp.read()
+                if resp.status == 200:
+                    return time.perf_counter()
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.005)
+    raise RuntimeError(f"{url} did not answer within {timeout}s")
+
+
+async def cold_start(upstreams: FakeUpstreams, timeout: float = 30.0) -> Dict[str, float]:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryFile(mode="w+") as log_file:
+        spawned = time.perf_counter()
+        process = start_api(upstreams, port, log_file)
+        try:
+            async with aiohttp.ClientSession() as session:
+                ready = await poll(session, base_url + "/metrics", timeout)
+                first_products = await poll(session, base_url + "/products", timeout)
+        except RuntimeError:
+            log_file.seek(0)
+            sys.stderr.write(log_file.read()[-4000:])
+            raise
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+    return {
+        "ready_ms": round((ready - spawned) * 1000, 1),
+        "first_products_ms": round((first_products - spawned) * 1000, 1),
+        "first_products_latency_ms": round((first_products - ready) * 1000, 1),
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    regressions = []
+    pairs = [("import_main_ms", baseline["imports"], current["imports"])]
+    pairs += [(key, baseline["cold_start"], current["cold_start"]) for key in current["cold_start"]]
+    for key, base, now in pairs:
+        if key in base and base[key] > 0 and now[key] > base[key] * (1 + threshold):
+            regressions.append(f"{key}: {base[key]} -> {now[key]}")
+    return regressions
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to measure")
+    parser.add_argument("--top", type=int, default=15, help="heaviest imports to list")
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed regression as a fraction")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    imports = import_breakdown(args.top)
+    print(f"import main: {imports['import_main_ms']} ms")
+    for module, ms in imports["heaviest"].items():
+        print(f"  {module:<40}{ms:>10} ms")
+
+    upstreams = FakeUpstreams().start()
+    try:
+        runs = [asyncio.run(cold_start(upstreams)) for _ in range(args.runs)]
+    finally:
+        upstreams.stop()
+    cold = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    print(f"cold start (median of {args.runs}): ready {cold['ready_ms']} ms, "
+          f"first /products {cold['first_products_ms']} ms "
+          f"(+{cold['first_products_latency_ms']} ms after ready)")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+        },
+        "imports": imports,
+        "cold_start": cold,
+        "cold_start_runs": runs,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+In-process cache for the product catalog.
+
+Entries live for a configurable TTL. Once expired, the stale copy keeps being
+served while a single background task refreshes it, so concurrent requests
+never stampede the database and a slow Supabase response never reaches the
+client once the cache is warm.
+
+While the loader's circuit breaker is open, background refreshes are not
+started until it may let calls through again (CircuitOpenError.retry_after),
+and the outage is logged once rather than per request.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+from circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Seconds a loaded catalog is considered fresh
+DEFAULT_TTL = float(os.getenv("CATALOG_CACHE_TTL", "60"))
+
+# Cache states reported alongside the products
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+Products = List[Dict[str, Any]]
+
+
+def encode_catalog(products: Products) -> Tuple[bytes, str]:
+    """Serialize a catalog to JSON bytes plus a strong ETag for those bytes."""
+    body = orjson.dumps(products)
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return body, etag
+
+
+class CatalogCache:
+    """TTL + stale-while-revalidate cache with single-flight refreshes."""
+
+    def __init__(self, loader: Callable[[], Awaitable[Products]], ttl: float = DEFAULT_TTL):
+        self._loader = loader
+        self.ttl = ttl
+        self._products: Optional[Products] = None
+        self._loaded_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Incremented every time the cached catalog changes
+        self.generation = 0
+        self._encoded: Optional[Tuple[int, bytes, str]] = None
+        # Called when a refresh finds the catalog changed (e.g. to tell other workers),
+        # except for refreshes started by invalidate(notify=False)
+        self.on_change: Optional[Callable[[], None]] = None
+        # Bumped by invalidate(); a refresh that sees it change loads again, since its
+        # result may predate the change. _renotify: whether that reload calls on_change
+        self._invalidations = 0
+        self._renotify = False
+        # Background refreshes wait until then after the loader's circuit was found open
+        self._retry_at = 0.0
+        self._circuit_open = False
+
+    @property
+    def has_data(self) -> bool:
+        return self._products is not None
+
+    def _is_fresh(self) -> bool:
+        return time.monotonic() - self._loaded_at < self.ttl
+
+    async def get(self) -> Tuple[Products, str]:
+        """
+        Return the cached catalog and its state (fresh, stale or miss).
+        Raises the loader's exception only when there is no cached copy at all.
+        """
+        if self._products is None:
+            await asyncio.shield(self._ensure_refresh())
+            return self._products, MISS
+
+        if self._is_fresh():
+            return self._products, FRESH
+
+        self._refresh_in_background()
+        return self._products, STALE
+
+    def _refresh_in_background(self, notify: bool = True):
+        if time.monotonic() < self._retry_at:
+            return
+        self._ensure_refresh(notify)
+
+    def _ensure_refresh(self, notify: bool = True) -> asyncio.Task:
+        """Start a refresh unless one is already running on this event loop."""
+        task = self._refresh_task
+        loop = asyncio.get_running_loop()
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(self._refresh(notify))
+            self._refresh_task = task
+        return task
+
+    async def _refresh(self, notify: bool = True):
+        while True:
+            invalidations = self._invalidations
+            self._renotify = False
+            try:
+                products = await self._loader()
+            except CircuitOpenError as e:
+                self._retry_at = time.monotonic() + e.retry_after
+                if self._products is None:
+                    raise
+                if not self._circuit_open:
+                    self._circuit_open = True
+                    logger.warning("Catalog circuit open, serving stale copy", extra={
+                        "retry_after": e.retry_after,
+                        "generation": self.generation
+                    })
+                return
+            except Exception as e:
+                if self._products is None:
+                    raise
+                logger.warning("Catalog refresh failed, serving stale copy", extra={
+                    "error": str(e),
+                    "error_type": type(e).__name__,
+                    "generation": self.generation
+                })
+                return
+            self._circuit_open = False
+            changed = self._products is not None and products != self._products
+            self.set(products)
+            if changed and notify and self.on_change is not None:
+                self.on_change()
+            if self._invalidations == invalidations:
+                return
+            # Invalidated while loading: served, but kept stale until a load that started after it
+            self._loaded_at = 0.0
+            notify = self._renotify
+
+    def encoded(self) -> Tuple[bytes, str]:
+        """JSON body and ETag of the current catalog, serialized once per generation."""
+        if self._encoded is None or self._encoded[0] != self.generation:
+            self._encoded = (self.generation, *encode_catalog(self._products))
+        return self._encoded[1], self._encoded[2]
+
+    def set(self, products: Products):
+        """Replace the cached catalog and start a new generation."""
+        self._products = products
+        self._loaded_at = time.monotonic()
+        self.generation += 1
+
+    def invalidate(self, notify: bool = True):
+        """
+        Expire the cached catalog. The stale copy is still served until the
+        refresh triggered here (or by the next request) completes.
+
+        Pass notify=False when the invalidation came from another worker, so
+        the refresh it triggers does not call on_change and echo it back.
+        """
+        self._loaded_at = 0.0
+        self._invalidations += 1
+        self._renotify = self._renotify or notify
+        if self._products is None:
+            return
+        try:
+            self._refresh_in_background(notify)
+        except RuntimeError:
+            # No running event loop; the next request refreshes instead
+            pass
+
+    def clear(self):
+        """Drop the cached catalog entirely."""
+        self._products = None
+        self._loaded_at = 0.0
+        self._refresh_task = None
+        self._encoded = None
@@ -0,0 +1,203 @@
+"""
+Push updates for the product catalog.
+
+With CATALOG_REALTIME enabled, each worker subscribes to Supabase Realtime
+Postgres changes on `products` and applies every INSERT/UPDATE/DELETE to an
+in-memory index keyed by product id; /products then serves from memory and
+reflects a price change as soon as the event arrives, without re-querying
+the table. The TTL is only a safety net while subscribed
+(CATALOG_REALTIME_TTL); after a reconnect the catalog is reloaded once to
+cover events missed while disconnected.
+
+The table must be part of the Realtime publication:
+
+    alter publication supabase_realtime add table public.products;
+
+Only the primary key is sent for deletes unless the table has
+`replica identity full`, which is all the index needs.
+
+A full load races with the feed: a change applied while the snapshot query
+is running would be overwritten by the older snapshot. Changes that arrive
+between begin_load() and load() are therefore kept and replayed over the
+snapshot; events carry whole rows, so replaying one the snapshot already
+reflects is a no-op.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENABLED = os.getenv("CATALOG_REALTIME", "false").lower() in ("1", "true", "yes")
+DEFAULT_REALTIME_TTL = float(os.getenv("CATALOG_REALTIME_TTL", "300"))
+
+INSERT = "INSERT"
+UPDATE = "UPDATE"
+DELETE = "DELETE"
+
+Row = Dict[str, Any]
+Product = Dict[str, Any]
+Change = Tuple[str, Optional[Row], Optional[Row]]
+
+
+class ProductIndex:
+    """Catalog keyed by product id, kept current by change events."""
+
+    def __init__(self, project: Callable[[Row], Product]):
+        self._project = project
+        self._items: Dict[str, Product] = {}
+        self.loaded = False
+        # Changes seen so far, and those kept (with their sequence) while loads are in flight
+        self._sequence = 0
+        self._loads = 0
+        self._recent: List[Tuple[int, Change]] = []
+
+    def begin_load(self) -> int:
+        """Call before querying a snapshot; pass the result to load() or cancel_load()."""
+        self._loads += 1
+        return self._sequence
+
+    def cancel_load(self):
+        self._end_load()
+
+    def load(self, products: List[Product], since: Optional[int] = None):
+        """Replace the index with a full catalog, replaying changes that arrived since begin_load()."""
+        self._items = {product["id"]: product for product in products}
+        self.loaded = True
+        if since is not None:
+            for sequence, change in self._recent:
+                if sequence > since:
+                    self._apply(*change)
+            self._end_load()
+
+    def _end_load(self):
+        self._loads -= 1
+        if not self._loads:
+            self._recent.clear()
+
+    def apply(self, change_type: str, record: Optional[Row], old_record: Optional[Row]) -> bool:
+        """Apply one row change; returns True when the catalog changed."""
+        self._sequence += 1
+        if self._loads:
+            self._recent.append((self._sequence, (change_type, record, old_record)))
+        if not self.loaded:
+            # Nothing to patch yet; the load in flight replays it
+            return False
+        return self._apply(change_type, record, old_record)
+
+    def _apply(self, change_type: str, record: Optional[Row], old_record: Optional[Row]) -> bool:
+        if change_type == DELETE:
+            return self._items.pop(str((old_record or {}).get("id")), None) is not None
+        if change_type not in (INSERT, UPDATE) or not record:
+            return False
+        old_id = str((old_record or {}).get("id", record["id"]))
+        new_id = str(record["id"])
+        product = self._project(record)
+        if old_id != new_id:
+            self._items.pop(old_id, None)
+        elif self._items.get(new_id) == product:
+            return False
+        self._items[new_id] = product
+        return True
+
+    def products(self) -> List[Product]:
+        return list(self._items.values())
+
+    def price_of(self, product_id: str) -> Optional[float]:
+        """Current catalog price, or None for an unknown product."""
+        product = self._items.get(product_id)
+        return product["price"] if product else None
+
+
+class CatalogChangeFeed:
+    """
+    Supabase Realtime subscription to `products`, reconnecting with backoff.
+
+    `on_change(type, record, old_record)` is called for each row change,
+    `on_subscribed()` whenever the subscription is (re)established and
+    `on_unsubscribed()` when it is lost.
+    """
+
+    def __init__(
+        self,
+        on_change: Callable[[str, Optional[Row], Optional[Row]], None],
+        on_subscribed: Callable[[], None],
+        on_unsubscribed: Callable[[], None],
+        table: str = "products",
+        subscribe_timeout: float = 10.0,
+        max_backoff: float = 30.0,
+    ):
+        self._on_change = on_change
+        self._on_subscribed = on_subscribed
+        self._on_unsubscribed = on_unsubscribed
+        self.table = table
+        self.subscribe_timeout = subscribe_timeout
+        self.max_backoff = max_backoff
+        self._task: Optional[asyncio.Task] = None
+        self.subscribed = False
+
+    def handle(self, payload: Dict[str, Any]):
+        """Realtime postgres_changes callback."""
+        data = payload.get("data", {})
+        try:
+            self._on_change(data.get("type"), data.get("record"), data.get("old_record"))
+        except Exception:
+            logger.exception("Failed to apply catalog change", extra={"change_type": data.get("type")})
+
+    def start(self, supabase_url: str, supabase_key: str):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(supabase_url, supabase_key))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, supabase_url: str, supabase_key: str):
+        backoff = 1.0
+        while True:
+            try:
+                await self._session(supabase_url, supabase_key)
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Catalog realtime subscription failed", extra={
+                    "error": str(e),
+                    "error_type": type(e).__name__,
+                    "retry_in": backoff
+                })
+            finally:
+                if self.subscribed:
+                    self.subscribed = False
+                    self._on_unsubscribed()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _session(self, supabase_url: str, supabase_key: str):
+        """One connection: subscribe, then wait until the socket or channel goes away."""
+        from realtime import AsyncRealtimeClient, RealtimeSubscribeStates
+
+        client = AsyncRealtimeClient(f"{supabase_url}/realtime/v1", supabase_key, auto_reconnect=False)
+        states: "asyncio.Queue[RealtimeSubscribeStates]" = asyncio.Queue()
+        try:
+            channel = client.channel(f"catalog-{self.table}")
+            channel.on_postgres_changes("*", schema="public", table=self.table, callback=self.handle)
+            await channel.subscribe(lambda state, error: states.put_nowait(state))
+            state = await asyncio.wait_for(states.get(), self.subscribe_timeout)
+            if state != RealtimeSubscribeStates.SUBSCRIBED:
+                raise ConnectionError(f"Realtime subscription {state.value}")
+
+            self.subscribed = True
+            logger.info("📡 Subscribed to catalog changes", extra={"table": self.table})
+            self._on_subscribed()
+
+            # The client has no disconnect callback; its listener task ends with the socket
+            closed = asyncio.ensure_future(states.get())
+            await asyncio.wait([client._listen_task, closed], return_when=asyncio.FIRST_COMPLETED)
+            closed.cancel()
+        finally:
+            await client.close()
@@ -0,0 +1,109 @@
+"""
+Paginated, projected and filtered catalog queries.
+
+A CatalogQuery is built from the /products query string and either pushed
+down into PostgREST (see ProductRepository.list_page) or applied in memory
+to the fallback catalog. Pagination is keyset based: the cursor is the id of
+the last product on the previous page.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# API field -> products table column
+CATALOG_COLUMNS = {
+    "id": "id",
+    "name": "name",
+    "price": "price",
+    "image": "image_path",
+    # srcset strings of the image variants per format (see image_variants.py)
+    "images": "image_path",
+    "description": "description",
+}
+DEFAULT_FIELDS = tuple(CATALOG_COLUMNS)
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """Parse a `fields=` projection, raising ValueError on unknown fields."""
+    if not fields:
+        return DEFAULT_FIELDS
+    requested = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in CATALOG_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return requested or DEFAULT_FIELDS
+
+
+def parse_cursor(cursor: Optional[str], uuid: bool = True) -> Optional[str]:
+    """
+    Parse a `cursor=`, raising ValueError unless it can be a product id.
+    Ids in the products table are UUIDs; anything else would make PostgREST
+    fail the query (22P02) instead of returning an empty page.
+    """
+    if cursor is None or not uuid:
+        return cursor
+    try:
+        return str(UUID(cursor))
+    except ValueError:
+        raise ValueError("Invalid cursor") from None
+
+
+def escape_like(value: str) -> str:
+    """
+    Escape LIKE wildcards so a name filter matches literally. PostgREST turns
+    every `*` in an ilike pattern into `%` before any escaping applies, so a
+    literal `*` cannot be expressed; it becomes `_`, matching that one
+    character instead of any run of them.
+    """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("*", "_")
+
+
+@dataclass(frozen=True)
+class CatalogQuery:
+    fields: Tuple[str, ...] = DEFAULT_FIELDS
+    limit: int = DEFAULT_PAGE_SIZE
+    cursor: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    name: Optional[str] = None
+
+    def columns(self) -> List[str]:
+        """PostgREST select list; id is always included for the cursor."""
+        columns = list(dict.fromkeys(CATALOG_COLUMNS[f] for f in self.fields))
+        if "id" not in columns:
+            columns.insert(0, "id")
+        return columns
+
+    def matches(self, product: Dict[str, Any]) -> bool:
+        """In-memory equivalent of the pushed-down filters."""
+        if self.cursor is not None and not str(product["id"]) > self.cursor:
+            return False
+        if self.min_price is not None and product["price"] < self.min_price:
+            return False
+        if self.max_price is not None and product["price"] > self.max_price:
+            return False
+        if self.name and self.name.lower() not in product["name"].lower():
+            return False
+        return True
+
+    def apply(self, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Filter, order and limit an in-memory catalog (limit + 1 rows)."""
+        selected = sorted((p for p in products if self.matches(p)), key=lambda p: str(p["id"]))
+        return selected[: self.limit + 1]
+
+
+def page(items: List[Dict[str, Any]], query: CatalogQuery, ids: List[str]) -> Dict[str, Any]:
+    """
+    Build the paginated response body from up to limit + 1 projected items.
+    `ids` holds the id of each item so the cursor works without the id field.
+    """
+    has_more = len(items) > query.limit
+    items = items[: query.limit]
+    return {
+        "items": items,
+        "next_cursor": ids[len(items) - 1] if has_more and items else None,
+    }
@@ -0,0 +1,144 @@
+"""
+Circuit breakers for calls to Supabase.
+
+Each dependency (PostgREST queries, the create-order Edge Function) gets its
+own breaker with a hard deadline per call. When too many recent calls fail
+or are slow the breaker opens and callers fail fast, serving cached or
+fallback data instead of queueing behind a struggling upstream. After a
+cool-down a limited number of probe calls are let through (half-open); a
+successful probe closes the breaker again.
+
+Settings are read from the environment using the dependency prefix, e.g.
+SUPABASE_DB_DEADLINE or EDGE_FUNCTION_ERROR_RATE.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Optional, Tuple, TypeVar
+
+from env_settings import settings_from_env
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class BreakerSettings:
+    deadline: float = 5.0  # seconds before a call is abandoned
+    window: int = 20  # recent calls considered
+    min_calls: int = 5  # calls needed in the window before tripping
+    error_rate: float = 0.5  # fraction of failed calls that opens the breaker
+    slow_call_duration: float = 2.0  # seconds after which a call counts as slow
+    slow_call_rate: float = 0.8  # fraction of slow calls that opens the breaker
+    open_duration: float = 30.0  # seconds to fail fast before probing
+    half_open_probes: int = 1  # concurrent probe calls while half-open
+
+    @classmethod
+    def from_env(cls, prefix: str, **defaults) -> "BreakerSettings":
+        return settings_from_env(cls, prefix, **defaults)
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker with error-rate and latency thresholds."""
+
+    def __init__(
+        self,
+        name: str,
+        settings: BreakerSettings = BreakerSettings(),
+        is_failure: Callable[[BaseException], bool] = lambda e: True,
+    ):
+        self.name = name
+        self.settings = settings
+        self._is_failure = is_failure
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=settings.window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._remaining_open() <= 0:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def _remaining_open(self) -> float:
+        return self._opened_at + self.settings.open_duration - time.monotonic()
+
+    async def call(self, fn: Callable[[], Awaitable[T]], deadline: Optional[float] = None) -> T:
+        """Run `fn` under the breaker, bounded by the dependency deadline."""
+        state = self.state
+        if state == OPEN:
+            raise CircuitOpenError(self.name, self._remaining_open())
+        if state == HALF_OPEN:
+            if self._probes >= self.settings.half_open_probes:
+                raise CircuitOpenError(self.name, self.settings.open_duration)
+            self._probes += 1
+
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(fn(), deadline or self.settings.deadline)
+        except asyncio.CancelledError:
+            if state == HALF_OPEN:
+                self._probes -= 1
+            raise
+        except Exception as e:
+            self._record(failed=self._is_failure(e), slow=False, probe=state == HALF_OPEN)
+            raise
+        self._record(
+            failed=False,
+            slow=time.monotonic() - started > self.settings.slow_call_duration,
+            probe=state == HALF_OPEN,
+        )
+        return result
+
+    def _record(self, failed: bool, slow: bool, probe: bool):
+        if probe:
+            self._probes -= 1
+            if failed or slow:
+                self._trip()
+            else:
+                self.reset()
+            return
+
+        self._outcomes.append((failed, slow))
+        if self._state != CLOSED or len(self._outcomes) < self.settings.min_calls:
+            return
+        calls = len(self._outcomes)
+        failures = sum(1 for f, _ in self._outcomes if f)
+        slow_calls = sum(1 for _, s in self._outcomes if s)
+        if failures / calls >= self.settings.error_rate or slow_calls / calls >= self.settings.slow_call_rate:
+            self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        logger.warning("Circuit breaker opened", extra={
+            "dependency": self.name,
+            "open_seconds": self.settings.open_duration
+        })
+
+    def reset(self):
+        if self._state != CLOSED:
+            logger.info("Circuit breaker closed", extra={"dependency": self.name})
+        self._state = CLOSED
+        self._outcomes.clear()
+        self._probes = 0
@@ -0,0 +1,33 @@
+"""
+Settings dataclasses read from the environment.
+
+Each field of a frozen settings dataclass maps to `<PREFIX>_<FIELD>`, e.g.
+SUPABASE_DB_DEADLINE or EDGE_FUNCTION_POOL_LIMIT. Unset or empty variables
+keep the default passed by the caller, then the class default.
+"""
+
+import os
+from dataclasses import fields
+from typing import Any, Type, TypeVar
+
+T = TypeVar("T")
+
+
+def parse_value(raw: str, default: Any) -> Any:
+    """Parse raw as the type of default; floats when the default is None"""
+    if default is None or isinstance(default, float):
+        return float(raw)
+    if isinstance(default, int):
+        # "100" and "100.0" both work for counts
+        return int(float(raw))
+    return type(default)(raw)
+
+
+def settings_from_env(cls: Type[T], prefix: str, **defaults) -> T:
+    base = cls(**defaults)
+    values = {}
+    for field in fields(cls):
+        default = getattr(base, field.name)
+        raw = os.getenv(f"{prefix}_{field.name.upper()}")
+        values[field.name] = parse_value(raw, default) if raw else default
+    return cls(**values)
@@ -0,0 +1,81 @@
+"""
+Application-scoped aiohttp sessions, one per upstream.
+
+Creating a ClientSession per request means a new connector, TCP connection
+and TLS handshake for every call to the same host. Sessions here are opened
+once (at startup, or lazily on first use) and keep a pool of warm
+connections until shutdown.
+
+Each upstream is tuned from the environment using its prefix, e.g.
+EDGE_FUNCTION_POOL_LIMIT or SENTRY_TUNNEL_READ_TIMEOUT.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+
+from env_settings import settings_from_env
+
+
+@dataclass(frozen=True)
+class UpstreamSettings:
+    pool_limit: int = 100  # total connections kept by the connector
+    pool_limit_per_host: int = 50
+    keepalive_timeout: float = 30.0  # seconds an idle connection stays open
+    dns_cache_ttl: int = 300
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    total_timeout: Optional[float] = None
+
+    @classmethod
+    def from_env(cls, prefix: str, **defaults) -> "UpstreamSettings":
+        return settings_from_env(cls, prefix, **defaults)
+
+
+class SessionPool:
+    """Named, long-lived aiohttp sessions with per-upstream connection pools."""
+
+    def __init__(self):
+        self._settings: Dict[str, UpstreamSettings] = {}
+        self._sessions: Dict[str, Tuple[aiohttp.ClientSession, asyncio.AbstractEventLoop]] = {}
+
+    def register(self, name: str, settings: UpstreamSettings):
+        self._settings[name] = settings
+
+    def _create(self, settings: UpstreamSettings) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=settings.pool_limit,
+            limit_per_host=settings.pool_limit_per_host,
+            keepalive_timeout=settings.keepalive_timeout,
+            ttl_dns_cache=settings.dns_cache_ttl,
+            use_dns_cache=True,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=settings.total_timeout,
+            connect=settings.connect_timeout,
+            sock_read=settings.read_timeout,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    def get(self, name: str) -> aiohttp.ClientSession:
+        """Return the session for an upstream, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        entry = self._sessions.get(name)
+        if entry is None or entry[0].closed or entry[1] is not loop:
+            session = self._create(self._settings[name])
+            self._sessions[name] = (session, loop)
+            return session
+        return entry[0]
+
+    async def open(self):
+        """Create every registered session up front."""
+        for name in self._settings:
+            self.get(name)
+
+    async def close(self):
+        sessions, self._sessions = self._sessions, {}
+        for session, loop in sessions.values():
+            if loop is asyncio.get_running_loop():
+                await session.close()
@@ -0,0 +1,275 @@
+"""
+Idempotency keys for order creation.
+
+A client retrying POST /orders with the same Idempotency-Key gets the stored
+result of the first successful attempt instead of a second Edge Function
+call. Concurrent duplicates wait on the single in-flight call. Results live
+in a pluggable store: bounded in-memory LRU/TTL by default, or a Supabase
+table shared by every worker (IDEMPOTENCY_STORE=supabase). The shared store
+also claims a key atomically before the call runs, so a duplicate arriving at
+another worker meanwhile gets IdempotencyInProgress instead of a second order.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+DEFAULT_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+# Seconds a claim on a key lasts if its worker dies before storing a result
+DEFAULT_CLAIM_TTL = float(os.getenv("IDEMPOTENCY_CLAIM_TTL", "60"))
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request body."""
+
+
+class IdempotencyInProgress(Exception):
+    """Another worker is running the call for this key."""
+
+
+class LeaderCancelled(Exception):
+    """Set on a shared call whose leading request was cancelled; its waiters try again."""
+
+
+@dataclass(frozen=True)
+class StoredResult:
+    fingerprint: str
+    body: Any
+
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a request payload."""
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class IdempotencyStore(ABC):
+    """Backend interface for stored results."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[StoredResult]:
+        """The unexpired result stored for key, if any."""
+
+    @abstractmethod
+    async def set(self, key: str, result: StoredResult):
+        """Store the result of a successful call."""
+
+    async def claim(self, key: str, request_fingerprint: str) -> bool:
+        """
+        Reserve key before its call runs; False if another worker holds it.
+        Stores used by a single process need not: Idempotency coalesces
+        duplicates within the process.
+        """
+        return True
+
+    async def release(self, key: str):
+        """Drop a claim whose call failed, so the request can be retried."""
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """Per-process LRU bounded by entry count, with a TTL per entry."""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_keys: int = DEFAULT_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[str, Tuple[float, StoredResult]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[StoredResult]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    async def set(self, key: str, result: StoredResult):
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+
+class SupabaseIdempotencyStore(IdempotencyStore):
+    """
+    Results shared across workers in an `idempotency_keys` table:
+    key text primary key, fingerprint text, body jsonb (null while the call
+    is running), expires_at timestamptz.
+    """
+
+    TABLE = "idempotency_keys"
+
+    def __init__(self, client, ttl: float = DEFAULT_TTL, claim_ttl: float = DEFAULT_CLAIM_TTL):
+        self._client = client
+        self.ttl = ttl
+        self.claim_ttl = claim_ttl
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="idempotency")
+
+    async def _run(self, fn, *args):
+        # Run in the caller's context so query spans attach to the request's transaction
+        call = contextvars.copy_context().run
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call, fn, *args)
+
+    def _select(self, key: str):
+        now = datetime.now(timezone.utc).isoformat()
+        return (
+            self._client.table(self.TABLE)
+            .select("fingerprint,body")
+            .eq("key", key)
+            .gt("expires_at", now)
+            .limit(1)
+            .execute()
+            .data
+        )
+
+    def _upsert(self, key: str, result: StoredResult):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        self._client.table(self.TABLE).upsert({
+            "key": key,
+            "fingerprint": result.fingerprint,
+            "body": result.body,
+            "expires_at": expires_at.isoformat(),
+        }).execute()
+
+    def _claim(self, key: str, request_fingerprint: str) -> bool:
+        now = datetime.now(timezone.utc)
+        table = self._client.table(self.TABLE)
+        # A lapsed claim or result would otherwise block the insert below
+        table.delete().eq("key", key).lt("expires_at", now.isoformat()).execute()
+        # insert ... on conflict do nothing: a row comes back only if this worker won
+        inserted = table.upsert({
+            "key": key,
+            "fingerprint": request_fingerprint,
+            "body": None,
+            "expires_at": (now + timedelta(seconds=self.claim_ttl)).isoformat(),
+        }, on_conflict="key", ignore_duplicates=True).execute().data
+        return bool(inserted)
+
+    def _release(self, key: str):
+        self._client.table(self.TABLE).delete().eq("key", key).is_("body", "null").execute()
+
+    async def get(self, key: str) -> Optional[StoredResult]:
+        rows = await self._run(self._select, key)
+        if not rows or rows[0]["body"] is None:
+            # Missing, or claimed by a call still running
+            return None
+        return StoredResult(rows[0]["fingerprint"], rows[0]["body"])
+
+    async def set(self, key: str, result: StoredResult):
+        await self._run(self._upsert, key, result)
+
+    async def claim(self, key: str, request_fingerprint: str) -> bool:
+        return await self._run(self._claim, key, request_fingerprint)
+
+    async def release(self, key: str):
+        await self._run(self._release, key)
+
+
+class Idempotency:
+    """Replays stored results and coalesces concurrent duplicates."""
+
+    def __init__(self, store: IdempotencyStore):
+        self.store = store
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+
+    async def run(
+        self, key: str, request_fingerprint: str, call: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """
+        Return `(result, replayed)`. `call` only runs when neither a stored
+        result nor an in-flight call exists for `key`; only successful
+        results are stored, so failed attempts can be retried. Raises
+        IdempotencyInProgress when another worker holds the key.
+        """
+        waited = await self._join(key, request_fingerprint)
+        if waited is not None:
+            return waited[0], True
+
+        stored = await self.store.get(key)
+        if stored is not None:
+            if stored.fingerprint != request_fingerprint:
+                raise IdempotencyConflict(key)
+            return stored.body, True
+
+        # Another request may have started the call while the store was queried
+        waited = await self._join(key, request_fingerprint)
+        if waited is not None:
+            return waited[0], True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (request_fingerprint, future)
+        claimed = False
+        try:
+            claimed = await self.store.claim(key, request_fingerprint)
+            if not claimed:
+                raise IdempotencyInProgress(key)
+            result = await call()
+        except BaseException as e:
+            del self._in_flight[key]
+            # Waiters of a cancelled call were not cancelled themselves: they try again instead
+            future.set_exception(LeaderCancelled(key) if isinstance(e, asyncio.CancelledError) else e)
+            # Waiters re-raise it; mark retrieved so an unshared failure is not logged
+            future.exception()
+            if claimed:
+                await self._release(key)
+            raise
+
+        future.set_result(result)
+        try:
+            await self.store.set(key, StoredResult(request_fingerprint, result))
+        except Exception as e:
+            logger.warning("Failed to store idempotent result", extra={
+                "error": str(e),
+                "error_type": type(e).__name__
+            })
+        finally:
+            # Kept in flight until stored so late duplicates never miss both
+            del self._in_flight[key]
+        return result, False
+
+    async def _release(self, key: str):
+        try:
+            await self.store.release(key)
+        except Exception as e:
+            # The claim lapses after its TTL instead
+            logger.warning("Failed to release idempotency claim", extra={
+                "error": str(e),
+                "error_type": type(e).__name__
+            })
+
+    async def _join(self, key: str, request_fingerprint: str) -> Optional[Tuple[Any]]:
+        """Wait for an in-flight call with the same key, if there is one."""
+        while True:
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                return None
+            if in_flight[0] != request_fingerprint:
+                raise IdempotencyConflict(key)
+            try:
+                return (await asyncio.shield(in_flight[1]),)
+            except LeaderCancelled:
+                # Join whoever took over, or return None to lead the call
+                continue
+
+
+def store_from_env(supabase_client=None) -> IdempotencyStore:
+    """IDEMPOTENCY_STORE=memory (default) or supabase."""
+    backend = os.getenv("IDEMPOTENCY_STORE", "memory")
+    if backend == "supabase" and supabase_client is not None:
+        return SupabaseIdempotencyStore(supabase_client)
+    return InMemoryIdempotencyStore()
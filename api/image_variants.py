@@ -0,0 +1,97 @@
+"""
+Responsive variants of the product images.
+
+setup_storage.py renders every product image to AVIF and WebP at a few
+widths and uploads them next to the original under `<dir>/variants/`. With
+IMAGE_VARIANTS enabled, /products returns an `images` map of srcset strings
+per format, so browsers fetch the smallest suitable file instead of the
+full-size original on every card.
+
+Variant paths are derived from the original's path alone, so the API builds
+the map without knowing what is in the bucket. It only lists the formats in
+IMAGE_VARIANT_FORMATS (WebP by default): browsers that pick a <source> do not
+fall back to the <img> when it 404s, so add AVIF once setup_storage.py reports
+its variants uploaded. They are uploaded with a one-year Cache-Control: give a
+replaced image a new file name, or clients keep the cached variants.
+
+Rendering needs Pillow (with AVIF support, Pillow 11.2+); the API only
+builds URLs and does not import it.
+"""
+
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+
+DEFAULT_ENABLED = os.getenv("IMAGE_VARIANTS", "false").lower() in ("1", "true", "yes")
+
+VARIANT_WIDTHS = (320, 640, 960)
+# Listed in order of preference; browsers take the first <source> type they support
+VARIANT_FORMATS = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+}
+# Formats /products advertises, among VARIANT_FORMATS
+DEFAULT_FORMATS = tuple(
+    fmt for fmt in VARIANT_FORMATS
+    if fmt in {f.strip().lower() for f in os.getenv("IMAGE_VARIANT_FORMATS", "webp").split(",")}
+)
+VARIANT_DIR = "variants"
+# Seconds, as Supabase Storage expects; variants are never rewritten under the same name
+VARIANT_CACHE_CONTROL = "31536000"
+
+# Encoder settings that keep product photos visually lossless at a fraction of the size
+ENCODER_OPTIONS = {
+    "avif": {"quality": 55, "speed": 6},
+    "webp": {"quality": 80, "method": 6},
+}
+
+
+def variant_path(image_path: str, width: int, fmt: str) -> str:
+    """`products/pineapple.jpg` -> `products/variants/pineapple-320w.webp`"""
+    directory, _, name = image_path.rpartition("/")
+    stem = name.rsplit(".", 1)[0]
+    prefix = f"{directory}/" if directory else ""
+    return f"{prefix}{VARIANT_DIR}/{stem}-{width}w.{fmt}"
+
+
+def variant_paths(image_path: str) -> List[str]:
+    return [variant_path(image_path, width, fmt) for fmt in VARIANT_FORMATS for width in VARIANT_WIDTHS]
+
+
+def srcsets(
+    image_path: str, url_for: Callable[[str], str], formats: Iterable[str] = tuple(VARIANT_FORMATS)
+) -> Dict[str, str]:
+    """`{"avif": "<url> 320w, <url> 640w, ...", "webp": ...}` for one image"""
+    return {
+        fmt: ", ".join(f"{url_for(variant_path(image_path, width, fmt))} {width}w" for width in VARIANT_WIDTHS)
+        for fmt in formats
+    }
+
+
+def render_variants(source: str, remote_path: str, out_dir: str) -> List[Tuple[str, str]]:
+    """
+    Render every variant of one image into out_dir and return
+    (remote path, local file) pairs. Runs in a worker process.
+
+    Images narrower than a variant width are not upscaled, so the widest
+    variants of a small image are the image at its own size.
+    """
+    from PIL import Image, ImageOps
+
+    rendered = []
+    with Image.open(source) as original:
+        # Apply EXIF rotation, and drop palette/CMYK modes the encoders handle poorly
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+        for width in VARIANT_WIDTHS:
+            if image.width > width:
+                resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            else:
+                resized = image
+            for fmt in VARIANT_FORMATS:
+                remote = variant_path(remote_path, width, fmt)
+                local = Path(out_dir) / remote
+                local.parent.mkdir(parents=True, exist_ok=True)
+                resized.save(local, fmt.upper(), **ENCODER_OPTIONS[fmt])
+                rendered.append((remote, str(local)))
+    return rendered
@@ -0,0 +1,115 @@
+"""
+Cache invalidation shared between worker processes.
+
+Each uvicorn worker keeps its own catalog cache. When one worker learns that
+the catalog changed, it publishes a topic on the channel and every other
+worker invalidates its copy instead of serving old data until its TTL runs
+out.
+
+The local channel uses Unix datagram sockets in a shared directory
+(CACHE_INVALIDATION_DIR, set by server.py for multi-worker runs): every
+process binds `<dir>/<pid>.sock`, and publishing sends the topic to every
+other socket there. Without a directory the channel is a no-op, which is
+right for a single process.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_DIR_ENV = "CACHE_INVALIDATION_DIR"
+
+CATALOG_TOPIC = "catalog"
+
+SOCKET_SUFFIX = ".sock"
+
+
+class InvalidationChannel:
+    """No-op channel for a single process."""
+
+    async def start(self, callback: Callable[[str], None]):
+        pass
+
+    def publish(self, topic: str):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class _Receiver(asyncio.DatagramProtocol):
+    def __init__(self, callback: Callable[[str], None]):
+        self._callback = callback
+
+    def datagram_received(self, data: bytes, addr):
+        topic = data.decode("utf-8", "replace")
+        try:
+            self._callback(topic)
+        except Exception:
+            logger.exception("Cache invalidation callback failed", extra={"topic": topic})
+
+
+class UnixSocketChannel(InvalidationChannel):
+    """Broadcast over Unix datagram sockets in a directory shared by the workers."""
+
+    def __init__(self, directory: str, name: Optional[str] = None):
+        self.directory = directory
+        self.name = name or str(os.getpid())
+        self.path = os.path.join(directory, self.name + SOCKET_SUFFIX)
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._sender: Optional[socket.socket] = None
+
+    async def start(self, callback: Callable[[str], None]):
+        if self._transport is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _Receiver(callback), local_addr=self.path, family=socket.AF_UNIX
+        )
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+
+    def publish(self, topic: str):
+        """Send `topic` to every other process; never blocks."""
+        if self._sender is None:
+            return
+        data = topic.encode()
+        for entry in os.listdir(self.directory):
+            if not entry.endswith(SOCKET_SUFFIX) or entry == self.name + SOCKET_SUFFIX:
+                continue
+            peer = os.path.join(self.directory, entry)
+            try:
+                self._sender.sendto(data, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker exited without cleaning up; forget it
+                try:
+                    os.unlink(peer)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                # Peer's buffer is full: it already has invalidations pending
+                pass
+
+    async def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._sender is not None:
+            self._sender.close()
+            self._sender = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def channel_from_env() -> InvalidationChannel:
+    directory = os.getenv(INVALIDATION_DIR_ENV)
+    return UnixSocketChannel(directory) if directory else InvalidationChannel()
@@ -1,23 +1,69 @@
+import asyncio
 import logging
+import math
 import os
-from typing import List
+import threading
+import time
+from pathlib import Path
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from pydantic import BaseModel
-from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi import FastAPI, Request, Response, HTTPException, Query
 from fastapi.responses import JSONResponse, RedirectResponse
 import sentry_sdk
 from sentry_sdk.integrations.fastapi import FastApiIntegration
 from sentry_sdk.integrations.starlette import StarletteIntegration
-from sentry_sdk.integrations.logging import LoggingIntegration
+from sentry_sdk.integrations.logging import LoggingIntegration, ignore_logger
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from urllib.parse import urlparse
 import aiohttp
 import json
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from product_repository import ProductRepository, is_client_error
+from catalog_cache import DEFAULT_TTL as CATALOG_CACHE_TTL, CatalogCache, encode_catalog
+from catalog_changes import (
+    DEFAULT_ENABLED as CATALOG_REALTIME, DEFAULT_REALTIME_TTL as CATALOG_REALTIME_TTL,
+    CatalogChangeFeed, ProductIndex,
+)
+from catalog_query import (
+    CatalogQuery, DEFAULT_FIELDS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, page, parse_cursor, parse_fields,
+)
+import orjson
+from storage_urls import product_image_urls
+from image_variants import DEFAULT_ENABLED as IMAGE_VARIANTS, DEFAULT_FORMATS as IMAGE_VARIANT_FORMATS, srcsets
+from http_sessions import SessionPool, UpstreamSettings
+from tunnel_forwarder import (
+    DEFAULT_MAX_ENVELOPE_BYTES, DEFAULT_MAX_QUEUED_BYTES, EnvelopeForwarder, EnvelopeReader, EnvelopeTooLarge,
+    InvalidEnvelope,
+)
+from idempotency import (
+    Idempotency, IdempotencyConflict, IdempotencyInProgress, SupabaseIdempotencyStore, fingerprint, store_from_env
+)
+from circuit_breaker import BreakerSettings, CircuitBreaker, CircuitOpenError
+from request_logging import ACCESS_LOGGER_NAME, AccessLog, configure_logging
+from trace_sampling import DEFAULT_PROFILES_SAMPLE_RATE, TraceSampler
+from static_assets import StaticAssets
+from rate_limit import AdmissionGate, RateLimiter, RateLimitSettings, SupabaseRateLimitBackend, backend_from_env
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, timed
+from invalidation import CATALOG_TOPIC, channel_from_env
+from order_pricing import OrderRejected, PriceLookup, price_items
+from supabase_tracing import ROW_BUCKETS, InstrumentedClient, SupabaseTracer
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+# Importing this module has no side effects: Sentry and logging are set up in the
+# lifespan below, and the Supabase client (a heavy import) is built on first use.
+
+_env_loaded = False
 
-# Load environment variables
-load_dotenv()
+def load_env():
+    """Load .env once; real environment variables take precedence"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
 
 # Function to filter out certain transactions
 def filter_transactions(event, hint):
@@ -34,69 +80,288 @@ def filter_transactions(event, hint):
 
     return event
 
-# Initialize Sentry with integrations and logging
-sentry_sdk.init(
-    dsn="https://b8233ed9639fc2fa0e0e5b1727ea893a@o673219.ingest.us.sentry.io/4508087188455424",
-    enable_logs=True,  # Enable Sentry structured logs
-    integrations=[
-        FastApiIntegration(),
-        StarletteIntegration(),
-        LoggingIntegration(
-            level=logging.INFO,  # Capture info and above as breadcrumbs
-            event_level=logging.ERROR  # Send errors as events
-        ),
-    ],
-    traces_sample_rate=1.0,
-    profiles_sample_rate=1.0,
-    before_send_transaction=filter_transactions,
-)
+# Per-route, up-front trace sampling (see trace_sampling.py for the environment knobs)
+trace_sampler = TraceSampler()
+
+def init_observability():
+    """Configure logging and initialize Sentry; called from the app lifespan"""
+    load_env()
+
+    # Records are formatted and written by a background queue listener
+    configure_logging(logging.INFO)
+
+    # Initialize Sentry with integrations and logging
+    sentry_sdk.init(
+        # An empty SENTRY_DSN disables reporting (e.g. for local benchmarks)
+        dsn=os.getenv("SENTRY_DSN", "https://b8233ed9639fc2fa0e0e5b1727ea893a@o673219.ingest.us.sentry.io/4508087188455424"),
+        enable_logs=True,  # Enable Sentry structured logs
+        integrations=[
+            FastApiIntegration(),
+            StarletteIntegration(),
+            LoggingIntegration(
+                level=logging.INFO,  # Capture info and above as breadcrumbs
+                event_level=logging.ERROR  # Send errors as events
+            ),
+        ],
+        traces_sampler=trace_sampler,
+        profiles_sample_rate=DEFAULT_PROFILES_SAMPLE_RATE,
+        before_send_transaction=filter_transactions,
+    )
+
+    # Per-request access records are sampled and kept out of Sentry breadcrumbs/logs
+    ignore_logger(ACCESS_LOGGER_NAME)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
+access_log = AccessLog()
 
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+# In-process metrics, scraped from GET /metrics in Prometheus text format
+metrics = Registry()
+REQUEST_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status")
+)
+REQUESTS_IN_FLIGHT = metrics.gauge("http_requests_in_flight", "HTTP requests currently being handled")
+SUPABASE_QUEUE_WAIT = metrics.histogram(
+    "supabase_query_queue_seconds", "Time PostgREST queries wait for a query pool thread", ("query",)
+)
+SUPABASE_CALL_LATENCY = metrics.histogram(
+    "supabase_call_duration_seconds", "Supabase call latency by service, target and operation",
+    ("service", "target", "operation", "outcome")
+)
+SUPABASE_ROWS = metrics.histogram(
+    "supabase_query_rows", "Rows returned per PostgREST query", ("table", "operation"), buckets=ROW_BUCKETS
+)
+EDGE_FUNCTION_LATENCY = metrics.histogram(
+    "edge_function_duration_seconds", "create-order Edge Function call latency", ("outcome",)
+)
+TUNNEL_FORWARD_LATENCY = metrics.histogram(
+    "sentry_tunnel_forward_duration_seconds", "Sentry envelope forward attempt latency", ("outcome",)
+)
+CATALOG_CACHE_LOOKUPS = metrics.counter(
+    "catalog_cache_lookups_total", "Catalog cache lookups by state", ("state",)
+)
+CATALOG_CHANGES = metrics.counter(
+    "catalog_changes_total", "Product row changes applied from Realtime", ("type",)
+)
+ADMISSION_REJECTIONS = metrics.counter(
+    "admission_rejections_total", "Requests rejected before any work, by reason", ("route", "reason")
+)
+metrics.gauge(
+    "circuit_breaker_open", "1 when a dependency's circuit breaker is not closed", ("dependency",),
+    function=lambda: [((b.name,), 0 if b.state == "closed" else 1) for b in (supabase_db_breaker, edge_function_breaker)]
+)
+metrics.gauge(
+    "sentry_tunnel_queue_depth", "Envelopes waiting to be forwarded to Sentry",
+    function=lambda: [((), envelope_forwarder.depth)]
+)
 
-if not supabase_url or not supabase_key:
-    logger.warning("⚠️ Supabase credentials not found in environment variables. Supabase features will be unavailable.")
-    logger.warning("   Products will use FALLBACK static data")
-    supabase: Client = None
-else:
-    try:
-        supabase: Client = create_client(supabase_url, supabase_key)
-        logger.info("✅ Supabase client initialized successfully", extra={
-            "supabase_url": supabase_url
-        })
-        logger.info("   Products will be fetched from Supabase database")
-    except Exception as e:
-        logger.error("❌ Failed to initialize Supabase client", extra={
-            "error": str(e),
-            "error_type": type(e).__name__
-        })
-        logger.error("   Products will use FALLBACK static data")
-        supabase = None
+def route_label(request: Request, status_code: int) -> str:
+    """Route template for metrics labels, so /items/1 and /items/2 share a series"""
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    # Unmatched paths are client-controlled; keep them out of label values
+    return "unmatched" if status_code == 404 else request.url.path
+
+# Supabase client and the objects built on it; filled in by init_supabase()
+supabase_url: Optional[str] = None
+supabase_key: Optional[str] = None
+supabase: Optional["Client"] = None
+
+# Spans and metrics for every Supabase call (see supabase_tracing.py)
+supabase_tracer = SupabaseTracer(latency=SUPABASE_CALL_LATENCY, rows=SUPABASE_ROWS)
+
+# Async repository used by handlers so Supabase queries never block the event loop
+product_repository: Optional[ProductRepository] = None
+
+# Product image URLs are derived from SUPABASE_URL once per path, not per request.
+# This is local computation, so unlike the calls below it needs no circuit breaker.
+image_url_for = None
+
+_supabase_ready = False
+_supabase_lock = threading.Lock()
+
+def init_supabase():
+    """Create the Supabase client on first use (runs once, in a worker thread)"""
+    global supabase_url, supabase_key, supabase, product_repository, image_url_for, _supabase_ready
+    with _supabase_lock:
+        if _supabase_ready:
+            return
+        load_env()
+        supabase_url = os.getenv("SUPABASE_URL")
+        supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+        if not supabase_url or not supabase_key:
+            logger.warning("⚠️ Supabase credentials not found in environment variables. Supabase features will be unavailable.")
+            logger.warning("   Products will use FALLBACK static data")
+        else:
+            try:
+                # Imported here: the supabase/postgrest/storage/auth stack is the bulk of cold-start time
+                from supabase import create_client
+                supabase = InstrumentedClient(create_client(supabase_url, supabase_key), supabase_tracer)
+                product_repository = ProductRepository(supabase, queue_wait=SUPABASE_QUEUE_WAIT)
+                image_url_for = product_image_urls(supabase_url)
+                store = store_from_env(supabase)
+                if isinstance(store, SupabaseIdempotencyStore):
+                    order_idempotency.store = store
+                backend = backend_from_env(supabase)
+                if isinstance(backend, SupabaseRateLimitBackend):
+                    for limiter in RATE_LIMITERS:
+                        limiter.backend = backend
+                logger.info("✅ Supabase client initialized successfully", extra={
+                    "supabase_url": supabase_url
+                })
+                logger.info("   Products will be fetched from Supabase database")
+            except Exception as e:
+                logger.error("❌ Failed to initialize Supabase client", extra={
+                    "error": str(e),
+                    "error_type": type(e).__name__
+                })
+                logger.error("   Products will use FALLBACK static data")
+        _supabase_ready = True
+
+async def ensure_supabase():
+    """Build the Supabase client off the event loop the first time it is needed"""
+    if not _supabase_ready:
+        await asyncio.to_thread(init_supabase)
+
+# Circuit breaker for PostgREST queries: fail fast to cached/fallback data when Supabase struggles.
+# Queries rejected as bad requests (4xx) say nothing about Supabase's health and do not count.
+supabase_db_breaker = CircuitBreaker(
+    "supabase-db",
+    BreakerSettings.from_env("SUPABASE_DB", deadline=3.0, slow_call_duration=1.0),
+    is_failure=lambda e: not is_client_error(e)
+)
 
-app = FastAPI()
+def data_source(source: str, breaker: CircuitBreaker) -> str:
+    """X-Data-Source value, reporting the breaker state alongside the source"""
+    return f"{source}; circuit={breaker.state}"
 
-# Startup event
-@app.on_event("startup")
-async def startup_event():
+# Pooled HTTP sessions, one per upstream, reused across requests
+EDGE_FUNCTION_UPSTREAM = "edge-function"
+SENTRY_UPSTREAM = "sentry"
+http_sessions = SessionPool()
+http_sessions.register(EDGE_FUNCTION_UPSTREAM, UpstreamSettings.from_env("EDGE_FUNCTION"))
+http_sessions.register(SENTRY_UPSTREAM, UpstreamSettings.from_env("SENTRY_TUNNEL", read_timeout=10.0))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_observability()
     logger.info("🚀 FastAPI application starting up", extra={
         "environment": os.getenv("ENVIRONMENT", "development"),
         "port": os.getenv("PORT", 8000)
     })
-    if supabase:
-        logger.info("✅ Supabase integration: ACTIVE")
-    else:
-        logger.warning("⚠️ Supabase integration: DISABLED (using fallback data)")
+    await http_sessions.open()
+    # Hash /static before serving so fingerprinted URLs are ready for the first request
+    await asyncio.to_thread(static_assets.load)
+    await invalidation_channel.start(on_invalidation)
+    if CATALOG_REALTIME:
+        await ensure_supabase()
+        if supabase is not None:
+            catalog_feed.start(supabase_url, supabase_key)
+    yield
+    await catalog_feed.stop()
+    await invalidation_channel.stop()
+    # Drain queued tunnel envelopes before the sessions they use are closed
+    await envelope_forwarder.stop()
+    await http_sessions.close()
+    # Query pools; in-flight requests have finished by now
+    if product_repository is not None:
+        product_repository.close()
+    for backend in {limiter.backend for limiter in RATE_LIMITERS}:
+        backend.close()
+    logger.info("👋 FastAPI application shut down")
+
+app = FastAPI(lifespan=lifespan)
+
+# Mount the static directory: fingerprinted, precompressed and conditionally cached (see static_assets.py).
+# Resolved from this file, so the API starts from api/ (server.py) as well as from the repository root
+STATIC_DIR = Path(__file__).resolve().parent.parent / "static"
+static_assets = StaticAssets(directory=str(STATIC_DIR))
+app.mount("/static", static_assets, name="static")
+
+# Per-client token buckets (see rate_limit.py) for the endpoints that spend upstream quota.
+# Switched to the Supabase-backed buckets by init_supabase() when RATE_LIMIT_STORE=supabase
+rate_limit_backend = backend_from_env()
+order_ip_limiter = RateLimiter(
+    "orders-ip", RateLimitSettings.from_env("ORDERS_RATE_LIMIT", rate=1.0, burst=20.0), rate_limit_backend
+)
+order_user_limiter = RateLimiter(
+    "orders-user", RateLimitSettings.from_env("ORDERS_USER_RATE_LIMIT", rate=0.5, burst=10.0), rate_limit_backend
+)
+tunnel_limiter = RateLimiter(
+    "tunnel-ip", RateLimitSettings.from_env("TUNNEL_RATE_LIMIT", rate=10.0, burst=100.0), rate_limit_backend
+)
+
+# Limits for POST /orders/batch
+ORDER_BATCH_MAX_SIZE = int(os.getenv("ORDER_BATCH_MAX_SIZE", "5000"))
+ORDER_BATCH_CONCURRENCY = int(os.getenv("ORDER_BATCH_CONCURRENCY", "10"))
 
-# Mount the static directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Bulk back-office submissions get their own per-client bucket, one token per order, sized so
+# a full batch fits; the single-order /orders bucket would cap batches at its burst
+order_batch_limiter = RateLimiter(
+    "orders-batch-ip",
+    RateLimitSettings.from_env("ORDERS_BATCH_RATE_LIMIT", rate=50.0, burst=float(ORDER_BATCH_MAX_SIZE)),
+    rate_limit_backend,
+)
+RATE_LIMITERS = (order_ip_limiter, order_user_limiter, order_batch_limiter, tunnel_limiter)
+# None: admitted through the gate only; the handler charges one token per order in the batch
+RATE_LIMITED_PATHS = {"/orders": order_ip_limiter, "/orders/batch": None, "/tunnel": tunnel_limiter}
+
+# Requests in progress on those endpoints, across all clients
+admission_gate = AdmissionGate(int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "200")))
+
+def retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+def rate_limited(route: str, retry_after: float) -> HTTPException:
+    ADMISSION_REJECTIONS.inc(route, "rate_limit")
+    return HTTPException(status_code=429, detail="Too many requests", headers=retry_after_header(retry_after))
+
+class AdmissionControl:
+    """
+    Rate limits and the admission gate for RATE_LIMITED_PATHS, as plain ASGI
+    middleware: unlike @app.middleware("http") it adds no task group per
+    request, and route errors reach Sentry unwrapped.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path")
+        if scope["type"] != "http" or scope["method"] != "POST" or path not in RATE_LIMITED_PATHS:
+            return await self.app(scope, receive, send)
+
+        limiter = RATE_LIMITED_PATHS[path]
+        if limiter is not None:
+            client_host = scope["client"][0] if scope.get("client") else "unknown"
+            retry_after = await limiter.check(client_host)
+            if retry_after is not None:
+                error = rate_limited(path, retry_after)
+                logger.warning("🚦 Rate limited client", extra={
+                    "path": path,
+                    "client_ip": client_host,
+                    "retry_after": retry_after
+                })
+                response = JSONResponse({"detail": error.detail}, status_code=error.status_code, headers=error.headers)
+                return await response(scope, receive, send)
+
+        # Shed load before reading the body rather than queueing behind requests already running
+        if not admission_gate.try_enter():
+            ADMISSION_REJECTIONS.inc(path, "concurrency")
+            logger.warning("🚦 Admission gate full, shedding request", extra={
+                "path": path,
+                "in_flight": admission_gate.in_flight
+            })
+            response = JSONResponse({"detail": "Server busy"}, status_code=503, headers=retry_after_header(1))
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_gate.leave()
+
+# Added before CORS so rejections still carry CORS headers and are logged by log_requests
+app.add_middleware(AdmissionControl)
 
 # Configure CORS with regex
 app.add_middleware(
@@ -111,22 +376,30 @@ app.add_middleware(
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     # Skip logging for static files and health checks
-    if request.url.path.startswith("/static") or request.url.path == "/healthcheck":
+    path = request.url.path
+    if path.startswith("/static") or path == "/healthcheck":
         return await call_next(request)
     
-    logger.info(f"Incoming request: {request.method} {request.url.path}", extra={
-        "method": request.method,
-        "path": request.url.path,
-        "client_ip": request.client.host if request.client else "unknown"
-    })
+    started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+    duration = time.perf_counter() - started
+    REQUEST_LATENCY.observe(duration, request.method, route_label(request, response.status_code), str(response.status_code))
     
-    response = await call_next(request)
+    # One combined, sampled access record per request
+    access_log.record(
+        request.method,
+        path,
+        response.status_code,
+        duration,
+        request.client.host if request.client else "unknown"
+    )
     
-    logger.info(f"Request completed: {request.method} {request.url.path} - {response.status_code}", extra={
-        "method": request.method,
-        "path": request.url.path,
-        "status_code": response.status_code
-    })
+    # Errors and slow responses boost trace sampling for this route
+    trace_sampler.record_outcome(path, response.status_code, duration)
     
     return response
 
@@ -142,58 +415,220 @@ FALLBACK_PRODUCTS = [
     {"id": "8", "name": "Pineapple Hat", "price": 89.99, "image": "pineapple-hat.jpg"},
 ]
 
+def project_row(row: dict, fields) -> dict:
+    """Shape a (possibly partial) products row into the requested API fields"""
+    item = {}
+    for field in fields:
+        if field == "id":
+            item["id"] = str(row["id"])
+        elif field == "price":
+            item["price"] = float(row["price"])
+        elif field == "image":
+            item["image"] = image_url_for(row["image_path"])
+        elif field == "images":
+            # Empty until the variants have been uploaded and IMAGE_VARIANTS is set
+            item["images"] = srcsets(row["image_path"], image_url_for, IMAGE_VARIANT_FORMATS) if IMAGE_VARIANTS else {}
+        elif field == "description":
+            item["description"] = row.get("description") or ""
+        else:
+            item[field] = row[field]
+    return item
+
+async def load_catalog():
+    """Fetch the products table and shape it for the frontend"""
+    # Realtime changes that arrive during the query are replayed over its result
+    since = product_index.begin_load()
+    try:
+        rows = await supabase_db_breaker.call(product_repository.list_products)
+    except BaseException:
+        product_index.cancel_load()
+        raise
+    
+    # Transform data to match frontend expectations
+    product_index.load([project_row(row, DEFAULT_FIELDS) for row in rows], since)
+    products = product_index.products()
+    
+    logger.info("✅ Products fetched from Supabase database successfully", extra={
+        "product_count": len(products),
+        "source": "supabase_database",
+        "first_product_id": products[0]["id"] if products else None
+    })
+    return products
+
+# Catalog cache: serves stale data while a single background task refreshes it
+catalog_cache = CatalogCache(load_catalog)
+
+# Catalog keyed by id, patched from Realtime change events (CATALOG_REALTIME)
+product_index = ProductIndex(lambda row: project_row(row, DEFAULT_FIELDS))
+
+def apply_catalog_change(change_type: str, record: Optional[dict], old_record: Optional[dict]):
+    """Apply one products row change to the in-memory catalog, without a reload"""
+    if product_index.apply(change_type, record, old_record):
+        catalog_cache.set(product_index.products())
+        CATALOG_CHANGES.inc(change_type)
+
+def on_catalog_subscribed():
+    # Pushed changes keep the cache current; the TTL is only a safety net now
+    catalog_cache.ttl = CATALOG_REALTIME_TTL
+    # Reload once to pick up changes made while unsubscribed
+    catalog_cache.invalidate()
+
+def on_catalog_unsubscribed():
+    catalog_cache.ttl = CATALOG_CACHE_TTL
+
+catalog_feed = CatalogChangeFeed(apply_catalog_change, on_catalog_subscribed, on_catalog_unsubscribed)
+
+# Other workers refresh their copies as soon as one of them sees the catalog change
+invalidation_channel = channel_from_env()
+catalog_cache.on_change = lambda: invalidation_channel.publish(CATALOG_TOPIC)
+
+def on_invalidation(topic: str):
+    if topic == CATALOG_TOPIC:
+        logger.info("🔄 Catalog invalidated by another worker")
+        # Not republished: the worker that saw the change already told everyone
+        catalog_cache.invalidate(notify=False)
+
+# Browser caching for catalog responses; fallback data is always revalidated
+CATALOG_CACHE_CONTROL = os.getenv("CATALOG_CACHE_CONTROL", "public, max-age=60, stale-while-revalidate=300")
+FALLBACK_CACHE_CONTROL = "no-cache"
+
+# Fallback product images are this API's own /static copies, linked by fingerprinted (immutable) URL
+FALLBACK_IMAGES_DIR = "images/products"
+# Fallback catalog never changes, so it is serialized once per API base URL; bounded because
+# the base URL comes from the Host header
+MAX_FALLBACK_CATALOGS = 16
+_fallback_catalogs: Dict[str, Tuple[list, bytes, str]] = {}
+
+async def fallback_catalog(request: Request) -> Tuple[list, bytes, str]:
+    """Fallback products with absolute image URLs, plus their JSON body and ETag"""
+    base_url = str(request.base_url).rstrip("/")
+    catalog = _fallback_catalogs.get(base_url)
+    if catalog is None:
+        if not static_assets.loaded:
+            await asyncio.to_thread(static_assets.load)
+        products = [
+            {**product, "image": base_url + static_assets.url_for(f"{FALLBACK_IMAGES_DIR}/{product['image']}")}
+            for product in FALLBACK_PRODUCTS
+        ]
+        catalog = (products, *encode_catalog(products))
+        if len(_fallback_catalogs) < MAX_FALLBACK_CATALOGS:
+            _fallback_catalogs[base_url] = catalog
+    return catalog
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the If-None-Match header against a strong ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match (RFC 9110 13.1.2)
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def catalog_response(request: Request, body: bytes, etag: str, headers: dict) -> Response:
+    """Pre-serialized catalog response, or 304 when the client copy is current"""
+    headers = {"ETag": etag, **headers}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def get_products_page(request: Request, query: CatalogQuery, client_host: str) -> Response:
+    """Paginated /products: filters and projection are pushed down into PostgREST"""
+    if product_repository:
+        try:
+            rows = await supabase_db_breaker.call(lambda: product_repository.list_page(query))
+            items = [project_row(row, query.fields) for row in rows]
+            body = page(items, query, [str(row["id"]) for row in rows])
+            return Response(
+                content=orjson.dumps(body),
+                media_type="application/json",
+                headers={"X-Data-Source": data_source("supabase-database", supabase_db_breaker)}
+            )
+        except CircuitOpenError:
+            logger.debug("Supabase circuit open, serving fallback products page")
+        except Exception as e:
+            logger.error("Failed to fetch products page from Supabase, falling back to static data", extra={
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "client_ip": client_host
+            })
+            sentry_sdk.capture_exception(e)
+    
+    # Same query applied in memory to the fallback catalog
+    rows = query.apply((await fallback_catalog(request))[0])
+    items = [{f: row[f] for f in query.fields if f in row} for row in rows]
+    body = page(items, query, [row["id"] for row in rows])
+    return Response(
+        content=orjson.dumps(body),
+        media_type="application/json",
+        headers={"X-Data-Source": data_source("fallback-static", supabase_db_breaker)}
+    )
+
 @app.get("/products")
-async def get_products(request: Request):
+async def get_products(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    q: Optional[str] = Query(None, max_length=100),
+):
     client_host = request.client.host if request.client else "unknown"
     user_agent = request.headers.get("user-agent", "unknown")
+    await ensure_supabase()
+    
+    # Any paging/filtering parameter switches to the paginated response shape
+    if any(p is not None for p in (limit, cursor, fields, min_price, max_price, q)):
+        try:
+            query = CatalogQuery(
+                fields=parse_fields(fields),
+                limit=limit or DEFAULT_PAGE_SIZE,
+                # Fallback product ids are not UUIDs; its cursors are only valid without Supabase
+                cursor=parse_cursor(cursor, uuid=product_repository is not None),
+                min_price=min_price,
+                max_price=max_price,
+                name=q,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return await get_products_page(request, query, client_host)
     
-    # Try to fetch from Supabase
-    if supabase:
+    # Try to fetch from Supabase (via the catalog cache)
+    if product_repository:
         try:
-            logger.info("Fetching products from Supabase database", extra={
+            products, cache_state = await catalog_cache.get()
+            CATALOG_CACHE_LOOKUPS.inc(cache_state)
+            
+            logger.debug("Products served from catalog cache", extra={
                 "endpoint": "/products",
+                "cache_state": cache_state,
+                "generation": catalog_cache.generation,
                 "client_ip": client_host
             })
             
-            # Fetch products from Supabase
-            response = supabase.table("products").select("*").execute()
-            
-            # Transform data to match frontend expectations
-            products = []
-            for product in response.data:
-                # Get public URL for the image from Supabase Storage
-                image_url = supabase.storage.from_("product-images").get_public_url(product["image_path"])
-                
-                products.append({
-                    "id": str(product["id"]),  # UUID to string
-                    "name": product["name"],
-                    "price": float(product["price"]),
-                    "image": image_url,  # Full Supabase Storage URL
-                    "description": product.get("description", "")
-                })
-            
-            logger.info("✅ Products fetched from Supabase database successfully", extra={
-                "product_count": len(products),
-                "source": "supabase_database",
-                "client_ip": client_host,
-                "first_product_id": products[0]["id"] if products else None
-            })
-            
             # Add breadcrumb for Sentry
             sentry_sdk.add_breadcrumb(
                 category='api',
                 message='Products fetched from Supabase database',
                 level='info',
-                data={'product_count': len(products), 'source': 'supabase'}
+                data={'product_count': len(products), 'source': 'supabase', 'cache': cache_state}
             )
             
-            # Return with custom header indicating source
-            return JSONResponse(
-                content=products,
-                headers={"X-Data-Source": "supabase-database"}
-            )
+            # Serialized once per cache generation; custom headers indicate source and cache state
+            body, etag = catalog_cache.encoded()
+            return catalog_response(request, body, etag, {
+                "Cache-Control": CATALOG_CACHE_CONTROL,
+                "X-Data-Source": data_source("supabase-database", supabase_db_breaker),
+                "X-Cache": cache_state
+            })
             
+        except CircuitOpenError:
+            # No cached copy and Supabase is known to be unhealthy: skip straight to fallback
+            logger.debug("Supabase circuit open, serving fallback products")
         except Exception as e:
+            # Only reached when there is no cached copy at all
             logger.error("Failed to fetch products from Supabase, falling back to static data", extra={
                 "error": str(e),
                 "error_type": type(e).__name__,
@@ -206,7 +641,8 @@ async def get_products(request: Request):
     logger.warning("⚠️ Using fallback product data (not from Supabase)", extra={
         "product_count": len(FALLBACK_PRODUCTS),
         "source": "fallback",
-        "reason": "supabase_unavailable" if not supabase else "supabase_error"
+        "reason": "supabase_unavailable" if not product_repository else "supabase_error",
+        "circuit": supabase_db_breaker.state
     })
     
     sentry_sdk.add_breadcrumb(
@@ -217,21 +653,123 @@ async def get_products(request: Request):
     )
     
     # Return with custom header indicating source
-    return JSONResponse(
-        content=FALLBACK_PRODUCTS,
-        headers={"X-Data-Source": "fallback-static"}
-    )
+    _, body, etag = await fallback_catalog(request)
+    return catalog_response(request, body, etag, {
+        "Cache-Control": FALLBACK_CACHE_CONTROL,
+        "X-Data-Source": data_source("fallback-static", supabase_db_breaker)
+    })
 
 # Pydantic models for order creation
 class OrderItem(BaseModel):
     product_id: str
     quantity: int
-    price_at_purchase: float
+    # Price the client showed; checked against the catalog, which sets the charged price
+    price_at_purchase: Optional[float] = None
 
 class CreateOrderRequest(BaseModel):
     user_id: str
     items: List[OrderItem]
 
+class CreateOrderBatchRequest(BaseModel):
+    orders: List[CreateOrderRequest]
+
+# Idempotency-Key results for POST /orders (see idempotency.py)
+# Switched to the Supabase-backed store by init_supabase() when IDEMPOTENCY_STORE=supabase
+order_idempotency = Idempotency(store_from_env())
+
+class EdgeFunctionError(Exception):
+    """Non-201 response from the create-order Edge Function"""
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+# Prices for orders when Supabase is not configured
+FALLBACK_PRICES = {product["id"]: product["price"] for product in FALLBACK_PRODUCTS}
+
+async def catalog_prices() -> PriceLookup:
+    """Price lookup over the same in-memory catalog /products serves"""
+    if not product_repository:
+        return FALLBACK_PRICES.get
+    try:
+        # Loading the catalog also (re)builds product_index
+        await catalog_cache.get()
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="Product catalog unavailable")
+    except Exception as e:
+        logger.error("❌ Failed to load catalog for order pricing", extra={
+            "error": str(e),
+            "error_type": type(e).__name__
+        })
+        sentry_sdk.capture_exception(e)
+        raise HTTPException(status_code=503, detail="Product catalog unavailable")
+    return product_index.price_of
+
+def order_payload(order_request: CreateOrderRequest, price_of: PriceLookup) -> dict:
+    """
+    Validated Edge Function payload for one order, priced from the catalog.
+    Raises OrderRejected for orders that must not reach the Edge Function.
+    """
+    error = validate_order(order_request)
+    if error:
+        raise OrderRejected(422, error)
+    items, total = price_items(order_request.items, price_of)
+    return {
+        "user_id": order_request.user_id,
+        "items": items,
+        "total": total
+    }
+
+def edge_function_headers() -> dict:
+    """Auth plus Sentry tracing headers for the Edge Function call"""
+    # Get Sentry trace headers for distributed tracing
+    sentry_trace = sentry_sdk.Hub.current.scope.transaction.to_traceparent() if sentry_sdk.Hub.current.scope.transaction else None
+    baggage = sentry_sdk.Hub.current.scope.transaction.to_baggage() if sentry_sdk.Hub.current.scope.transaction else None
+    
+    headers = {
+        "Authorization": f"Bearer {supabase_key}",
+        "Content-Type": "application/json"
+    }
+    
+    # Add Sentry tracing headers if available
+    if sentry_trace:
+        headers["sentry-trace"] = sentry_trace
+    if baggage:
+        headers["baggage"] = baggage
+    return headers
+
+# Circuit breaker for the Edge Function; rejected orders (4xx) do not count as failures
+edge_function_breaker = CircuitBreaker(
+    "edge-function",
+    BreakerSettings.from_env("EDGE_FUNCTION", deadline=10.0, slow_call_duration=5.0),
+    is_failure=lambda e: not (isinstance(e, EdgeFunctionError) and e.status < 500)
+)
+
+async def post_create_order(payload: dict, headers: dict) -> dict:
+    """POST one order to the create-order Edge Function over the pooled session"""
+    edge_function_url = f"{supabase_url}/functions/v1/create-order"
+    session = http_sessions.get(EDGE_FUNCTION_UPSTREAM)
+    with timed(EDGE_FUNCTION_LATENCY), supabase_tracer.span("functions", "create-order", "invoke") as span:
+        async with session.post(edge_function_url, json=payload, headers=headers) as resp:
+            if span is not None:
+                span.set_http_status(resp.status)
+            response_data = await resp.json()
+            if resp.status != 201:
+                raise EdgeFunctionError(resp.status, response_data.get('error', 'Unknown error from Edge Function'))
+            return response_data
+
+async def call_create_order_function(payload: dict, headers: dict) -> dict:
+    """Edge Function call guarded by its circuit breaker and deadline"""
+    return await edge_function_breaker.call(lambda: post_create_order(payload, headers))
+
+def validate_order(order_request: CreateOrderRequest) -> Optional[str]:
+    """Return why an order is invalid, or None (items are checked while pricing)"""
+    if not order_request.user_id:
+        return "Missing user_id"
+    if not order_request.items:
+        return "Order has no items"
+    return None
+
 @app.post("/orders")
 async def create_order(order_request: CreateOrderRequest, request: Request):
     """
@@ -239,14 +777,16 @@ async def create_order(order_request: CreateOrderRequest, request: Request):
     This demonstrates distributed tracing: FastAPI -> Edge Function -> Supabase DB
     """
     client_host = request.client.host if request.client else "unknown"
-    
-    # Calculate total
-    total = sum(item.quantity * item.price_at_purchase for item in order_request.items)
+    # Per-user limit on top of the per-IP one applied by AdmissionControl
+    retry_after = await order_user_limiter.check(order_request.user_id)
+    if retry_after is not None:
+        raise rate_limited("/orders", retry_after)
+    await ensure_supabase()
+    price_of = await catalog_prices()
     
     logger.info("📝 Creating order via Edge Function", extra={
         "user_id": order_request.user_id,
         "item_count": len(order_request.items),
-        "total": total,
         "client_ip": client_host
     })
     
@@ -257,84 +797,100 @@ async def create_order(order_request: CreateOrderRequest, request: Request):
         level='info',
         data={
             'user_id': order_request.user_id,
-            'item_count': len(order_request.items),
-            'total': total
+            'item_count': len(order_request.items)
         }
     )
     
+    async def price_and_submit() -> dict:
+        try:
+            payload = order_payload(order_request, price_of)
+        except OrderRejected as e:
+            raise HTTPException(status_code=e.status, detail=e.detail)
+        return await submit_order(order_request, payload)
+    
+    # Retries carrying the same Idempotency-Key replay the first result, even if prices changed since
+    idempotency_key = request.headers.get("idempotency-key")
+    if not idempotency_key:
+        response_data = await price_and_submit()
+        replayed = False
+    else:
+        try:
+            response_data, replayed = await order_idempotency.run(
+                f"{order_request.user_id}:{idempotency_key}",
+                fingerprint(order_request.dict()),
+                price_and_submit
+            )
+        except IdempotencyConflict:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different order")
+        except IdempotencyInProgress:
+            raise HTTPException(status_code=409, detail="An order with this Idempotency-Key is already in progress")
+    
+    headers = {"X-Order-Source": "edge-function"}
+    if replayed:
+        headers["Idempotent-Replayed"] = "true"
+        logger.info("♻️ Replayed idempotent order response", extra={
+            "user_id": order_request.user_id,
+            "client_ip": client_host
+        })
+    
+    return JSONResponse(content=response_data, status_code=201, headers=headers)
+
+async def submit_order(order_request: CreateOrderRequest, payload: dict) -> dict:
+    """Send one order to the Edge Function, mapping failures to HTTP errors"""
+    total = payload["total"]
     try:
-        # Get Supabase Edge Function URL
-        edge_function_url = f"{supabase_url}/functions/v1/create-order"
+        # Call Edge Function with tracing headers
+        headers = edge_function_headers()
+        
+        logger.info("🚀 Calling Edge Function", extra={
+            "url": f"{supabase_url}/functions/v1/create-order",
+            "has_sentry_trace": "sentry-trace" in headers
+        })
+        
+        response_data = await call_create_order_function(payload, headers)
+        order_id = response_data.get('order', {}).get('id')
         
-        # Prepare payload for Edge Function
-        payload = {
+        logger.info("✅ Order created successfully via Edge Function", extra={
+            "order_id": order_id,
             "user_id": order_request.user_id,
-            "items": [item.dict() for item in order_request.items],
             "total": total
-        }
-        
-        # Get Sentry trace headers for distributed tracing
-        sentry_trace = sentry_sdk.Hub.current.scope.transaction.to_traceparent() if sentry_sdk.Hub.current.scope.transaction else None
-        baggage = sentry_sdk.Hub.current.scope.transaction.to_baggage() if sentry_sdk.Hub.current.scope.transaction else None
+        })
         
-        # Call Edge Function with tracing headers
-        headers = {
-            "Authorization": f"Bearer {supabase_key}",
-            "Content-Type": "application/json"
-        }
+        # Add success breadcrumb
+        sentry_sdk.add_breadcrumb(
+            category='order',
+            message='Order created successfully',
+            level='info',
+            data={
+                'order_id': order_id,
+                'total': total
+            }
+        )
         
-        # Add Sentry tracing headers if available
-        if sentry_trace:
-            headers["sentry-trace"] = sentry_trace
-        if baggage:
-            headers["baggage"] = baggage
+        return response_data
         
-        logger.info("🚀 Calling Edge Function", extra={
-            "url": edge_function_url,
-            "has_sentry_trace": sentry_trace is not None
+    except CircuitOpenError as e:
+        logger.warning("⚡ Edge Function circuit open, rejecting order", extra={
+            "user_id": order_request.user_id,
+            "retry_after": e.retry_after
         })
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                edge_function_url,
-                json=payload,
-                headers=headers
-            ) as resp:
-                response_data = await resp.json()
-                
-                if resp.status != 201:
-                    error_msg = response_data.get('error', 'Unknown error from Edge Function')
-                    logger.error("❌ Edge Function returned error", extra={
-                        "status": resp.status,
-                        "error": error_msg
-                    })
-                    raise HTTPException(status_code=resp.status, detail=error_msg)
-                
-                order_id = response_data.get('order', {}).get('id')
-                
-                logger.info("✅ Order created successfully via Edge Function", extra={
-                    "order_id": order_id,
-                    "user_id": order_request.user_id,
-                    "total": total
-                })
-                
-                # Add success breadcrumb
-                sentry_sdk.add_breadcrumb(
-                    category='order',
-                    message='Order created successfully',
-                    level='info',
-                    data={
-                        'order_id': order_id,
-                        'total': total
-                    }
-                )
-                
-                return JSONResponse(
-                    content=response_data,
-                    status_code=201,
-                    headers={"X-Order-Source": "edge-function"}
-                )
-                
+        raise HTTPException(
+            status_code=503,
+            detail="Order service temporarily unavailable",
+            headers={"Retry-After": str(max(1, int(e.retry_after))), "X-Circuit-State": edge_function_breaker.state}
+        )
+    except EdgeFunctionError as e:
+        logger.error("❌ Edge Function returned error", extra={
+            "status": e.status,
+            "error": e.detail
+        })
+        raise HTTPException(status_code=e.status, detail=e.detail)
+    except asyncio.TimeoutError as e:
+        logger.error("❌ Edge Function call timed out", extra={
+            "error_type": type(e).__name__
+        })
+        sentry_sdk.capture_exception(e)
+        raise HTTPException(status_code=504, detail="Edge Function timed out")
     except aiohttp.ClientError as e:
         logger.error("❌ Failed to call Edge Function", extra={
             "error": str(e),
@@ -350,6 +906,95 @@ async def create_order(order_request: CreateOrderRequest, request: Request):
         sentry_sdk.capture_exception(e)
         raise HTTPException(status_code=500, detail="Failed to create order")
 
+@app.post("/orders/batch")
+async def create_orders_batch(batch: CreateOrderBatchRequest, request: Request):
+    """
+    Create many orders in one call. Orders are priced from the catalog, then sent to
+    the Edge Function with bounded concurrency. Returns one result per order.
+    """
+    client_host = request.client.host if request.client else "unknown"
+    
+    if not batch.orders:
+        raise HTTPException(status_code=400, detail="Batch contains no orders")
+    if len(batch.orders) > ORDER_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {ORDER_BATCH_MAX_SIZE} orders")
+    # Each order costs one token from the client's batch bucket and one from its user's bucket
+    if len(batch.orders) > order_batch_limiter.settings.burst:
+        ADMISSION_REJECTIONS.inc("/orders/batch", "rate_limit")
+        raise HTTPException(
+            status_code=413, detail=f"Batch exceeds the rate limit of {int(order_batch_limiter.settings.burst)} orders"
+        )
+    
+    # Orders of users over their own limit are rejected individually
+    order_counts = Counter(order.user_id for order in batch.orders)
+    waits = await asyncio.gather(*(order_user_limiter.check(user, cost=n) for user, n in order_counts.items()))
+    limited_users = {user for user, wait in zip(order_counts, waits) if wait is not None}
+    if limited_users:
+        ADMISSION_REJECTIONS.inc("/orders/batch", "rate_limit", amount=len(limited_users))
+    # The client is charged only for the orders that passed their user's limit
+    accepted = sum(n for user, n in order_counts.items() if user not in limited_users)
+    if accepted:
+        retry_after = await order_batch_limiter.check(client_host, cost=accepted)
+        if retry_after is not None:
+            raise rate_limited("/orders/batch", retry_after)
+    await ensure_supabase()
+    # One catalog lookup for the whole batch; each order is then priced in memory
+    price_of = await catalog_prices()
+    
+    logger.info("📦 Creating order batch via Edge Function", extra={
+        "order_count": len(batch.orders),
+        "concurrency": ORDER_BATCH_CONCURRENCY,
+        "client_ip": client_host
+    })
+    
+    # Trace headers are shared by every call in the batch
+    headers = edge_function_headers()
+    semaphore = asyncio.Semaphore(ORDER_BATCH_CONCURRENCY)
+    
+    async def submit(index: int, order_request: CreateOrderRequest) -> dict:
+        if order_request.user_id in limited_users:
+            return {"index": index, "status": 429, "error": "Too many requests"}
+        try:
+            payload = order_payload(order_request, price_of)
+        except OrderRejected as e:
+            return {"index": index, "status": e.status, "error": e.detail}
+        async with semaphore:
+            try:
+                response_data = await call_create_order_function(payload, headers)
+                return {"index": index, "status": 201, "order": response_data.get('order')}
+            except CircuitOpenError:
+                return {"index": index, "status": 503, "error": "Order service temporarily unavailable"}
+            except EdgeFunctionError as e:
+                return {"index": index, "status": e.status, "error": e.detail}
+            except asyncio.TimeoutError:
+                return {"index": index, "status": 504, "error": "Edge Function timed out"}
+            except aiohttp.ClientError:
+                return {"index": index, "status": 503, "error": "Failed to communicate with Edge Function"}
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+                return {"index": index, "status": 500, "error": "Failed to create order"}
+    
+    results = await asyncio.gather(*(submit(i, order) for i, order in enumerate(batch.orders)))
+    succeeded = sum(1 for result in results if result["status"] == 201)
+    
+    logger.info("✅ Order batch processed", extra={
+        "order_count": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded
+    })
+    
+    sentry_sdk.add_breadcrumb(
+        category='order',
+        message='Order batch processed',
+        level='info',
+        data={'order_count': len(results), 'succeeded': succeeded}
+    )
+    
+    return JSONResponse(
+        content={"succeeded": succeeded, "failed": len(results) - succeeded, "results": results},
+        headers={"X-Order-Source": "edge-function"}
+    )
+
 @app.get("/sentry-debug")
 async def trigger_error(request: Request):
     client_host = request.client.host if request.client else "unknown"
@@ -380,26 +1025,36 @@ async def trigger_error(request: Request):
 # Replace with your actual Sentry host and project IDs
 SENTRY_HOST = "o673219.ingest.us.sentry.io"
 SENTRY_PROJECT_IDS = ["4508059881242624"]
+# Where envelopes are forwarded; overridable so benchmarks can point at a local stand-in
+SENTRY_TUNNEL_UPSTREAM = os.getenv("SENTRY_TUNNEL_UPSTREAM", f"https://{SENTRY_HOST}")
+
+# Envelopes are forwarded upstream by background workers; see tunnel_forwarder.py
+envelope_forwarder = EnvelopeForwarder(lambda: http_sessions.get(SENTRY_UPSTREAM), latency=TUNNEL_FORWARD_LATENCY)
+TUNNEL_RETRY_AFTER = "1"
+TUNNEL_MAX_BYTES = DEFAULT_MAX_ENVELOPE_BYTES
+TUNNEL_QUEUE_MAX_BYTES = DEFAULT_MAX_QUEUED_BYTES
 
 @app.post("/tunnel")
 async def sentry_tunnel(request: Request):
+    # Refuse oversized envelopes before reading any of the body
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > TUNNEL_MAX_BYTES:
+        return JSONResponse(content={'error': 'Envelope too large'}, status_code=413)
+
+    reader = EnvelopeReader(request.stream(), max_bytes=TUNNEL_MAX_BYTES)
     try:
-        # Read the raw bytes from the request body
-        envelope_bytes = await request.body()
-        
-        # Decode bytes to string and split into lines
-        envelope = envelope_bytes.decode('utf-8')
-        pieces = envelope.split('\n')
-        header_str = pieces[0]
-        
-        # Parse the envelope header as JSON
-        header = json.loads(header_str)
-        dsn = header.get('dsn', '')
-        
+        # Only the first line (the envelope header) is needed; the rest is never parsed
+        try:
+            header = json.loads(await reader.read_header())
+            dsn = header.get('dsn', '')
+        except (InvalidEnvelope, ValueError, AttributeError) as e:
+            logger.warning("Invalid Sentry envelope header", extra={"error": str(e)})
+            return JSONResponse(content={'error': 'Invalid envelope header'}, status_code=400)
+
         # Log the received DSN
         logger.debug("Received Sentry tunnel request", extra={
             "dsn": dsn,
-            "envelope_size": len(envelope_bytes)
+            "content_length": content_length
         })
         
         # Parse the DSN to extract hostname and project ID
@@ -407,46 +1062,64 @@ async def sentry_tunnel(request: Request):
         hostname = dsn_parsed.hostname
         project_id = dsn_parsed.path.strip('/')
         
-        # Validate the hostname and project ID
+        # Validate the hostname and project ID before reading the rest of the body
         if hostname != SENTRY_HOST:
             logger.error("Invalid Sentry hostname", extra={
                 "received_hostname": hostname,
                 "expected_hostname": SENTRY_HOST
             })
-            raise Exception(f"Invalid Sentry hostname: {hostname}")
+            return JSONResponse(content={'error': 'Invalid Sentry DSN'}, status_code=400)
         
         if not project_id or project_id not in SENTRY_PROJECT_IDS:
             logger.error("Invalid Sentry project ID", extra={
                 "received_project_id": project_id,
                 "allowed_project_ids": SENTRY_PROJECT_IDS
             })
-            raise Exception(f"Invalid Sentry project ID: {project_id}")
+            return JSONResponse(content={'error': 'Invalid Sentry DSN'}, status_code=400)
         
         # Construct the upstream Sentry URL
-        upstream_sentry_url = f"https://{SENTRY_HOST}/api/{project_id}/envelope/"
+        upstream_sentry_url = f"{SENTRY_TUNNEL_UPSTREAM}/api/{project_id}/envelope/"
+
+        # Large envelopes are piped upstream as they arrive instead of being held in memory
+        if not await reader.buffer_up_to(TUNNEL_QUEUE_MAX_BYTES):
+            status = await envelope_forwarder.forward_stream(upstream_sentry_url, reader.body())
+            if reader.too_large:
+                raise EnvelopeTooLarge(reader.size)
+            logger.debug("Streamed envelope to Sentry", extra={
+                "upstream_url": upstream_sentry_url,
+                "project_id": project_id,
+                "envelope_size": reader.size,
+                "status": status
+            })
+            if status != 200:
+                return JSONResponse(content={'error': 'Error tunneling to Sentry'}, status_code=502)
+            return Response(status_code=200)
         
-        logger.debug("Forwarding envelope to Sentry", extra={
+        # Hand the envelope to the background forwarder and answer right away
+        if not envelope_forwarder.submit(upstream_sentry_url, bytes(reader.buffer)):
+            logger.warning("Sentry tunnel queue full, shedding envelope", extra={
+                "project_id": project_id,
+                "queue_size": envelope_forwarder.max_queue
+            })
+            return JSONResponse(
+                content={'error': 'Tunnel queue full'},
+                status_code=429,
+                headers={"Retry-After": TUNNEL_RETRY_AFTER}
+            )
+        
+        logger.debug("Queued envelope for Sentry", extra={
             "upstream_url": upstream_sentry_url,
-            "project_id": project_id
+            "project_id": project_id,
+            "envelope_size": reader.size
         })
-        
-        # Forward the envelope to Sentry
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                upstream_sentry_url,
-                data=envelope_bytes,
-                headers={'Content-Type': 'application/x-sentry-envelope'}
-            ) as resp:
-                if resp.status != 200:
-                    logger.error("Upstream Sentry returned error", extra={
-                        "status_code": resp.status,
-                        "project_id": project_id
-                    })
-                    raise Exception(f"Upstream Sentry returned status {resp.status}")
-        
-        logger.debug("Successfully forwarded to Sentry", extra={"project_id": project_id})
         # Return success response
         return Response(status_code=200)
+    except EnvelopeTooLarge as e:
+        logger.warning("Sentry envelope too large", extra={
+            "envelope_size": e.args[0],
+            "max_bytes": TUNNEL_MAX_BYTES
+        })
+        return JSONResponse(content={'error': 'Envelope too large'}, status_code=413)
     except Exception as e:
         logger.error("Error tunneling to Sentry", extra={
             "error": str(e),
@@ -454,6 +1127,11 @@ async def sentry_tunnel(request: Request):
         })
         return JSONResponse(content={'error': 'Error tunneling to Sentry'}, status_code=500)
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
@@ -0,0 +1,48 @@
+"""
+Server-side order pricing.
+
+Orders are priced against the catalog /products serves from memory, so
+pricing is one dict lookup per item and needs no database round trip.
+Unknown products and prices that no longer match the catalog are rejected
+before the Edge Function is invoked; the Edge Function receives the
+server-priced items and total.
+"""
+
+from typing import Callable, Iterable, List, Optional, Tuple
+
+# Client prices within half a cent of the catalog price are accepted
+PRICE_TOLERANCE = 0.005
+
+PriceLookup = Callable[[str], Optional[float]]
+
+
+class OrderRejected(Exception):
+    """Order that fails validation or pricing, with the HTTP status to return."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def price_items(items: Iterable, price_of: PriceLookup) -> Tuple[List[dict], float]:
+    """
+    Price order items (objects with product_id, quantity and an optional
+    client price_at_purchase) from the catalog. Returns the priced items and
+    the order total.
+    """
+    priced = []
+    total_cents = 0
+    for item in items:
+        if item.quantity <= 0:
+            raise OrderRejected(422, f"Invalid quantity for product {item.product_id}")
+        price = price_of(item.product_id)
+        if price is None:
+            raise OrderRejected(422, f"Unknown product {item.product_id}")
+        client_price = item.price_at_purchase
+        if client_price is not None and abs(client_price - price) > PRICE_TOLERANCE:
+            raise OrderRejected(409, f"Price of product {item.product_id} changed to {price:.2f}")
+        priced.append({"product_id": item.product_id, "quantity": item.quantity, "price_at_purchase": price})
+        # Sum in cents so totals do not pick up float error
+        total_cents += item.quantity * round(price * 100)
+    return priced, total_cents / 100
@@ -0,0 +1,90 @@
+"""
+Async access to the products table.
+
+The Supabase Python client is synchronous, so every query is handed to a
+dedicated, bounded thread pool. Handlers await the result instead of blocking
+the uvicorn event loop for a full PostgREST round trip.
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from catalog_query import CatalogQuery, escape_like
+
+# Maximum number of PostgREST queries allowed in flight at once per process
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("SUPABASE_MAX_CONCURRENCY", "10"))
+
+# SQLSTATE classes PostgREST answers with a 4xx: data exceptions, integrity
+# constraint violations, syntax and access errors
+CLIENT_ERROR_CLASSES = ("22", "23", "42")
+
+
+def is_client_error(error: BaseException) -> bool:
+    """True for a PostgREST error caused by the request itself (a 4xx), not by the database being unwell."""
+    # postgrest.APIError carries the SQLSTATE / PGRST code, or the HTTP status when the body was not JSON
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return 400 <= code < 500
+    if not isinstance(code, str):
+        return False
+    return code.startswith(("PGRST1", "PGRST2")) or code[:2] in CLIENT_ERROR_CLASSES
+
+
+class ProductRepository:
+    """Awaitable wrapper around the synchronous Supabase products queries."""
+
+    def __init__(self, client, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, queue_wait=None):
+        self._client = client
+        # Optional histogram of seconds each query waited for a pool thread, by query.
+        # The query itself is timed by the client (see supabase_tracing.py).
+        self.queue_wait = queue_wait
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix="supabase-products",
+        )
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        # Run in the caller's context so query spans attach to the request's transaction
+        context = contextvars.copy_context()
+        if self.queue_wait is None:
+            return await loop.run_in_executor(self._executor, context.run, fn, *args)
+        submitted = time.perf_counter()
+
+        def call():
+            # Observed as the query leaves the queue, on its pool thread
+            self.queue_wait.observe(time.perf_counter() - submitted, fn.__name__.lstrip("_"))
+            return context.run(fn, *args)
+
+        return await loop.run_in_executor(self._executor, call)
+
+    def _select_all(self) -> List[Dict[str, Any]]:
+        return self._client.table("products").select("*").execute().data
+
+    def _select_page(self, query: CatalogQuery) -> List[Dict[str, Any]]:
+        request = self._client.table("products").select(",".join(query.columns()))
+        if query.cursor is not None:
+            request = request.gt("id", query.cursor)
+        if query.min_price is not None:
+            request = request.gte("price", query.min_price)
+        if query.max_price is not None:
+            request = request.lte("price", query.max_price)
+        if query.name:
+            request = request.ilike("name", f"%{escape_like(query.name)}%")
+        # One extra row tells the caller whether another page exists
+        return request.order("id").limit(query.limit + 1).execute().data
+
+    async def list_products(self) -> List[Dict[str, Any]]:
+        """Return every row of the products table."""
+        return await self._run(self._select_all)
+
+    async def list_page(self, query: CatalogQuery) -> List[Dict[str, Any]]:
+        """Return up to `query.limit + 1` rows, filtered and ordered by id."""
+        return await self._run(self._select_page, query)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
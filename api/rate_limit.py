@@ -0,0 +1,172 @@
+"""
+Per-client rate limiting and admission control.
+
+Token buckets, keyed by client IP (or user), refill at `rate` tokens per
+second up to `burst`; a request that finds its bucket empty is rejected with
+429 and a Retry-After of the time until the next token. Buckets live in a
+pluggable backend: in memory by default (per worker process, so the
+effective limit scales with the worker count), or shared by every worker and
+instance through a Supabase function (RATE_LIMIT_STORE=supabase). A failing
+shared backend lets requests through rather than taking the API down.
+
+On top of that, an AdmissionGate caps the requests in progress across
+clients; when it is full, new requests get 503 immediately instead of
+queueing behind the ones already running.
+
+Settings are read from the environment using a prefix, e.g.
+ORDERS_RATE_LIMIT_RATE or TUNNEL_RATE_LIMIT_BURST.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from env_settings import settings_from_env
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+@dataclass(frozen=True)
+class RateLimitSettings:
+    rate: float = 1.0  # tokens added per second
+    burst: float = 10.0  # bucket capacity
+
+    @classmethod
+    def from_env(cls, prefix: str, **defaults) -> "RateLimitSettings":
+        return settings_from_env(cls, prefix, **defaults)
+
+
+class RateLimitBackend(ABC):
+    """Backend interface: take tokens from a bucket."""
+
+    @abstractmethod
+    async def take(self, key: str, settings: RateLimitSettings, cost: float = 1.0) -> float:
+        """Take `cost` tokens; returns 0 if allowed, else seconds until they are available."""
+
+    def close(self):
+        """Release resources held by the backend, at shutdown."""
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Per-process buckets; the least recently used are dropped beyond max_keys."""
+
+    def __init__(self, max_keys: int = DEFAULT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, settings: RateLimitSettings, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (settings.burst, now))
+        tokens = min(settings.burst, tokens + (now - updated) * settings.rate)
+        if tokens >= cost:
+            tokens -= cost
+            wait = 0.0
+        else:
+            wait = (cost - tokens) / settings.rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            # A dropped bucket comes back full, which only errs towards allowing
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class SupabaseRateLimitBackend(RateLimitBackend):
+    """
+    Buckets shared by every worker, kept by a Postgres function:
+
+        create table rate_limit_buckets (
+          key text primary key, tokens float8 not null, updated_at timestamptz not null
+        );
+        create function take_rate_limit_token(p_key text, p_rate float8, p_burst float8, p_cost float8)
+        returns float8 language plpgsql as $$
+        declare
+          b rate_limit_buckets;
+          available float8;
+        begin
+          insert into rate_limit_buckets values (p_key, p_burst, now())
+            on conflict (key) do nothing;
+          select * into b from rate_limit_buckets where key = p_key for update;
+          available := least(p_burst, b.tokens + extract(epoch from now() - b.updated_at) * p_rate);
+          if available >= p_cost then
+            update rate_limit_buckets set tokens = available - p_cost, updated_at = now() where key = p_key;
+            return 0;
+          end if;
+          update rate_limit_buckets set tokens = available, updated_at = now() where key = p_key;
+          return (p_cost - available) / p_rate;
+        end $$;
+    """
+
+    FUNCTION = "take_rate_limit_token"
+
+    def __init__(self, client):
+        self._client = client
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rate-limit")
+
+    def _take(self, key: str, settings: RateLimitSettings, cost: float) -> float:
+        params = {"p_key": key, "p_rate": settings.rate, "p_burst": settings.burst, "p_cost": cost}
+        return float(self._client.rpc(self.FUNCTION, params).execute().data)
+
+    async def take(self, key: str, settings: RateLimitSettings, cost: float = 1.0) -> float:
+        try:
+            call = contextvars.copy_context().run
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, call, self._take, key, settings, cost
+            )
+        except Exception as e:
+            logger.warning("Rate limit backend failed, allowing request", extra={
+                "error": str(e),
+                "error_type": type(e).__name__
+            })
+            return 0.0
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class RateLimiter:
+    """Token buckets with one set of settings, e.g. per client IP on /orders."""
+
+    def __init__(self, name: str, settings: RateLimitSettings, backend: RateLimitBackend):
+        self.name = name
+        self.settings = settings
+        self.backend = backend
+
+    async def check(self, key: str, cost: float = 1.0) -> Optional[float]:
+        """None if allowed, else the seconds to wait before retrying."""
+        wait = await self.backend.take(f"{self.name}:{key}", self.settings, cost)
+        return wait if wait > 0 else None
+
+
+class AdmissionGate:
+    """Caps requests in progress; never queues."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+
+    def try_enter(self) -> bool:
+        if self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def leave(self):
+        self.in_flight -= 1
+
+
+def backend_from_env(supabase_client=None) -> RateLimitBackend:
+    """RATE_LIMIT_STORE=memory (default) or supabase."""
+    backend = os.getenv("RATE_LIMIT_STORE", "memory")
+    if backend == "supabase" and supabase_client is not None:
+        return SupabaseRateLimitBackend(supabase_client)
+    return InMemoryRateLimitBackend()
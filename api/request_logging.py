@@ -0,0 +1,116 @@
+"""
+Logging pipeline for the API.
+
+Records are handed to a QueueHandler and formatted/written by a
+QueueListener thread, so the event loop never blocks on I/O or string
+formatting. Requests are logged as a single access record (with duration)
+through the `api.access` logger, sampled per route.
+
+Sampling is configured with ACCESS_LOG_SAMPLE_RATE (default for every
+route) and ACCESS_LOG_ROUTE_RATES, e.g. "/products=0.1,/tunnel=0.01".
+Server errors are always logged.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Optional, Tuple
+
+ACCESS_LOGGER_NAME = "api.access"
+DEFAULT_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1.0"))
+DEFAULT_ROUTE_RATES = os.getenv("ACCESS_LOG_ROUTE_RATES", "")
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[QueueListener] = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that enqueues the record untouched. The stock prepare()
+    formats the message on the calling thread; here that work is left to the
+    listener thread. Safe because the queue never leaves the process.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(level: int = logging.INFO) -> QueueListener:
+    """Route root logging through a background queue listener (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(DeferredQueueHandler(log_queue))
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def parse_route_rates(spec: str) -> List[Tuple[str, float]]:
+    """Parse "/a=0.1,/b=1" into (prefix, rate) pairs, longest prefix first."""
+    rates = []
+    for entry in spec.split(","):
+        if "=" not in entry:
+            continue
+        prefix, rate = entry.split("=", 1)
+        rates.append((prefix.strip(), float(rate)))
+    return sorted(rates, key=lambda r: len(r[0]), reverse=True)
+
+
+class AccessLog:
+    """One sampled, lazily formatted access record per request."""
+
+    def __init__(
+        self,
+        default_rate: float = DEFAULT_SAMPLE_RATE,
+        route_rates: str = DEFAULT_ROUTE_RATES,
+    ):
+        self.logger = logging.getLogger(ACCESS_LOGGER_NAME)
+        self.default_rate = default_rate
+        self.route_rates = parse_route_rates(route_rates)
+        self._random = random.random
+
+    def rate_for(self, path: str) -> float:
+        for prefix, rate in self.route_rates:
+            if path.startswith(prefix):
+                return rate
+        return self.default_rate
+
+    def record(self, method: str, path: str, status_code: int, duration: float, client_ip: str):
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        if status_code < 500:
+            rate = self.rate_for(path)
+            if rate <= 0 or (rate < 1 and self._random() >= rate):
+                return
+        # %-style args: the message is only built by the listener thread
+        self.logger.info(
+            "%s %s - %d (%.1fms)", method, path, status_code, duration * 1000,
+            extra={
+                "method": method,
+                "path": path,
+                "status_code": status_code,
+                "duration_ms": round(duration * 1000, 2),
+                "client_ip": client_ip,
+            },
+        )
@@ -0,0 +1,82 @@
+"""
+Production entry point: `cd api && python server.py`.
+
+Runs main:app in WEB_CONCURRENCY worker processes (default: the CPUs
+available to this process) on uvloop and httptools when they are installed.
+On SIGTERM/SIGINT uvicorn stops accepting connections, waits up to
+GRACEFUL_SHUTDOWN_SECONDS for in-flight requests (orders included), and
+then runs the lifespan shutdown, which drains the Sentry tunnel queue.
+
+Workers share a cache invalidation directory (see invalidation.py) so
+their catalog caches stay coherent.
+"""
+
+import importlib.util
+import logging
+import os
+import shutil
+import tempfile
+
+import uvicorn
+
+from invalidation import INVALIDATION_DIR_ENV
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on macOS / Windows
+        return os.cpu_count() or 1
+
+
+DEFAULT_WORKERS = int(os.getenv("WEB_CONCURRENCY", "0")) or available_cpus()
+GRACEFUL_SHUTDOWN_SECONDS = float(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "20"))
+
+
+def event_loop() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def http_protocol() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def main():
+    workers = DEFAULT_WORKERS
+    invalidation_dir = None
+    if workers > 1 and not os.getenv(INVALIDATION_DIR_ENV):
+        # Inherited by the worker processes spawned below
+        invalidation_dir = tempfile.mkdtemp(prefix="catalog-invalidation-")
+        os.environ[INVALIDATION_DIR_ENV] = invalidation_dir
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info("🚀 Starting API server", extra={
+        "workers": workers,
+        "loop": event_loop(),
+        "http": http_protocol()
+    })
+    try:
+        uvicorn.run(
+            "main:app",
+            app_dir=os.path.dirname(os.path.abspath(__file__)),
+            host=os.getenv("HOST", "0.0.0.0"),
+            port=int(os.getenv("PORT", 8000)),
+            workers=workers,
+            loop=event_loop(),
+            http=http_protocol(),
+            timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+            # Requests are logged once by the app's sampled access log
+            access_log=False,
+            proxy_headers=True,
+            forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        )
+    finally:
+        if invalidation_dir:
+            shutil.rmtree(invalidation_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,100 +1,376 @@
 """
 Setup script to create Supabase storage bucket and upload product images.
-Run this once to initialize storage: python api/setup_storage.py
+Run it to initialize or sync storage: python api/setup_storage.py --help
+
+Uploads run on a bounded thread pool and stream each file from disk. A
+manifest of content hashes (see --manifest) records what is already in the
+bucket, so re-runs only upload new or changed images, and an interrupted run
+resumes where it stopped. Failed uploads are retried with backoff.
+
+New and changed images are first rendered to AVIF/WebP variants at several
+widths (see image_variants.py) in a process pool; the variants are uploaded
+with the originals and cached by browsers for a year.
 """
 
+import argparse
+import hashlib
+import json
 import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from image_variants import (
+    VARIANT_CACHE_CONTROL, VARIANT_FORMATS, VARIANT_WIDTHS, render_variants, variant_path, variant_paths,
+)
+from storage_urls import PRODUCT_IMAGES_BUCKET
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+BUCKET_NAME = PRODUCT_IMAGES_BUCKET
+IMAGES_DIR = Path("static/images/products")
+REMOTE_PREFIX = "products"
+# Kept next to api/.env rather than in static/, which is served publicly
+MANIFEST_PATH = Path("api/.storage-manifest.json")
+# Rendered variants are written here before upload
+VARIANTS_PATH = Path("api/.image-variants")
+
+# Image types the bucket accepts, by file extension
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+}
+
+BUCKET_OPTIONS = {
+    "public": True,
+    "file_size_limit": 5242880,  # 5MB limit
+    # Includes every variant format; Storage rejects uploads of any other type
+    "allowed_mime_types": sorted(set(CONTENT_TYPES.values()) | {"image/jpg"} | set(VARIANT_FORMATS.values())),
+}
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Persist the manifest at least this often while uploading, so a crash loses little
+MANIFEST_SAVE_INTERVAL = 5.0
 
-# Load environment variables
-load_dotenv('api/.env')
 
-# Initialize Supabase client
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_SERVICE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+@dataclass
+class ImageFile:
+    path: Path
+    remote_path: str
+    content_type: str
+    size: int
+    mtime_ns: int
+    sha256: str = ""
+    # Storage default (one hour) when None
+    cache_control: Optional[str] = None
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-    print("Error: Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in environment")
-    exit(1)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+@dataclass
+class UploadStats:
+    uploaded: int = 0
+    skipped: int = 0
+    failed: int = 0
+    bytes_uploaded: int = 0
+    elapsed: float = 0.0
 
-print("Connected to Supabase!")
-print(f"Project URL: {SUPABASE_URL}")
 
-# Create storage bucket
-BUCKET_NAME = "product-images"
+def connect() -> "Client":
+    """Supabase client from api/.env; exits when credentials are missing"""
+    from dotenv import load_dotenv
+    from supabase import create_client
 
-def create_bucket():
+    # Load environment variables
+    load_dotenv('api/.env')
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_service_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+    if not supabase_url or not supabase_service_key:
+        print("Error: Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in environment")
+        sys.exit(1)
+
+    supabase = create_client(supabase_url, supabase_service_key)
+    print("Connected to Supabase!")
+    print(f"Project URL: {supabase_url}")
+    return supabase
+
+def create_bucket(supabase: "Client"):
     """Create the product-images storage bucket"""
     try:
         # Check if bucket exists
         buckets = supabase.storage.list_buckets()
-        bucket_names = [b['name'] for b in buckets]
-        
+        bucket_names = [b.name for b in buckets]
+
         if BUCKET_NAME in bucket_names:
-            print(f"✓ Bucket '{BUCKET_NAME}' already exists")
+            # Buckets created before the variants existed reject their types
+            supabase.storage.update_bucket(BUCKET_NAME, BUCKET_OPTIONS)
+            print(f"✓ Bucket '{BUCKET_NAME}' already exists; updated allowed types")
             return True
-        
+
         # Create bucket with public access
-        result = supabase.storage.create_bucket(
-            BUCKET_NAME,
-            options={
-                "public": True,
-                "fileSizeLimit": 5242880,  # 5MB limit
-                "allowedMimeTypes": ["image/jpeg", "image/jpg", "image/png", "image/webp"]
-            }
-        )
+        supabase.storage.create_bucket(BUCKET_NAME, options=BUCKET_OPTIONS)
         print(f"✓ Created bucket '{BUCKET_NAME}'")
         return True
     except Exception as e:
         print(f"✗ Error creating bucket: {e}")
         return False
 
-def upload_images():
-    """Upload product images from static/images/products/"""
-    images_dir = Path("static/images/products")
-    
+def file_sha256(path: Path) -> str:
+    """Content hash, read in chunks so large images are never fully in memory"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def scan_images(images_dir: Path) -> List[ImageFile]:
+    """Image files under images_dir with their content type, in name order"""
+    images = []
+    for path in sorted(images_dir.iterdir()):
+        content_type = CONTENT_TYPES.get(path.suffix.lower())
+        if content_type is None or not path.is_file():
+            continue
+        images.append(image_file(path, f"{REMOTE_PREFIX}/{path.name}", content_type))
+    return images
+
+def image_file(path: Path, remote_path: str, content_type: str, cache_control: Optional[str] = None) -> ImageFile:
+    stat = path.stat()
+    return ImageFile(path, remote_path, content_type, stat.st_size, stat.st_mtime_ns, cache_control=cache_control)
+
+def render_images(images: List[ImageFile], out_dir: Path, processes: Optional[int] = None) -> List[ImageFile]:
+    """Render the variants of each image across worker processes (encoding is CPU bound)"""
+    variants = []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {
+            pool.submit(render_variants, str(image.path), image.remote_path, str(out_dir)): image
+            for image in images
+        }
+        for future in as_completed(futures):
+            image = futures[future]
+            try:
+                rendered = future.result()
+            except Exception as e:
+                print(f"✗ Error rendering variants of {image.path.name}: {e}")
+                continue
+            for remote_path, local_path in rendered:
+                content_type = VARIANT_FORMATS[remote_path.rsplit(".", 1)[1]]
+                variants.append(image_file(Path(local_path), remote_path, content_type, VARIANT_CACHE_CONTROL))
+    return variants
+
+
+class Manifest:
+    """
+    Uploaded objects keyed by remote path: {sha256, size, mtime_ns, content_type}.
+    Entries belong to one bucket URL; a manifest for another target is ignored
+    (target None, as in a dry run, accepts any).
+    """
+
+    def __init__(self, path: Path, target: Optional[str]):
+        self.path = path
+        self.target = target
+        self.entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def load(self) -> "Manifest":
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return self
+        except ValueError:
+            print(f"⚠ Ignoring unreadable manifest {self.path}")
+            return self
+        if self.target is None or data.get("target") == self.target:
+            self.entries = data.get("objects", {})
+        return self
+
+    def hash_of(self, image: ImageFile) -> str:
+        """Content hash, reusing the recorded one when size and mtime are unchanged"""
+        entry = self.entries.get(image.remote_path)
+        if entry and entry["size"] == image.size and entry["mtime_ns"] == image.mtime_ns:
+            return entry["sha256"]
+        return file_sha256(image.path)
+
+    def is_current(self, image: ImageFile) -> bool:
+        entry = self.entries.get(image.remote_path)
+        return bool(entry) and entry["sha256"] == image.sha256 and entry["content_type"] == image.content_type
+
+    def record(self, image: ImageFile):
+        with self._lock:
+            self.entries[image.remote_path] = {
+                "sha256": image.sha256,
+                "size": image.size,
+                "mtime_ns": image.mtime_ns,
+                "content_type": image.content_type,
+            }
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= MANIFEST_SAVE_INTERVAL:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _save(self):
+        # Write-then-rename so an interrupted run never leaves a truncated manifest
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"target": self.target, "objects": self.entries}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+
+def is_retryable(error: Exception) -> bool:
+    """Storage API 4xx errors (other than 429) will fail again; everything else may not"""
+    status = str(getattr(error, "status", ""))
+    return not (status.startswith("4") and status != "429")
+
+def is_duplicate(error: Exception) -> bool:
+    return str(getattr(error, "status", "")) == "409"
+
+def upload_image(bucket, image: ImageFile, upsert: bool, retries: int, backoff: float = 0.5):
+    """Stream one file to the bucket, retrying transient failures with jittered backoff"""
+    attempt = 0
+    while True:
+        try:
+            options = {"content-type": image.content_type, "upsert": "true" if upsert else "false"}
+            if image.cache_control:
+                options["cache-control"] = image.cache_control
+            with open(image.path, "rb") as f:
+                bucket.upload(image.remote_path, f, options)
+            return
+        except Exception as e:
+            if is_duplicate(e) and not upsert:
+                # In the bucket but not in the manifest (e.g. a lost manifest): overwrite it
+                upsert = True
+                continue
+            if attempt >= retries or not is_retryable(e):
+                raise
+            time.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
+            attempt += 1
+
+def upload_images(
+    supabase: Optional["Client"],
+    images_dir: Path,
+    manifest: Manifest,
+    workers: int = 8,
+    retries: int = 3,
+    dry_run: bool = False,
+    force: bool = False,
+    variants_dir: Optional[Path] = None,
+    processes: Optional[int] = None,
+) -> UploadStats:
+    """
+    Upload new and changed images from images_dir, recording each in the
+    manifest. With variants_dir, their variants are rendered there and
+    uploaded too.
+    """
+    stats = UploadStats()
+    started = time.perf_counter()
+
     if not images_dir.exists():
         print(f"✗ Images directory not found: {images_dir}")
-        return
-    
-    print(f"\nUploading images from {images_dir}...")
-    
-    image_files = list(images_dir.glob("*.jpg")) + list(images_dir.glob("*.png"))
-    
-    if not image_files:
+        return stats
+
+    print(f"\nScanning images in {images_dir}...")
+    images = scan_images(images_dir)
+    if not images:
         print("✗ No image files found")
+        return stats
+
+    pending = []
+    to_render = []
+    for image in images:
+        image.sha256 = manifest.hash_of(image)
+        current = not force and manifest.is_current(image)
+        if current:
+            stats.skipped += 1
+        else:
+            pending.append(image)
+        if variants_dir and not (current and all(path in manifest.entries for path in variant_paths(image.remote_path))):
+            to_render.append(image)
+    print(f"{len(pending)} to upload, {stats.skipped} unchanged")
+
+    if dry_run:
+        for image in pending:
+            print(f"  would upload {image.remote_path} ({image.content_type}, {image.size} bytes)")
+        if to_render:
+            print(f"  would render and upload variants of {len(to_render)} images")
+        stats.bytes_uploaded = sum(image.size for image in pending)
+        stats.elapsed = time.perf_counter() - started
+        return stats
+
+    if to_render:
+        print(f"Rendering variants of {len(to_render)} images...")
+        render_started = time.perf_counter()
+        variants = render_images(to_render, variants_dir, processes)
+        print(f"Rendered {len(variants)} variants in {time.perf_counter() - render_started:.1f}s")
+        for variant in variants:
+            variant.sha256 = file_sha256(variant.path)
+            # Re-rendering usually produces identical files, which need no upload
+            if not force and manifest.is_current(variant):
+                stats.skipped += 1
+            else:
+                pending.append(variant)
+
+    bucket = supabase.storage.from_(BUCKET_NAME)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                # Objects the manifest knows about already exist and must be overwritten
+                pool.submit(upload_image, bucket, image, image.remote_path in manifest.entries, retries): image
+                for image in pending
+            }
+            for future in as_completed(futures):
+                image = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    stats.failed += 1
+                    print(f"✗ Error uploading {image.path.name}: {e}")
+                    continue
+                manifest.record(image)
+                stats.uploaded += 1
+                stats.bytes_uploaded += image.size
+                print(f"✓ Uploaded {image.path.name} ({image.content_type})")
+    finally:
+        # Also on Ctrl-C, so the next run resumes after the completed uploads
+        manifest.save()
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+def uploaded_formats(images_dir: Path, manifest: Manifest) -> List[str]:
+    """Variant formats whose files are all in the bucket, per the manifest"""
+    images = scan_images(images_dir)
+    return [
+        fmt for fmt in VARIANT_FORMATS
+        if images and all(
+            variant_path(image.remote_path, width, fmt) in manifest.entries
+            for image in images for width in VARIANT_WIDTHS
+        )
+    ]
+
+def print_summary(stats: UploadStats, dry_run: bool):
+    megabytes = stats.bytes_uploaded / (1024 * 1024)
+    if dry_run:
+        print(f"\nWould upload {megabytes:.1f} MB; {stats.skipped} files unchanged")
         return
-    
-    for image_path in image_files:
-        try:
-            # Read image file
-            with open(image_path, 'rb') as f:
-                image_data = f.read()
-            
-            # Upload to Supabase Storage
-            file_path = f"products/{image_path.name}"
-            
-            result = supabase.storage.from_(BUCKET_NAME).upload(
-                file_path,
-                image_data,
-                {
-                    "content-type": "image/jpeg",
-                    "x-upsert": "true"  # Overwrite if exists
-                }
-            )
-            
-            # Get public URL
-            public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(file_path)
-            
-            print(f"✓ Uploaded {image_path.name}")
-            print(f"  URL: {public_url}")
-            
-        except Exception as e:
-            print(f"✗ Error uploading {image_path.name}: {e}")
+    elapsed = max(stats.elapsed, 1e-9)
+    print(f"\nUploaded {stats.uploaded} files ({megabytes:.1f} MB) in {stats.elapsed:.1f}s: "
+          f"{stats.uploaded / elapsed:.1f} files/s, {megabytes / elapsed:.2f} MB/s")
+    print(f"{stats.skipped} unchanged, {stats.failed} failed")
 
 def set_bucket_policies():
     """Set storage policies for public read access"""
@@ -112,33 +388,80 @@ def set_bucket_policies():
     except Exception as e:
         print(f"✗ Error: {e}")
 
-def main():
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", type=Path, default=IMAGES_DIR, help="directory of product images")
+    parser.add_argument("--manifest", type=Path, default=MANIFEST_PATH, help="upload manifest to read and update")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent uploads")
+    parser.add_argument("--retries", type=int, default=3, help="retries per file for transient errors")
+    parser.add_argument("--force", action="store_true", help="upload every file, ignoring the manifest")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be uploaded, without connecting")
+    parser.add_argument("--no-variants", action="store_true", help="upload the originals only")
+    parser.add_argument("--variants-dir", type=Path, default=VARIANTS_PATH, help="where variants are rendered")
+    parser.add_argument("--processes", type=int, help="processes rendering variants (default: CPU count)")
+    return parser.parse_args(argv)
+
+def variants_supported() -> bool:
+    """Pillow with WebP and AVIF encoders is needed to render variants"""
+    try:
+        from PIL import features
+    except ImportError:
+        print("⚠ Pillow is not installed (pip install pillow); skipping image variants")
+        return False
+    missing = [fmt for fmt in VARIANT_FORMATS if not features.check(fmt)]
+    if missing:
+        print(f"⚠ Pillow lacks {', '.join(missing)} support; skipping image variants")
+        return False
+    return True
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
     print("=" * 60)
     print("Supabase Storage Setup")
     print("=" * 60)
-    
-    # Step 1: Create bucket
-    print("\n1. Creating storage bucket...")
-    if not create_bucket():
-        print("Failed to create bucket. Exiting.")
-        return
-    
+
+    supabase = None
+    target = None
+    if not args.dry_run:
+        supabase = connect()
+        target = f"{os.getenv('SUPABASE_URL')}/{BUCKET_NAME}"
+        # Step 1: Create bucket
+        print("\n1. Creating storage bucket...")
+        if not create_bucket(supabase):
+            print("Failed to create bucket. Exiting.")
+            return 1
+
     # Step 2: Upload images
     print("\n2. Uploading product images...")
-    upload_images()
-    
+    manifest = Manifest(args.manifest, target).load()
+    variants_dir = None if args.no_variants or not variants_supported() else args.variants_dir
+    stats = upload_images(
+        supabase, args.dir, manifest, args.workers, args.retries, args.dry_run, args.force,
+        variants_dir, args.processes,
+    )
+    print_summary(stats, args.dry_run)
+    if args.dry_run:
+        return 0
+    if variants_dir:
+        # The API must not advertise a format until every variant of it is uploaded
+        formats = uploaded_formats(args.dir, manifest)
+        if formats:
+            print(f"Variants uploaded; set IMAGE_VARIANTS=true IMAGE_VARIANT_FORMATS={','.join(formats)} on the API")
+        else:
+            print("⚠ Some variants failed to upload; keep IMAGE_VARIANTS off until a re-run completes them")
+
     # Step 3: Set policies (manual step)
     print("\n3. Configuring storage policies...")
     set_bucket_policies()
-    
+
     print("\n" + "=" * 60)
-    print("Setup Complete!")
+    print("Setup Complete!" if not stats.failed else f"Setup finished with {stats.failed} failed uploads; re-run to retry them")
     print("=" * 60)
     print("\nNext steps:")
     print("1. Configure storage policies in Supabase Dashboard")
     print("2. Test image access in your application")
     print("3. Update backend to fetch images from Supabase")
+    return 1 if stats.failed else 0
 
 if __name__ == "__main__":
-    main()
-
+    sys.exit(main())
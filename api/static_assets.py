@@ -0,0 +1,267 @@
+"""
+Static file serving for /static.
+
+At startup every file under the directory is hashed into a manifest that
+maps its logical path to a fingerprinted URL
+(`images/products/pineapple.jpg` -> `/static/images/products/pineapple.<hash>.jpg`,
+published at /static/asset-manifest.json). Fingerprinted URLs change whenever
+the content does, so they are served with `Cache-Control: immutable` and
+browsers never revalidate them; logical paths keep working with a short
+cache lifetime.
+
+Precompressed `.br` / `.gz` siblings (see `precompress`) are served to
+clients that accept them, with per-encoding strong ETags, so nothing is
+compressed per request. Responses come from Starlette's FileResponse:
+conditional requests get 304, Range/If-Range get 206, and servers that offer
+the ASGI pathsend extension send the file without copying it through Python.
+
+Files are re-statted on every request. Files added after startup, or changed
+since, are served by plain StaticFiles (their fingerprinted URLs 404) until
+the next restart rebuilds the manifest.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from typing import Dict, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = os.getenv("STATIC_CACHE_CONTROL", "public, max-age=3600")
+
+# Content-Encoding -> sibling suffix, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+MANIFEST_NAME = "asset-manifest.json"
+FINGERPRINT_LENGTH = 12
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Types worth precompressing; images and fonts are compressed already
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+MIN_COMPRESS_SIZE = 1024
+
+Stat = os.stat_result
+
+
+@dataclass
+class Asset:
+    path: str
+    stat: Stat
+    content_type: str
+    digest: str
+    # Content-Encoding -> (path, stat) of precompressed siblings
+    encoded: Dict[str, Tuple[str, Stat]] = field(default_factory=dict)
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.stat.st_mtime, usegmt=True)
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        # Each representation needs its own strong ETag
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+def fingerprinted(path: str, digest: str) -> str:
+    """`images/a.jpg` -> `images/a.<digest>.jpg`"""
+    directory, _, name = path.rpartition("/")
+    stem, dot, suffix = name.rpartition(".")
+    name = f"{stem}.{digest}.{suffix}" if dot and stem else f"{name}.{digest}"
+    return f"{directory}/{name}" if directory else name
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Parse Accept-Encoding into coding -> q-value"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                q = float(value)
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def negotiate(accept_encoding: str, available) -> Optional[str]:
+    """Preferred available encoding the client accepts, or None for identity"""
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def current_stat(asset: Asset, file_path: str) -> Optional[Stat]:
+    """Fresh stat of file_path, or None if the asset's source changed since it was hashed"""
+    try:
+        source = os.stat(asset.path)
+        if (source.st_size, source.st_mtime_ns) != (asset.stat.st_size, asset.stat.st_mtime_ns):
+            return None
+        return source if file_path == asset.path else os.stat(file_path)
+    except OSError:
+        return None
+
+
+class StaticAssets(StaticFiles):
+    """StaticFiles with a fingerprint manifest, immutable caching and precompressed siblings."""
+
+    def __init__(self, directory: str, url_prefix: str = "/static"):
+        super().__init__(directory=directory)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.loaded = False
+        self.manifest: Dict[str, str] = {}
+        self._assets: Dict[str, Asset] = {}
+        self._fingerprinted: Dict[str, str] = {}
+
+    def load(self):
+        """Hash every file under the directory; blocking, so run it in a thread"""
+        assets = {}
+        siblings = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                if any(path.endswith(suffix) for suffix in ENCODINGS.values()):
+                    siblings.append(path)
+                    continue
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                assets[path] = Asset(full_path, os.stat(full_path), content_type, file_digest(full_path))
+
+        for path in siblings:
+            source, _, suffix = path.rpartition(".")
+            encoding = next(e for e, s in ENCODINGS.items() if s == "." + suffix)
+            full_path = os.path.join(self.directory, path)
+            stat = os.stat(full_path)
+            if source in assets:
+                # A sibling older than its source is stale; serve the source instead
+                if stat.st_mtime >= assets[source].stat.st_mtime:
+                    assets[source].encoded[encoding] = (full_path, stat)
+            else:
+                # A standalone .gz/.br file is an ordinary download
+                assets[path] = Asset(full_path, stat, "application/octet-stream", file_digest(full_path))
+
+        self._assets = assets
+        self._fingerprinted = {fingerprinted(path, asset.digest): path for path, asset in assets.items()}
+        self.manifest = {path: f"{self.url_prefix}/{name}" for name, path in self._fingerprinted.items()}
+        self.loaded = True
+        logger.info("📦 Static asset manifest built", extra={
+            "asset_count": len(assets),
+            "precompressed": sum(len(asset.encoded) for asset in assets.values())
+        })
+
+    def url_for(self, path: str) -> str:
+        """Fingerprinted URL of a file under the directory, or its plain URL if unknown"""
+        return self.manifest.get(path, f"{self.url_prefix}/{path}")
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if not self.loaded:
+            await anyio.to_thread.run_sync(self.load)
+        path = path.replace(os.sep, "/")
+        if path == MANIFEST_NAME and MANIFEST_NAME not in self._assets:
+            return Response(json.dumps(self.manifest), media_type="application/json",
+                             headers={"Cache-Control": "no-cache"})
+
+        logical = self._fingerprinted.get(path)
+        asset = self._assets.get(logical or path)
+        if asset is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+
+        request_headers = Headers(scope=scope)
+        file_path, encoding = asset.path, None
+        # Ranges always refer to the identity representation
+        if asset.encoded and "range" not in request_headers:
+            encoding = negotiate(request_headers.get("accept-encoding", ""), asset.encoded)
+            if encoding:
+                file_path = asset.encoded[encoding][0]
+
+        stat = await anyio.to_thread.run_sync(current_stat, asset, file_path)
+        if stat is None:
+            # Changed or removed since the manifest was built: its digest no longer describes it
+            return await super().get_response(path, scope)
+
+        headers = {
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if logical else DEFAULT_CACHE_CONTROL,
+            "ETag": asset.etag(encoding),
+            # Last-Modified of the source, whichever representation is sent
+            "Last-Modified": asset.last_modified,
+        }
+        if asset.encoded:
+            headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        response = FileResponse(file_path, stat_result=stat, headers=headers, media_type=asset.content_type)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def precompress(directory: str) -> int:
+    """
+    Write `.gz` (and `.br`, when the brotli package is installed) siblings
+    for compressible files under directory that lack an up-to-date one.
+    Returns the number of files written.
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if any(name.endswith(suffix) for suffix in ENCODINGS.values()):
+                continue
+            path = os.path.join(root, name)
+            content_type = mimetypes.guess_type(name)[0] or ""
+            stat = os.stat(path)
+            if not content_type.startswith(COMPRESSIBLE_TYPES) or stat.st_size < MIN_COMPRESS_SIZE:
+                continue
+            for suffix in ENCODINGS.values():
+                target = path + suffix
+                if suffix == ".br" and brotli is None:
+                    continue
+                if os.path.exists(target) and os.stat(target).st_mtime >= stat.st_mtime:
+                    continue
+                if suffix == ".gz":
+                    # mtime=0 keeps the output byte-for-byte reproducible
+                    with open(path, "rb") as src, open(target, "wb") as raw, \
+                            gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=9, mtime=0) as dst:
+                        shutil.copyfileobj(src, dst)
+                else:
+                    with open(path, "rb") as src, open(target, "wb") as dst:
+                        dst.write(brotli.compress(src.read(), quality=11))
+                written += 1
+    return written
+
+
+if __name__ == "__main__":
+    import sys
+
+    directory = sys.argv[1] if len(sys.argv) > 1 else "static"
+    print(f"Wrote {precompress(directory)} precompressed files under {directory}")
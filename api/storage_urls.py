@@ -0,0 +1,45 @@
+"""
+Public URL resolution for Supabase Storage objects.
+
+Public object URLs are a pure function of the project URL, the bucket and the
+object path, so they are derived locally and memoized per path instead of
+going through the storage client for every product on every request.
+"""
+
+import os
+from typing import Dict, Optional
+from urllib.parse import quote
+
+# Bucket holding the product images (see setup_storage.py)
+PRODUCT_IMAGES_BUCKET = "product-images"
+
+
+class PublicUrlResolver:
+    """Memoized `path -> public URL` mapping for a single bucket."""
+
+    def __init__(self, supabase_url: str, bucket: str, cdn_base_url: Optional[str] = None):
+        if cdn_base_url:
+            # A CDN in front of storage serves `<cdn>/<bucket>/<path>`
+            base = cdn_base_url.rstrip("/")
+        else:
+            base = f"{supabase_url.rstrip('/')}/storage/v1/object/public"
+        self.bucket = bucket
+        self._prefix = f"{base}/{quote(bucket, safe='')}/"
+        self._urls: Dict[str, str] = {}
+
+    def __call__(self, path: str) -> str:
+        url = self._urls.get(path)
+        if url is None:
+            parts = [quote(part, safe="") for part in path.split("/") if part]
+            url = self._prefix + "/".join(parts)
+            self._urls[path] = url
+        return url
+
+
+def product_image_urls(supabase_url: str) -> PublicUrlResolver:
+    """Resolver for the product images bucket, honouring STORAGE_CDN_URL."""
+    return PublicUrlResolver(
+        supabase_url,
+        PRODUCT_IMAGES_BUCKET,
+        cdn_base_url=os.getenv("STORAGE_CDN_URL"),
+    )
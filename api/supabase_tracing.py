@@ -0,0 +1,218 @@
+"""
+Spans and metrics for Supabase calls.
+
+The Sentry Python SDK has no Supabase integration (see SENTRY_ISSUES.md), so
+PostgREST queries and Edge Function calls show up as unexplained time inside
+the /products and /orders transactions. InstrumentedClient wraps the
+Supabase client so every PostgREST query (`table(...)...execute()`,
+`rpc(...).execute()`), storage bucket call and `functions.invoke` goes
+through SupabaseTracer.span, which:
+
+- observes a latency histogram labelled by service (db/storage/functions),
+  target (table, function or bucket) and operation, plus the rows returned
+  per query;
+- when the current transaction is sampled, records a child span carrying the
+  same attributes and the query shape. Filters are recorded by column only,
+  never by value.
+
+Calls made outside the client, such as the create-order Edge Function POST,
+use SupabaseTracer.span directly.
+
+Unsampled calls cost one context-variable lookup and a histogram observation;
+no span is created. Queries run in thread pools, so pools must run them in a
+copy of the caller's context (`contextvars.copy_context().run`) for the spans
+to attach to the request's transaction.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Tuple
+
+import sentry_sdk
+
+# Sentry span op per service
+SPAN_OPS = {"db": "db", "storage": "file.supabase", "functions": "function.supabase"}
+
+# Builder methods that set the query's operation
+OPERATIONS = ("select", "insert", "upsert", "update", "delete")
+# Filters whose first argument carries values rather than a column name
+VALUE_FILTERS = ("or_",)
+
+# Rows returned per query, for the row-count histogram
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000)
+
+# Storage bucket methods that only build URLs locally
+LOCAL_STORAGE_METHODS = ("get_public_url",)
+
+
+def row_count(response: Any) -> int:
+    data = getattr(response, "data", None)
+    if isinstance(data, list):
+        return len(data)
+    return 0 if data is None else 1
+
+
+class SupabaseTracer:
+    """Times Supabase calls into histograms and, when sampled, Sentry spans."""
+
+    def __init__(self, latency=None, rows=None):
+        # Optional histograms: (seconds, service, target, operation, outcome) and (rows, table, operation).
+        # Observed from query pool threads; Histogram locks internally
+        self.latency = latency
+        self.rows = rows
+
+    @contextmanager
+    def span(self, service: str, target: str, operation: str) -> Iterator[Optional[Any]]:
+        """Time one call; yields the Sentry span, or None when the transaction is not sampled."""
+        parent = sentry_sdk.get_current_span()
+        span = None
+        if parent is not None and parent.sampled:
+            # Not entered on the scope: queries finish on pool threads, concurrently with the request
+            span = parent.start_child(op=SPAN_OPS[service], name=f"{operation} {target}", origin="manual.supabase")
+            span.set_data("supabase.service", service)
+            span.set_data("supabase.target", target)
+            span.set_data("supabase.operation", operation)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            yield span
+            outcome = "ok"
+        finally:
+            elapsed = time.perf_counter() - started
+            if span is not None:
+                # Callers may have set a more specific status, e.g. from an HTTP response
+                if span.status is None:
+                    span.set_status("ok" if outcome == "ok" else "internal_error")
+                span.finish()
+            if self.latency is not None:
+                self.latency.observe(elapsed, service, target, operation, outcome)
+
+    def observe_rows(self, table: str, operation: str, rows: int):
+        if self.rows is not None:
+            self.rows.observe(rows, table, operation)
+
+
+class InstrumentedQuery:
+    """PostgREST request builder whose execute() is traced."""
+
+    def __init__(self, builder, tracer: SupabaseTracer, table: str, operation: str = "query",
+                 shape: Tuple[str, ...] = ()):
+        self._builder = builder
+        self._tracer = tracer
+        self._table = table
+        self._operation = operation
+        # Builder calls so far, e.g. ("select(id,name)", "gt(id)", "limit")
+        self._shape = shape
+
+    def _wrap(self, result, name: str, args: tuple):
+        if not hasattr(result, "execute"):
+            return result
+        operation = name if name in OPERATIONS else self._operation
+        if args and isinstance(args[0], str) and name not in VALUE_FILTERS:
+            step = f"{name}({args[0]})"
+        else:
+            step = name
+        return InstrumentedQuery(result, self._tracer, self._table, operation, self._shape + (step,))
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            # Properties such as `not_` return builders too
+            return self._wrap(attr, name, ())
+
+        def call(*args, **kwargs):
+            return self._wrap(attr(*args, **kwargs), name, args)
+
+        return call
+
+    def execute(self):
+        with self._tracer.span("db", self._table, self._operation) as span:
+            response = self._builder.execute()
+            rows = row_count(response)
+            self._tracer.observe_rows(self._table, self._operation, rows)
+            if span is not None:
+                span.set_data("db.system", "postgresql")
+                span.set_data("db.operation", self._operation)
+                span.set_data("db.query", ".".join(self._shape))
+                span.set_data("db.rows", rows)
+        return response
+
+
+class InstrumentedBucket:
+    """Storage bucket whose remote calls are traced."""
+
+    def __init__(self, bucket, tracer: SupabaseTracer, bucket_id: str):
+        self._bucket = bucket
+        self._tracer = tracer
+        self._bucket_id = bucket_id
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._bucket, name)
+        if not callable(attr) or name.startswith("_") or name in LOCAL_STORAGE_METHODS:
+            return attr
+
+        def call(*args, **kwargs):
+            with self._tracer.span("storage", self._bucket_id, name) as span:
+                if span is not None and args and isinstance(args[0], str):
+                    span.set_data("storage.path", args[0])
+                return attr(*args, **kwargs)
+
+        return call
+
+
+class InstrumentedStorage:
+    def __init__(self, storage, tracer: SupabaseTracer):
+        self._storage = storage
+        self._tracer = tracer
+
+    def from_(self, bucket_id: str) -> InstrumentedBucket:
+        return InstrumentedBucket(self._storage.from_(bucket_id), self._tracer, bucket_id)
+
+    def __getattr__(self, name: str):
+        return getattr(self._storage, name)
+
+
+class InstrumentedFunctions:
+    def __init__(self, functions, tracer: SupabaseTracer):
+        self._functions = functions
+        self._tracer = tracer
+
+    def invoke(self, function_name: str, *args, **kwargs):
+        with self._tracer.span("functions", function_name, "invoke"):
+            return self._functions.invoke(function_name, *args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._functions, name)
+
+
+class InstrumentedClient:
+    """Supabase client whose queries, storage and function calls are traced; anything else passes through."""
+
+    def __init__(self, client, tracer: SupabaseTracer):
+        self._client = client
+        self._tracer = tracer
+        self._storage: Optional[InstrumentedStorage] = None
+        self._functions: Optional[InstrumentedFunctions] = None
+
+    def table(self, table_name: str) -> InstrumentedQuery:
+        return InstrumentedQuery(self._client.table(table_name), self._tracer, table_name)
+
+    from_ = table
+
+    def rpc(self, fn: str, params: Optional[dict] = None, *args, **kwargs) -> InstrumentedQuery:
+        return InstrumentedQuery(self._client.rpc(fn, params, *args, **kwargs), self._tracer, fn, "rpc")
+
+    @property
+    def storage(self) -> InstrumentedStorage:
+        if self._storage is None:
+            self._storage = InstrumentedStorage(self._client.storage, self._tracer)
+        return self._storage
+
+    @property
+    def functions(self) -> InstrumentedFunctions:
+        if self._functions is None:
+            self._functions = InstrumentedFunctions(self._client.functions, self._tracer)
+        return self._functions
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# main.py imports its sibling modules directly (as it does when deployed from api/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def injected_supabase(monkeypatch):
+    """For tests that set main.supabase / main.product_repository themselves: keep them from being rebuilt"""
+    import api.main as main
+
+    monkeypatch.setattr(main, "init_supabase", lambda: None)
+    return main
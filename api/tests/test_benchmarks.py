@@ -0,0 +1,58 @@
+from benchmarks.fakes import _filter_rows, make_products
+from benchmarks.run import compare, percentile, summarize
+from benchmarks.startup import parse_importtime
+
+
+def test_percentiles_and_summary():
+    latencies = [i / 1000 for i in range(1, 101)]
+    assert percentile(sorted(latencies), 50) == 0.05
+    assert percentile(sorted(latencies), 99) == 0.099
+
+    summary = summarize(latencies, elapsed=2.0, statuses={200: 98, 503: 1, 0: 1})
+    assert summary["p50_ms"] == 50.0
+    assert summary["p95_ms"] == 95.0
+    assert summary["rps"] == 50.0
+    assert summary["errors"] == 2
+    assert summary["statuses"] == {"0": 1, "200": 98, "503": 1}
+
+
+def test_compare_flags_latency_throughput_and_error_regressions():
+    base = {"scenarios": {"products": {"p95_ms": 10.0, "p99_ms": 20.0, "rps": 1000.0, "errors": 0}}}
+    same = {"scenarios": {"products": {"p95_ms": 10.5, "p99_ms": 21.0, "rps": 950.0, "errors": 0}}}
+    worse = {"scenarios": {"products": {"p95_ms": 15.0, "p99_ms": 20.0, "rps": 700.0, "errors": 3}}}
+
+    assert compare(base, same, threshold=0.1) == []
+    assert compare(base, worse, threshold=0.1) == [
+        "products: p95_ms 10.0 -> 15.0",
+        "products: rps 1000.0 -> 700.0",
+        "products: errors 0 -> 3",
+    ]
+
+
+def test_fake_postgrest_applies_repository_filters():
+    rows = make_products(30)
+    params = {
+        "select": "id,name",
+        "id": "gt." + rows[4]["id"],
+        "price": "lte.26.99",
+        "order": "id.asc",
+        "limit": "2",
+    }
+    assert _filter_rows(rows, params) == [
+        {"id": rows[5]["id"], "name": "Pineapple Product 6"},
+        {"id": rows[6]["id"], "name": "Pineapple Product 7"},
+    ]
+
+
+def test_parse_importtime_keeps_nesting():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       120 |        120 |     fastapi.types",
+        "import time:       300 |        420 |   fastapi",
+        "import time:      1000 |       1500 | main",
+    ])
+    assert parse_importtime(stderr) == [
+        (120, 120, "     fastapi.types"),
+        (300, 420, "   fastapi"),
+        (1000, 1500, " main"),
+    ]
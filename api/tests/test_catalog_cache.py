@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from catalog_cache import CatalogCache, FRESH, MISS, STALE
+from circuit_breaker import CircuitOpenError
+
+
+class Loader:
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+        self.fail = False
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail == "open":
+            raise CircuitOpenError("supabase-db", 30.0)
+        if self.fail:
+            raise RuntimeError("supabase down")
+        return [{"id": str(self.calls)}]
+
+
+def test_cold_requests_share_a_single_load():
+    loader = Loader(delay=0.05)
+    cache = CatalogCache(loader, ttl=60)
+
+    async def run():
+        return await asyncio.gather(*(cache.get() for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert loader.calls == 1
+    assert all(state == MISS for _, state in results)
+
+
+def test_serves_stale_copy_while_refreshing_once():
+    loader = Loader(delay=0.05)
+    cache = CatalogCache(loader, ttl=60)
+
+    async def run():
+        await cache.get()
+        assert (await cache.get())[1] == FRESH
+        cache.ttl = 0
+        stale = await asyncio.gather(*(cache.get() for _ in range(5)))
+        await asyncio.sleep(0.1)
+        cache.ttl = 60
+        return stale, await cache.get()
+
+    stale, refreshed = asyncio.run(run())
+    assert all(products == [{"id": "1"}] and state == STALE for products, state in stale)
+    assert loader.calls == 2
+    assert refreshed == ([{"id": "2"}], FRESH)
+    assert cache.generation == 2
+
+
+def test_failed_refresh_keeps_stale_copy():
+    loader = Loader()
+    cache = CatalogCache(loader, ttl=0)
+
+    async def run():
+        await cache.get()
+        loader.fail = True
+        await cache.get()
+        await asyncio.sleep(0.01)
+        return await cache.get()
+
+    products, state = asyncio.run(run())
+    assert products == [{"id": "1"}]
+    assert state == STALE
+
+
+def test_raises_when_nothing_is_cached():
+    loader = Loader()
+    loader.fail = True
+    cache = CatalogCache(loader)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get())
+    assert not cache.has_data
+
+
+def test_invalidate_triggers_refresh():
+    loader = Loader()
+    cache = CatalogCache(loader, ttl=60)
+
+    async def run():
+        await cache.get()
+        cache.invalidate()
+        await asyncio.sleep(0.01)
+        return await cache.get()
+
+    assert asyncio.run(run()) == ([{"id": "2"}], FRESH)
+
+
+def test_invalidation_during_refresh_loads_again():
+    loader = Loader(delay=0.05)
+    cache = CatalogCache(loader, ttl=60)
+
+    async def run():
+        await cache.get()
+        cache.invalidate()
+        await asyncio.sleep(0.01)
+        # Arrives while the refresh's query is in flight: its result may predate the change
+        cache.invalidate()
+        await asyncio.sleep(0.15)
+        return await cache.get()
+
+    assert asyncio.run(run()) == ([{"id": "3"}], FRESH)
+    assert loader.calls == 3
+
+
+def test_encoded_once_per_generation():
+    loader = Loader()
+    cache = CatalogCache(loader, ttl=60)
+    asyncio.run(cache.get())
+
+    body, etag = cache.encoded()
+    assert body == b'[{"id":"1"}]'
+    assert cache.encoded()[0] is body
+
+    cache.set([{"id": "2"}])
+    new_body, new_etag = cache.encoded()
+    assert new_body == b'[{"id":"2"}]'
+    assert new_etag != etag
+
+
+def test_no_refreshes_while_circuit_open(caplog):
+    loader = Loader()
+    cache = CatalogCache(loader, ttl=0)
+
+    async def run():
+        await cache.get()
+        loader.fail = "open"
+        for _ in range(20):
+            assert (await cache.get())[1] == STALE
+            await asyncio.sleep(0)
+        # Invalidations wait for the breaker too
+        cache.invalidate()
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert loader.calls == 2
+    assert [r.message for r in caplog.records] == ["Catalog circuit open, serving stale copy"]
@@ -0,0 +1,117 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import api.main as main
+from catalog_changes import CatalogChangeFeed, ProductIndex
+
+
+def project(row):
+    return {"id": str(row["id"]), "name": row["name"], "price": float(row["price"])}
+
+
+def row(id, name="Pineapple", price="1.00"):
+    return {"id": id, "name": name, "price": price}
+
+
+def test_index_applies_inserts_updates_and_deletes():
+    index = ProductIndex(project)
+    assert not index.apply("INSERT", row("0"), None)  # ignored until loaded
+
+    index.load([project(row("1")), project(row("2"))])
+    assert index.apply("UPDATE", row("1", price="2.50"), {"id": "1"})
+    assert not index.apply("UPDATE", row("1", price="2.50"), {"id": "1"})
+    assert index.apply("INSERT", row("3"), None)
+    assert index.apply("DELETE", None, {"id": "2"})
+    assert not index.apply("DELETE", None, {"id": "2"})
+
+    assert index.products() == [
+        {"id": "1", "name": "Pineapple", "price": 2.5},
+        {"id": "3", "name": "Pineapple", "price": 1.0},
+    ]
+
+
+def test_changes_during_a_load_are_replayed_over_the_snapshot():
+    index = ProductIndex(project)
+    index.load([project(row("1"))])
+
+    since = index.begin_load()
+    # Applied while the snapshot query runs; the snapshot predates both changes
+    index.apply("UPDATE", row("1", price="9.99"), {"id": "1"})
+    index.apply("INSERT", row("2"), None)
+    index.load([project(row("1"))], since)
+    assert index.price_of("1") == 9.99
+    assert index.price_of("2") == 1.0
+
+
+def test_load_catalog_keeps_changes_made_during_the_query(monkeypatch):
+    index = ProductIndex(lambda row: main.project_row(row, main.DEFAULT_FIELDS))
+    monkeypatch.setattr(main, "product_index", index)
+    monkeypatch.setattr(main, "image_url_for", lambda path: path)
+    snapshot = [{"id": "1", "name": "Pineapple", "price": "1.00", "image_path": "p.jpg", "description": ""}]
+
+    class Repository:
+        async def list_products(self):
+            main.apply_catalog_change("UPDATE", dict(snapshot[0], price="2.00"), {"id": "1"})
+            return snapshot
+
+    monkeypatch.setattr(main, "product_repository", Repository())
+    products = asyncio.run(main.load_catalog())
+    assert products[0]["price"] == 2.0
+    assert index.price_of("1") == 2.0
+
+def test_feed_reports_subscription_loss_and_retries():
+    events = []
+    feed = CatalogChangeFeed(
+        on_change=lambda *change: events.append(change),
+        on_subscribed=lambda: events.append("subscribed"),
+        on_unsubscribed=lambda: events.append("unsubscribed"),
+    )
+    sessions = []
+
+    async def fake_session(url, key):
+        sessions.append(url)
+        feed.subscribed = True
+        feed._on_subscribed()
+        feed.handle({"data": {"type": "UPDATE", "record": {"id": 1}, "old_record": {"id": 1}}})
+        raise ConnectionError("socket closed")
+
+    feed._session = fake_session
+
+    async def scenario():
+        feed.start("http://supabase.test", "key")
+        await asyncio.sleep(1.2)
+        await feed.stop()
+
+    asyncio.run(scenario())
+    assert len(sessions) == 2
+    assert events[:3] == ["subscribed", ("UPDATE", {"id": 1}, {"id": 1}), "unsubscribed"]
+
+
+def test_products_reflect_pushed_price_change_without_reload(monkeypatch, injected_supabase):
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return [{"id": "7", "name": "Pineapple Flag", "price": 79.99, "image": "flag.jpg", "description": ""}]
+
+    monkeypatch.setattr(main, "product_repository", object())
+    monkeypatch.setattr(main, "image_url_for", lambda path: f"https://cdn.test/{path}")
+    monkeypatch.setattr(main.catalog_cache, "_loader", loader)
+    main.catalog_cache.clear()
+    client = TestClient(main.app)
+    try:
+        first = client.get("/products").json()
+        main.product_index.load(first)
+        main.apply_catalog_change(
+            "UPDATE",
+            {"id": 7, "name": "Pineapple Flag", "price": "59.99", "image_path": "flag.jpg", "description": None},
+            {"id": 7},
+        )
+        second = client.get("/products")
+    finally:
+        main.catalog_cache.clear()
+
+    assert second.json()[0]["price"] == 59.99
+    assert second.headers["X-Cache"] == "fresh"
+    assert loads == [1]
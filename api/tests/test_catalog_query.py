@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.main as main
+from catalog_query import CatalogQuery, parse_cursor
+from product_repository import ProductRepository
+
+ROWS = [{"id": "11111111-1111-1111-1111-111111111111", "name": "Whole Pineapple", "price": "19.99"}]
+
+
+class RecordingBuilder:
+    """PostgREST request builder stand-in that records the calls made on it."""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def __getattr__(self, name):
+        def call(*args):
+            self.calls.append((name, *args))
+            return self
+
+        return call
+
+    def execute(self):
+        return SimpleNamespace(data=ROWS)
+
+
+class RecordingClient:
+    def __init__(self):
+        self.calls = []
+
+    def table(self, name):
+        self.calls.append(("table", name))
+        return RecordingBuilder(self.calls)
+
+
+def test_page_query_is_pushed_down():
+    client = RecordingClient()
+    repository = ProductRepository(client)
+    query = CatalogQuery(
+        fields=("name", "price"), limit=20, cursor="abc",
+        min_price=10, max_price=50, name="50%_off*",
+    )
+
+    try:
+        rows = asyncio.run(repository.list_page(query))
+    finally:
+        repository.close()
+
+    assert rows == ROWS
+    assert client.calls == [
+        ("table", "products"),
+        ("select", "id,name,price"),
+        ("gt", "id", "abc"),
+        ("gte", "price", 10),
+        ("lte", "price", 50),
+        # % and _ are escaped; * (a wildcard to PostgREST) may only stand for itself or one other character
+        ("ilike", "name", "%50\\%\\_off_%"),
+        ("order", "id"),
+        ("limit", 21),
+    ]
+
+
+def test_parse_cursor():
+    assert parse_cursor(None) is None
+    assert parse_cursor("11111111-1111-1111-1111-11111111111A") == "11111111-1111-1111-1111-11111111111a"
+    with pytest.raises(ValueError):
+        parse_cursor("1' or 1=1")
+    # Fallback catalog ids are not UUIDs
+    assert parse_cursor("3", uuid=False) == "3"
+
+
+def test_bad_cursor_is_rejected_before_querying(monkeypatch, injected_supabase):
+    class Repository:
+        async def list_page(self, query):
+            raise AssertionError("queried with an invalid cursor")
+
+    monkeypatch.setattr(main, "product_repository", Repository())
+    response = TestClient(main.app).get("/products", params={"cursor": "1' or 1=1"})
+    assert response.status_code == 400
+    assert main.supabase_db_breaker.state == "closed"
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    BreakerSettings,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+from product_repository import is_client_error
+
+SETTINGS = BreakerSettings(
+    deadline=0.05, window=4, min_calls=4, error_rate=0.5,
+    slow_call_duration=0.02, slow_call_rate=0.75, open_duration=0.05,
+)
+
+
+async def ok():
+    return "ok"
+
+
+async def boom():
+    raise RuntimeError("supabase down")
+
+
+async def slow():
+    await asyncio.sleep(0.03)
+    return "slow"
+
+
+async def hang():
+    await asyncio.sleep(1)
+
+
+async def call_all(breaker, fns):
+    results = []
+    for fn in fns:
+        try:
+            results.append(await breaker.call(fn))
+        except Exception as e:
+            results.append(type(e).__name__)
+    return results
+
+
+def test_opens_on_error_rate_and_fails_fast():
+    breaker = CircuitBreaker("db", SETTINGS)
+    results = asyncio.run(call_all(breaker, [ok, boom, ok, boom, ok]))
+    assert results == ["ok", "RuntimeError", "ok", "RuntimeError", "CircuitOpenError"]
+    assert breaker.state == OPEN
+
+
+def test_opens_on_slow_calls_and_deadline():
+    breaker = CircuitBreaker("db", SETTINGS)
+    results = asyncio.run(call_all(breaker, [slow, slow, slow, hang, ok]))
+    assert results[:3] == ["slow"] * 3
+    assert results[3] == "TimeoutError"
+    assert results[4] == "CircuitOpenError"
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = CircuitBreaker("db", SETTINGS)
+
+    async def run():
+        await call_all(breaker, [boom] * 4)
+        assert breaker.state == OPEN
+        await asyncio.sleep(0.06)
+        assert breaker.state == HALF_OPEN
+        await call_all(breaker, [boom])
+        assert breaker.state == OPEN
+        await asyncio.sleep(0.06)
+        assert await breaker.call(ok) == "ok"
+        return breaker.state
+
+    assert asyncio.run(run()) == CLOSED
+
+
+def test_excluded_errors_do_not_trip():
+    breaker = CircuitBreaker("edge", SETTINGS, is_failure=lambda e: not isinstance(e, ValueError))
+
+    async def rejected():
+        raise ValueError("bad order")
+
+    asyncio.run(call_all(breaker, [rejected] * 6))
+    assert breaker.state == CLOSED
+
+
+def test_open_error_reports_retry_after():
+    breaker = CircuitBreaker("db", SETTINGS)
+
+    async def run():
+        await call_all(breaker, [boom] * 4)
+        await breaker.call(ok)
+
+    with pytest.raises(CircuitOpenError) as info:
+        asyncio.run(run())
+    assert 0 < info.value.retry_after <= SETTINGS.open_duration
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("SUPABASE_DB_DEADLINE", "1.5")
+    monkeypatch.setenv("SUPABASE_DB_MIN_CALLS", "9")
+    settings = BreakerSettings.from_env("SUPABASE_DB", open_duration=10.0)
+    assert settings.deadline == 1.5
+    assert settings.min_calls == 9
+    assert settings.open_duration == 10.0
+
+
+def test_client_errors_do_not_trip_the_breaker():
+    class APIError(Exception):
+        def __init__(self, code):
+            super().__init__(code)
+            self.code = code
+
+    assert is_client_error(APIError("22P02"))
+    assert is_client_error(APIError("PGRST100"))
+    assert is_client_error(APIError(404))
+    assert not is_client_error(APIError("57014"))
+    assert not is_client_error(APIError(503))
+    assert not is_client_error(TimeoutError())
+
+    breaker = CircuitBreaker("test", BreakerSettings(min_calls=2), is_failure=lambda e: not is_client_error(e))
+
+    async def bad_request():
+        raise APIError("22P02")
+
+    async def run():
+        for _ in range(5):
+            with pytest.raises(APIError):
+                await breaker.call(bad_request)
+
+    asyncio.run(run())
+    assert breaker.state == "closed"
+
@@ -0,0 +1,20 @@
+from circuit_breaker import BreakerSettings
+from http_sessions import UpstreamSettings
+from rate_limit import RateLimitSettings
+
+
+def test_settings_read_prefixed_variables_by_field_type(monkeypatch):
+    monkeypatch.setenv("TEST_POOL_LIMIT", "20.0")
+    monkeypatch.setenv("TEST_TOTAL_TIMEOUT", "7.5")
+    monkeypatch.setenv("TEST_READ_TIMEOUT", "")
+    upstream = UpstreamSettings.from_env("TEST", read_timeout=10.0)
+    assert upstream.pool_limit == 20 and isinstance(upstream.pool_limit, int)
+    assert upstream.total_timeout == 7.5
+    assert upstream.read_timeout == 10.0
+    assert upstream.connect_timeout == UpstreamSettings().connect_timeout
+
+    monkeypatch.setenv("TEST_WINDOW", "50")
+    assert BreakerSettings.from_env("TEST", deadline=3.0) == BreakerSettings(deadline=3.0, window=50)
+
+    monkeypatch.setenv("TEST_BURST", "5")
+    assert RateLimitSettings.from_env("TEST", rate=2.0) == RateLimitSettings(rate=2.0, burst=5.0)
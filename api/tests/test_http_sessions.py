@@ -0,0 +1,33 @@
+import asyncio
+
+from http_sessions import SessionPool, UpstreamSettings
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("EDGE_FUNCTION_POOL_LIMIT_PER_HOST", "8")
+    monkeypatch.setenv("EDGE_FUNCTION_CONNECT_TIMEOUT", "1.5")
+    settings = UpstreamSettings.from_env("EDGE_FUNCTION", read_timeout=10.0)
+    assert settings.pool_limit_per_host == 8
+    assert settings.connect_timeout == 1.5
+    assert settings.read_timeout == 10.0
+    assert settings.total_timeout is None
+
+
+def test_session_is_reused_until_closed():
+    pool = SessionPool()
+    pool.register("edge", UpstreamSettings(pool_limit=4, connect_timeout=2.0))
+
+    async def run():
+        await pool.open()
+        first = pool.get("edge")
+        assert pool.get("edge") is first
+        assert first.connector.limit == 4
+        assert first.timeout.connect == 2.0
+        await pool.close()
+        assert first.closed
+        second = pool.get("edge")
+        await pool.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert second is not first
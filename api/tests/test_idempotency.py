@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+
+from idempotency import (
+    Idempotency,
+    IdempotencyConflict,
+    IdempotencyInProgress,
+    IdempotencyStore,
+    InMemoryIdempotencyStore,
+    StoredResult,
+    fingerprint,
+)
+
+
+def test_concurrent_duplicates_share_one_call():
+    idempotency = Idempotency(InMemoryIdempotencyStore())
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return {"order": {"id": "o-1"}}
+
+    async def run():
+        results = await asyncio.gather(*(idempotency.run("k", "fp", call) for _ in range(5)))
+        later = await idempotency.run("k", "fp", call)
+        return results, later
+
+    results, later = asyncio.run(run())
+    assert len(calls) == 1
+    assert [replayed for _, replayed in results].count(False) == 1
+    assert all(body == {"order": {"id": "o-1"}} for body, _ in results)
+    assert later == ({"order": {"id": "o-1"}}, True)
+
+
+def test_failures_are_shared_but_not_stored():
+    idempotency = Idempotency(InMemoryIdempotencyStore())
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("edge function down")
+        return "ok"
+
+    async def run():
+        first = await asyncio.gather(
+            idempotency.run("k", "fp", call), idempotency.run("k", "fp", call),
+            return_exceptions=True,
+        )
+        return first, await idempotency.run("k", "fp", call)
+
+    first, retry = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in first)
+    assert retry == ("ok", False)
+    assert len(attempts) == 2
+
+
+def test_reusing_key_for_different_payload_conflicts():
+    idempotency = Idempotency(InMemoryIdempotencyStore())
+
+    async def call():
+        return "ok"
+
+    async def run():
+        await idempotency.run("k", fingerprint({"total": 1}), call)
+        await idempotency.run("k", fingerprint({"total": 2}), call)
+
+    with pytest.raises(IdempotencyConflict):
+        asyncio.run(run())
+
+
+def test_in_memory_store_evicts_lru_and_expired():
+    store = InMemoryIdempotencyStore(ttl=60, max_keys=2)
+
+    async def run():
+        await store.set("a", StoredResult("fp", 1))
+        await store.set("b", StoredResult("fp", 2))
+        await store.get("a")
+        await store.set("c", StoredResult("fp", 3))
+        evicted, kept = await store.get("b"), await store.get("a")
+        store.ttl = 0
+        await store.set("d", StoredResult("fp", 4))
+        return evicted, kept, await store.get("d")
+
+    evicted, kept, expired = asyncio.run(run())
+    assert evicted is None
+    assert kept == StoredResult("fp", 1)
+    assert expired is None
+
+
+def test_waiters_of_a_cancelled_call_take_over():
+    idempotency = Idempotency(InMemoryIdempotencyStore())
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        leader = asyncio.ensure_future(idempotency.run("k", "fp", call))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.ensure_future(idempotency.run("k", "fp", call)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*waiters)
+        return leader, results
+
+    leader, results = asyncio.run(run())
+    assert leader.cancelled()
+    # One waiter re-ran the call; the others shared its result
+    assert len(calls) == 2
+    assert sorted(results) == [("ok", False), ("ok", True), ("ok", True)]
+
+
+class ClaimingStore(InMemoryIdempotencyStore):
+    """Stands in for a store shared with another worker that holds some keys."""
+
+    def __init__(self, held=()):
+        super().__init__()
+        self.held = set(held)
+        self.released = []
+
+    async def claim(self, key, request_fingerprint):
+        if key in self.held:
+            return False
+        self.held.add(key)
+        return True
+
+    async def release(self, key):
+        self.held.discard(key)
+        self.released.append(key)
+
+
+def test_keys_claimed_elsewhere_are_not_run_twice():
+    store = ClaimingStore(held={"busy"})
+    idempotency = Idempotency(store)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("edge function down")
+        return "ok"
+
+    async def run():
+        with pytest.raises(IdempotencyInProgress):
+            await idempotency.run("busy", "fp", call)
+        with pytest.raises(RuntimeError):
+            await idempotency.run("k", "fp", call)
+        # The failed call's claim was released, so a retry may run
+        return await idempotency.run("k", "fp", call)
+
+    assert asyncio.run(run()) == ("ok", False)
+    assert calls == [1, 1]
+    assert store.released == ["k"]
+
+
+def test_stores_must_implement_get_and_set():
+    class GetOnly(IdempotencyStore):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
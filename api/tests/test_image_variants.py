@@ -0,0 +1,35 @@
+import pytest
+
+from image_variants import DEFAULT_FORMATS, VARIANT_WIDTHS, render_variants, srcsets, variant_path
+
+
+def test_variant_urls_derive_from_image_path():
+    assert variant_path("products/pineapple.jpg", 320, "webp") == "products/variants/pineapple-320w.webp"
+    assert variant_path("hat.png", 640, "avif") == "variants/hat-640w.avif"
+
+    sets = srcsets("products/hat.jpg", lambda path: f"https://cdn/{path}")
+    assert list(sets) == ["avif", "webp"]
+    assert sets["webp"] == ", ".join(
+        f"https://cdn/products/variants/hat-{width}w.webp {width}w" for width in VARIANT_WIDTHS
+    )
+    # AVIF is only advertised once configured
+    assert DEFAULT_FORMATS == ("webp",)
+    assert list(srcsets("products/hat.jpg", str, DEFAULT_FORMATS)) == ["webp"]
+
+
+def test_renders_every_variant_without_upscaling(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    features = pytest.importorskip("PIL.features")
+    if not features.check("avif"):
+        pytest.skip("Pillow built without AVIF")
+
+    source = tmp_path / "hat.png"
+    Image.new("RGBA", (800, 400), (255, 200, 0, 128)).save(source)
+    rendered = dict(render_variants(str(source), "products/hat.png", str(tmp_path / "out")))
+
+    assert len(rendered) == len(VARIANT_WIDTHS) * 2
+    with Image.open(rendered["products/variants/hat-320w.webp"]) as small:
+        assert small.size == (320, 160)
+        assert small.mode == "RGBA"
+    with Image.open(rendered["products/variants/hat-960w.avif"]) as large:
+        assert large.size == (800, 400)
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import socket
+
+from catalog_cache import CatalogCache
+from invalidation import InvalidationChannel, UnixSocketChannel, channel_from_env
+
+
+def test_publish_reaches_other_workers_only(tmp_path):
+    async def scenario():
+        received = {"a": [], "b": [], "c": []}
+        channels = {name: UnixSocketChannel(str(tmp_path), name=name) for name in received}
+        for name, channel in channels.items():
+            await channel.start(received[name].append)
+
+        channels["a"].publish("catalog")
+        await asyncio.sleep(0.05)
+        for channel in channels.values():
+            await channel.stop()
+        return received
+
+    assert asyncio.run(scenario()) == {"a": [], "b": ["catalog"], "c": ["catalog"]}
+    assert os.listdir(tmp_path) == []
+
+
+def test_publish_forgets_dead_workers(tmp_path):
+    # A socket file left behind by a worker that exited without cleanup
+    dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    dead.bind(str(tmp_path / "dead.sock"))
+    dead.close()
+
+    async def scenario():
+        channel = UnixSocketChannel(str(tmp_path), name="live")
+        await channel.start(lambda topic: None)
+        channel.publish("catalog")
+        names = sorted(os.listdir(tmp_path))
+        await channel.stop()
+        return names
+
+    assert asyncio.run(scenario()) == ["live.sock"]
+
+
+def test_channel_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("CACHE_INVALIDATION_DIR", raising=False)
+    assert type(channel_from_env()) is InvalidationChannel
+    monkeypatch.setenv("CACHE_INVALIDATION_DIR", str(tmp_path))
+    assert isinstance(channel_from_env(), UnixSocketChannel)
+
+
+def test_cache_reports_changed_catalog_only():
+    catalogs = [[{"id": "1"}], [{"id": "1"}], [{"id": "1"}, {"id": "2"}]]
+    changes = []
+
+    async def loader():
+        return catalogs.pop(0)
+
+    async def scenario():
+        cache = CatalogCache(loader, ttl=0)
+        cache.on_change = lambda: changes.append(cache.generation)
+        await cache.get()  # first load is not a change
+        for _ in range(2):
+            await cache.get()
+            await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert changes == [3]
+
+
+def test_received_invalidations_are_not_republished():
+    catalogs = [[{"id": "1"}], [{"id": "1"}, {"id": "2"}], [{"id": "1"}, {"id": "2"}, {"id": "3"}]]
+    changes = []
+
+    async def loader():
+        return catalogs.pop(0)
+
+    async def scenario():
+        cache = CatalogCache(loader, ttl=60)
+        cache.on_change = lambda: changes.append(cache.generation)
+        await cache.get()
+        # Another worker published the change; refreshing here must not echo it
+        cache.invalidate(notify=False)
+        await asyncio.sleep(0.01)
+        # A change this worker finds itself is still published
+        cache.invalidate()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert changes == [3]
@@ -1,9 +1,339 @@
+import os
+import subprocess
+import sys
+
+import pytest
 from fastapi.testclient import TestClient
+import api.main as main
 from api.main import app
+from rate_limit import InMemoryRateLimitBackend
 
 client = TestClient(app) 
 
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limits(monkeypatch):
+    backend = InMemoryRateLimitBackend()
+    for limiter in (main.order_ip_limiter, main.order_user_limiter, main.order_batch_limiter, main.tunnel_limiter):
+        monkeypatch.setattr(limiter, "backend", backend)
+
 def test_get_products():
     response = client.get("/products")
     assert response.status_code == 200
-    assert isinstance(response.json(), list)
\ No newline at end of file
+    assert isinstance(response.json(), list)
+
+def test_products_etag_and_not_modified():
+    response = client.get("/products")
+    etag = response.headers["ETag"]
+    assert etag.startswith('"') and etag.endswith('"')
+    assert "Cache-Control" in response.headers
+
+    cached = client.get("/products", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["ETag"] == etag
+
+    weak = client.get("/products", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert weak.status_code == 304
+
+    changed = client.get("/products", headers={"If-None-Match": '"stale"'})
+    assert changed.status_code == 200
+    assert changed.json() == response.json()
+
+
+def test_products_pagination_projection_and_filters():
+    first = client.get("/products", params={"limit": 3, "fields": "id,name"})
+    assert first.status_code == 200
+    body = first.json()
+    assert body["items"] == [
+        {"id": "1", "name": "Whole Pineapple"},
+        {"id": "2", "name": "Canned Pineapple"},
+        {"id": "3", "name": "Pineapple Juice"},
+    ]
+    assert body["next_cursor"] == "3"
+
+    rest = client.get("/products", params={"limit": 10, "cursor": body["next_cursor"]}).json()
+    assert [p["id"] for p in rest["items"]] == ["4", "5", "6", "7", "8"]
+    assert rest["next_cursor"] is None
+
+    filtered = client.get("/products", params={"min_price": 40, "max_price": 70, "q": "pineapple s"}).json()
+    assert [p["name"] for p in filtered["items"]] == ["Pineapple Sauce"]
+
+    assert client.get("/products", params={"fields": "id,secret"}).status_code == 400
+
+
+TUNNEL_DSN = "https://key@o673219.ingest.us.sentry.io/4508059881242624"
+
+
+def test_fallback_images_use_fingerprinted_static_urls():
+    product = client.get("/products").json()[0]
+    assert product["image"] == "http://testserver" + main.static_assets.url_for("images/products/pineapple.jpg")
+    assert product["image"] != "http://testserver/static/images/products/pineapple.jpg"
+
+    image = client.get(product["image"])
+    assert image.status_code == 200
+    assert image.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert image.headers["content-type"] == "image/jpeg"
+
+    paged = client.get("/products", params={"limit": 1, "fields": "id,image"}).json()
+    assert paged["items"] == [{"id": "1", "image": product["image"]}]
+
+
+def test_tunnel_queues_valid_envelopes(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(main.envelope_forwarder, "submit", lambda url, body: submitted.append((url, body)) or True)
+
+    envelope = ('{"dsn":"%s"}\n{"type":"event"}\n{}' % TUNNEL_DSN).encode()
+    response = client.post("/tunnel", content=envelope)
+    assert response.status_code == 200
+    assert submitted == [("https://o673219.ingest.us.sentry.io/api/4508059881242624/envelope/", envelope)]
+
+
+def test_tunnel_rejects_unknown_dsn_and_sheds_when_full(monkeypatch):
+    bad = client.post("/tunnel", content=b'{"dsn":"https://key@evil.example.com/1"}\n{}')
+    assert bad.status_code == 400
+    assert client.post("/tunnel", content=b"not json\n{}").status_code == 400
+
+    monkeypatch.setattr(main.envelope_forwarder, "submit", lambda url, body: False)
+    shed = client.post("/tunnel", content=('{"dsn":"%s"}\n{}' % TUNNEL_DSN).encode())
+    assert shed.status_code == 429
+    assert shed.headers["Retry-After"] == "1"
+
+
+def test_tunnel_streams_large_envelopes_and_enforces_max_size(monkeypatch):
+    streamed = []
+
+    async def forward_stream(url, body):
+        streamed.append((url, [chunk async for chunk in body]))
+        return 200
+
+    monkeypatch.setattr(main.envelope_forwarder, "forward_stream", forward_stream)
+    monkeypatch.setattr(main.envelope_forwarder, "submit", lambda url, body: pytest.fail("queued"))
+    monkeypatch.setattr(main, "TUNNEL_QUEUE_MAX_BYTES", 64)
+    monkeypatch.setattr(main, "TUNNEL_MAX_BYTES", 4096)
+
+    envelope = ('{"dsn":"%s"}\n{"type":"replay_recording"}\n' % TUNNEL_DSN).encode() + b"x" * 1000
+    response = client.post("/tunnel", content=envelope)
+    assert response.status_code == 200
+    assert b"".join(streamed[0][1]) == envelope
+
+    too_large = client.post("/tunnel", content=envelope + b"x" * 4096)
+    assert too_large.status_code == 413
+    assert len(streamed) == 1
+
+
+def make_order(user_id="user-1", quantity=1):
+    return {"user_id": user_id, "items": [{"product_id": "1", "quantity": quantity, "price_at_purchase": 19.99}]}
+
+
+def test_orders_batch_bounded_fan_out(monkeypatch):
+    state = {"in_flight": 0, "max_in_flight": 0}
+
+    async def fake_edge_function(payload, headers):
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        await main.asyncio.sleep(0.01)
+        state["in_flight"] -= 1
+        if payload["user_id"] == "rejected":
+            raise main.EdgeFunctionError(500, "insert failed")
+        return {"success": True, "order": {"id": f"order-{payload['user_id']}", "total": payload["total"]}}
+
+    monkeypatch.setattr(main, "call_create_order_function", fake_edge_function)
+    monkeypatch.setattr(main, "ORDER_BATCH_CONCURRENCY", 3)
+
+    orders = [make_order(f"user-{i}") for i in range(10)]
+    orders.append(make_order("bad-quantity", quantity=0))
+    orders.append(make_order("rejected"))
+    response = client.post("/orders/batch", json={"orders": orders})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["succeeded"] == 10
+    assert body["failed"] == 2
+    assert [r["index"] for r in body["results"]] == list(range(12))
+    assert body["results"][0]["order"] == {"id": "order-user-0", "total": 19.99}
+    assert body["results"][10] == {"index": 10, "status": 422, "error": "Invalid quantity for product 1"}
+    assert body["results"][11] == {"index": 11, "status": 500, "error": "insert failed"}
+    assert state["max_in_flight"] == 3
+
+
+def test_orders_batch_rejects_empty_batch():
+    assert client.post("/orders/batch", json={"orders": []}).status_code == 400
+
+
+def test_orders_idempotency_key_replays_first_result(monkeypatch):
+    calls = []
+
+    async def fake_edge_function(payload, headers):
+        calls.append(payload)
+        return {"success": True, "order": {"id": f"order-{len(calls)}"}}
+
+    monkeypatch.setattr(main, "call_create_order_function", fake_edge_function)
+    headers = {"Idempotency-Key": "retry-123"}
+
+    first = client.post("/orders", json=make_order("idem-user"), headers=headers)
+    retry = client.post("/orders", json=make_order("idem-user"), headers=headers)
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert len(calls) == 1
+
+    conflict = client.post("/orders", json=make_order("idem-user", quantity=2), headers=headers)
+    assert conflict.status_code == 422
+
+
+def test_orders_are_priced_from_catalog(monkeypatch):
+    calls = []
+
+    async def fake_edge_function(payload, headers):
+        calls.append(payload)
+        return {"success": True, "order": {"id": "order-1"}}
+
+    monkeypatch.setattr(main, "call_create_order_function", fake_edge_function)
+
+    unpriced = {"user_id": "user-1", "items": [{"product_id": "2", "quantity": 2}]}
+    assert client.post("/orders", json=unpriced).status_code == 201
+    assert calls[0]["items"] == [{"product_id": "2", "quantity": 2, "price_at_purchase": 29.99}]
+    assert calls[0]["total"] == 59.98
+    assert set(calls[0]) == {"user_id", "items", "total"}
+
+    stale = {"user_id": "user-1", "items": [{"product_id": "2", "quantity": 1, "price_at_purchase": 9.99}]}
+    response = client.post("/orders", json=stale)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Price of product 2 changed to 29.99"
+
+    unknown = {"user_id": "user-1", "items": [{"product_id": "missing", "quantity": 1}]}
+    assert client.post("/orders", json=unknown).status_code == 422
+    assert len(calls) == 1
+
+
+def test_orders_fail_fast_when_edge_circuit_open(monkeypatch):
+    main.edge_function_breaker._trip()
+    try:
+        response = client.post("/orders", json=make_order())
+    finally:
+        main.edge_function_breaker.reset()
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.headers["X-Circuit-State"] == "open"
+
+
+def test_orders_rate_limited_per_client_and_user(monkeypatch):
+    async def fake_edge_function(payload, headers):
+        return {"success": True, "order": {"id": "order-1"}}
+
+    monkeypatch.setattr(main, "call_create_order_function", fake_edge_function)
+    monkeypatch.setattr(main.order_user_limiter, "settings", main.RateLimitSettings(rate=0.1, burst=2.0))
+    monkeypatch.setattr(main.order_ip_limiter, "settings", main.RateLimitSettings(rate=0.1, burst=4.0))
+
+    statuses = [client.post("/orders", json=make_order("greedy")).status_code for _ in range(3)]
+    assert statuses == [201, 201, 429]
+    assert client.post("/orders", json=make_order("other")).status_code == 201
+
+    limited = client.post("/orders", json=make_order("other"), headers={"Origin": "http://localhost:5173"})
+    assert limited.status_code == 429
+    assert limited.headers["Retry-After"] == "10"
+    # Rejections still carry CORS headers, so the browser can read them
+    assert limited.headers["access-control-allow-origin"] == "http://localhost:5173"
+
+
+def test_orders_batch_charges_one_token_per_order(monkeypatch):
+    async def fake_edge_function(payload, headers):
+        return {"success": True, "order": {"id": "order-1"}}
+
+    monkeypatch.setattr(main, "call_create_order_function", fake_edge_function)
+    monkeypatch.setattr(main.order_batch_limiter, "settings", main.RateLimitSettings(rate=0.1, burst=6.0))
+    monkeypatch.setattr(main.order_user_limiter, "settings", main.RateLimitSettings(rate=0.1, burst=2.0))
+
+    too_big = client.post("/orders/batch", json={"orders": [make_order(f"u{i}") for i in range(7)]})
+    assert too_big.status_code == 413
+
+    orders = [make_order("greedy") for _ in range(3)] + [make_order("other")]
+    body = client.post("/orders/batch", json={"orders": orders}).json()
+    # Three orders exceed greedy's own limit of two; the other user's order goes through
+    assert [r["status"] for r in body["results"]] == [429, 429, 429, 201]
+
+    # Only the accepted order was charged, so five of the six client tokens are left
+    fits = client.post("/orders/batch", json={"orders": [make_order(f"v{i}") for i in range(5)]})
+    assert [r["status"] for r in fits.json()["results"]] == [201] * 5
+    limited = client.post("/orders/batch", json={"orders": [make_order("w")]})
+    assert limited.status_code == 429
+    assert "Retry-After" in limited.headers
+
+
+def test_orders_batch_does_not_spend_single_order_limit(monkeypatch):
+    async def fake_edge_function(payload, headers):
+        return {"success": True, "order": {"id": "order-1"}}
+
+    monkeypatch.setattr(main, "call_create_order_function", fake_edge_function)
+    burst = main.order_ip_limiter.settings.burst
+    orders = [make_order(f"user-{i}") for i in range(int(burst) * 3)]
+    body = client.post("/orders/batch", json={"orders": orders}).json()
+    assert body["succeeded"] == len(orders)
+
+
+def test_admission_gate_sheds_load(monkeypatch):
+    monkeypatch.setattr(main, "admission_gate", main.AdmissionGate(0))
+    response = client.post("/tunnel", content=b"{}")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/products").status_code == 200
+
+
+SENTRY_EVENT_TYPES = """
+import sentry_sdk
+types = []
+sentry_sdk.init(
+    dsn="https://key@example.invalid/1",
+    before_send=lambda event, hint: types.append([v["type"] for v in event["exception"]["values"]]),
+)
+import main
+from fastapi.testclient import TestClient
+TestClient(main.app, raise_server_exceptions=False).get("/sentry-debug")
+print(types)
+"""
+
+
+def test_route_errors_reach_sentry_unwrapped():
+    # Sentry must be initialized before main builds its middleware, so run in a fresh interpreter
+    api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", SENTRY_EVENT_TYPES], cwd=os.path.dirname(api_dir),
+        env={**os.environ, "PYTHONPATH": api_dir}, capture_output=True, text=True, timeout=60
+    )
+    assert result.stdout.strip().splitlines()[-1] == "[['ZeroDivisionError']]", result.stderr
+
+
+def test_metrics_exposes_route_templates():
+    client.get("/products")
+    client.get("/no-such-page/12345")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/products",status="200"}' in text
+    assert 'route="unmatched",status="404"' in text
+    assert "/no-such-page" not in text
+    assert 'circuit_breaker_open{dependency="supabase-db"} 0' in text
+    assert "sentry_tunnel_queue_depth 0" in text
+
+
+def test_shutdown_closes_query_pools(monkeypatch):
+    closed = []
+
+    class Closeable:
+        def close(self):
+            closed.append(self)
+
+    repository, backend = Closeable(), Closeable()
+    # Runs the real lifespan; keep Sentry and logging untouched
+    monkeypatch.setattr(main, "init_observability", lambda: None)
+    monkeypatch.setattr(main, "product_repository", repository)
+    for limiter in main.RATE_LIMITERS:
+        monkeypatch.setattr(limiter, "backend", backend)
+
+    with TestClient(app):
+        pass
+    assert closed == [repository, backend]
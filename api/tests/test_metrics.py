@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from metrics import Metric, Registry, timed
+
+
+def test_counter_and_gauge_render_prometheus_text():
+    registry = Registry()
+    lookups = registry.counter("cache_lookups_total", "Cache lookups", ("state",))
+    lookups.inc("fresh")
+    lookups.inc("fresh")
+    lookups.inc("miss")
+    in_flight = registry.gauge("in_flight", "In flight")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    registry.gauge("queue_depth", "Queue depth", ("queue",), function=lambda: [(("tunnel",), 7)])
+
+    assert registry.render().splitlines() == [
+        "# HELP cache_lookups_total Cache lookups",
+        "# TYPE cache_lookups_total counter",
+        'cache_lookups_total{state="fresh"} 2',
+        'cache_lookups_total{state="miss"} 1',
+        "# HELP in_flight In flight",
+        "# TYPE in_flight gauge",
+        "in_flight 1",
+        "# HELP queue_depth Queue depth",
+        "# TYPE queue_depth gauge",
+        'queue_depth{queue="tunnel"} 7',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, '/items/{id}')
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{route="/items/{id}",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/items/{id}",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/items/{id}",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{route="/items/{id}"} 4' in lines
+    assert latency.count("/items/{id}") == 4
+
+
+def test_timed_labels_outcome():
+    latency = Registry().histogram("call_seconds", "Calls", ("name", "outcome"))
+    with timed(latency, "db"):
+        pass
+    with pytest.raises(RuntimeError):
+        with timed(latency, "db"):
+            raise RuntimeError("boom")
+
+    assert latency.count("db", "ok") == 1
+    assert latency.count("db", "error") == 1
+
+
+def test_histogram_observed_from_threads_while_rendering():
+    registry = Registry()
+    histogram = registry.histogram("calls", "", ("worker",))
+
+    def observe(worker):
+        for _ in range(2000):
+            histogram.observe(0.01, worker)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(observe, str(i % 2)) for i in range(4)]
+        while not all(future.done() for future in futures):
+            registry.render()
+    assert histogram.count("0") + histogram.count("1") == 8000
+
+
+def test_metrics_must_implement_render():
+    class Unrendered(Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError):
+        Unrendered("unrendered", "")
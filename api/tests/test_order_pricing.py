@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+import pytest
+
+from order_pricing import OrderRejected, price_items
+
+PRICES = {"1": 19.99, "2": 0.1}
+
+
+def item(product_id, quantity=1, price=None):
+    return SimpleNamespace(product_id=product_id, quantity=quantity, price_at_purchase=price)
+
+
+def test_prices_items_from_catalog():
+    items, total = price_items([item("1", 2, 19.99), item("2", 3)], PRICES.get)
+    assert items == [
+        {"product_id": "1", "quantity": 2, "price_at_purchase": 19.99},
+        {"product_id": "2", "quantity": 3, "price_at_purchase": 0.1},
+    ]
+    assert total == 40.28  # summed in cents, not 40.279999...
+
+
+@pytest.mark.parametrize("bad_item, status, detail", [
+    (item("9"), 422, "Unknown product 9"),
+    (item("1", 0), 422, "Invalid quantity for product 1"),
+    (item("1", 1, 9.99), 409, "Price of product 1 changed to 19.99"),
+])
+def test_rejects_invalid_items(bad_item, status, detail):
+    with pytest.raises(OrderRejected) as excinfo:
+        price_items([item("2"), bad_item], PRICES.get)
+    assert (excinfo.value.status, excinfo.value.detail) == (status, detail)
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from supabase import create_client
+
+import api.main as main
+from metrics import Registry
+from product_repository import ProductRepository
+from storage_urls import product_image_urls
+
+QUERY_DELAY = 0.2
+CONCURRENT_REQUESTS = 8
+
+ROWS = [
+    {"id": "11111111-1111-1111-1111-111111111111", "name": "Whole Pineapple",
+     "price": "19.99", "image_path": "products/pineapple.jpg", "description": "Fresh"},
+]
+
+
+class FakePostgREST(BaseHTTPRequestHandler):
+    """Stand-in PostgREST that answers after a fixed delay and tracks overlap."""
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(QUERY_DELAY)
+        with cls.lock:
+            cls.in_flight -= 1
+        body = json.dumps(ROWS).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_postgrest():
+    FakePostgREST.in_flight = 0
+    FakePostgREST.max_in_flight = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakePostgREST)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = create_client(f"http://127.0.0.1:{server.server_address[1]}", "header.payload.signature")
+    return server, client
+
+
+def test_concurrent_queries_overlap():
+    server, client = start_fake_postgrest()
+    repository = ProductRepository(client, max_concurrency=CONCURRENT_REQUESTS)
+
+    async def fire():
+        return await asyncio.gather(
+            *(repository.list_products() for _ in range(CONCURRENT_REQUESTS))
+        )
+
+    try:
+        started = time.perf_counter()
+        results = asyncio.run(fire())
+        elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+        repository.close()
+
+    assert all(rows == ROWS for rows in results)
+    # Serialized queries would take CONCURRENT_REQUESTS * QUERY_DELAY
+    assert FakePostgREST.max_in_flight > 1
+    assert elapsed < CONCURRENT_REQUESTS * QUERY_DELAY / 2
+
+
+def test_queue_wait_excludes_query_time():
+    server, client = start_fake_postgrest()
+    queue_wait = Registry().histogram("queue", "", ("query",))
+    repository = ProductRepository(client, max_concurrency=1, queue_wait=queue_wait)
+
+    async def fire():
+        return await asyncio.gather(repository.list_products(), repository.list_products())
+
+    try:
+        asyncio.run(fire())
+    finally:
+        server.shutdown()
+        repository.close()
+
+    assert queue_wait.count("select_all") == 2
+    # The second query waited for the first; neither wait includes its own round trip
+    rendered = "\n".join(queue_wait.render())
+    total = float(next(line for line in rendered.splitlines() if line.startswith("queue_sum")).split()[-1])
+    assert QUERY_DELAY * 0.5 < total < QUERY_DELAY * 2
+
+
+def test_products_endpoint_does_not_block_event_loop(monkeypatch, injected_supabase):
+    server, client = start_fake_postgrest()
+    repository = ProductRepository(client)
+    monkeypatch.setattr(main, "supabase", client)
+    monkeypatch.setattr(main, "product_repository", repository)
+    monkeypatch.setattr(main, "image_url_for", product_image_urls(str(client.supabase_url)))
+    main.catalog_cache.clear()
+
+    async def fire():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            ticks = 0
+
+            async def heartbeat():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            beat = asyncio.ensure_future(heartbeat())
+            response = await http.get("/products")
+            beat.cancel()
+            return response, ticks
+
+    try:
+        response, ticks = asyncio.run(fire())
+    finally:
+        server.shutdown()
+        repository.close()
+        main.catalog_cache.clear()
+
+    assert response.status_code == 200
+    assert response.headers["X-Data-Source"] == "supabase-database; circuit=closed"
+    assert response.json()[0]["name"] == "Whole Pineapple"
+    # The loop kept running while the query was in flight
+    assert ticks >= QUERY_DELAY / 0.01 / 2
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+import rate_limit
+from rate_limit import AdmissionGate, InMemoryRateLimitBackend, RateLimitBackend, RateLimiter, RateLimitSettings
+
+
+def test_token_bucket_refills_at_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter("test", RateLimitSettings(rate=2.0, burst=3.0), InMemoryRateLimitBackend())
+
+    async def run():
+        assert [await limiter.check("a") for _ in range(3)] == [None, None, None]
+        assert await limiter.check("a") == 0.5
+        assert await limiter.check("b") is None  # buckets are per key
+        now[0] += 0.5
+        assert await limiter.check("a") is None
+        now[0] += 60
+        assert [await limiter.check("a") for _ in range(4)][-1] is not None  # capped at burst
+
+    asyncio.run(run())
+
+
+def test_evicts_least_recently_used_buckets():
+    backend = InMemoryRateLimitBackend(max_keys=2)
+    settings = RateLimitSettings(rate=1.0, burst=1.0)
+
+    async def run():
+        for key in ("a", "b", "c"):
+            await backend.take(key, settings)
+        assert list(backend._buckets) == ["b", "c"]
+
+    asyncio.run(run())
+
+
+def test_settings_from_env_and_gate(monkeypatch):
+    monkeypatch.setenv("TEST_LIMIT_BURST", "5")
+    assert RateLimitSettings.from_env("TEST_LIMIT", rate=2.0) == RateLimitSettings(rate=2.0, burst=5.0)
+
+    gate = AdmissionGate(1)
+    assert gate.try_enter()
+    assert not gate.try_enter()
+    gate.leave()
+    assert gate.try_enter()
+
+
+def test_backends_must_implement_take():
+    class Incomplete(RateLimitBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,53 @@
+import logging
+
+from request_logging import AccessLog, DeferredQueueHandler, parse_route_rates
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_access_log(default_rate, route_rates, draws):
+    access_log = AccessLog(default_rate=default_rate, route_rates=route_rates)
+    access_log._random = iter(draws).__next__
+    capture = Capture()
+    access_log.logger.addHandler(capture)
+    access_log.logger.setLevel(logging.INFO)
+    return access_log, capture
+
+
+def test_route_rates_prefer_longest_prefix():
+    rates = parse_route_rates("/products=0.5, /products/page=0.1,bogus,/tunnel=0")
+    access_log = AccessLog(default_rate=1.0, route_rates="/products=0.5,/products/page=0.1")
+    assert rates[0] == ("/products/page", 0.1)
+    assert access_log.rate_for("/products/page") == 0.1
+    assert access_log.rate_for("/products") == 0.5
+    assert access_log.rate_for("/orders") == 1.0
+
+
+def test_sampling_keeps_errors_and_builds_one_record():
+    access_log, capture = make_access_log(1.0, "/tunnel=0,/products=0.5", [0.9, 0.1])
+    try:
+        access_log.record("POST", "/tunnel", 200, 0.001, "1.2.3.4")
+        access_log.record("POST", "/tunnel", 502, 0.002, "1.2.3.4")
+        access_log.record("GET", "/products", 200, 0.003, "1.2.3.4")  # draw 0.9: dropped
+        access_log.record("GET", "/products", 200, 0.004, "1.2.3.4")  # draw 0.1: kept
+    finally:
+        access_log.logger.removeHandler(capture)
+
+    assert [r.status_code for r in capture.records] == [502, 200]
+    record = capture.records[1]
+    assert record.getMessage() == "GET /products - 200 (4.0ms)"
+    assert record.duration_ms == 4.0
+
+
+def test_queue_handler_defers_formatting():
+    record = logging.LogRecord("x", logging.INFO, __file__, 1, "%s items", (3,), None)
+    prepared = DeferredQueueHandler(None).prepare(record)
+    assert prepared.msg == "%s items"
+    assert prepared.args == (3,)
@@ -0,0 +1,150 @@
+import json
+import threading
+
+import pytest
+
+import setup_storage
+from setup_storage import Manifest, upload_images
+
+
+class StorageError(Exception):
+    def __init__(self, status):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+class FakeBucket:
+    def __init__(self, failures=None):
+        self.objects = {}
+        self.calls = []
+        self.failures = failures or {}
+        self._lock = threading.Lock()
+
+    def upload(self, path, file, options):
+        with self._lock:
+            self.calls.append((path, options["content-type"], options["upsert"]))
+            if self.failures.get(path):
+                raise StorageError(self.failures[path].pop(0))
+            if path in self.objects and options["upsert"] != "true":
+                raise StorageError("409")
+            self.objects[path] = file.read()
+
+
+class FakeClient:
+    def __init__(self, bucket):
+        self.storage = self
+        self.bucket = bucket
+
+    def from_(self, name):
+        return self.bucket
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(setup_storage.time, "sleep", lambda seconds: None)
+
+
+def test_uploads_only_new_and_changed_files(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    (images / "a.jpg").write_bytes(b"jpeg")
+    (images / "b.PNG").write_bytes(b"png")
+    (images / "notes.txt").write_text("not an image")
+    manifest_path = tmp_path / "manifest.json"
+    bucket = FakeBucket()
+
+    stats = upload_images(FakeClient(bucket), images, Manifest(manifest_path, "t").load(), workers=2)
+    assert (stats.uploaded, stats.skipped, stats.failed) == (2, 0, 0)
+    assert sorted(bucket.calls) == [
+        ("products/a.jpg", "image/jpeg", "false"),
+        ("products/b.PNG", "image/png", "false"),
+    ]
+    assert bucket.objects["products/a.jpg"] == b"jpeg"
+
+    # Unchanged files are skipped; a changed one is overwritten
+    bucket.calls.clear()
+    (images / "a.jpg").write_bytes(b"jpeg v2")
+    stats = upload_images(FakeClient(bucket), images, Manifest(manifest_path, "t").load())
+    assert (stats.uploaded, stats.skipped) == (1, 1)
+    assert bucket.calls == [("products/a.jpg", "image/jpeg", "true")]
+
+    # A manifest written for another bucket is not trusted
+    stats = upload_images(FakeClient(bucket), images, Manifest(manifest_path, "other").load(), dry_run=True)
+    assert (stats.skipped, stats.bytes_uploaded) == (0, len(b"jpeg v2") + len(b"png"))
+
+
+def test_retries_transient_errors_and_resumes_after_failures(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        (images / name).write_bytes(name.encode())
+    manifest_path = tmp_path / "manifest.json"
+    bucket = FakeBucket(failures={"products/a.jpg": ["503", "500"], "products/b.jpg": ["400"]})
+    # Already in the bucket but missing from the manifest
+    bucket.objects["products/c.jpg"] = b"old"
+
+    stats = upload_images(FakeClient(bucket), images, Manifest(manifest_path, "t").load(), retries=2)
+    assert (stats.uploaded, stats.failed) == (2, 1)
+    assert [call for call in bucket.calls if call[0] == "products/a.jpg"] == [("products/a.jpg", "image/jpeg", "false")] * 3
+    assert [call for call in bucket.calls if call[0] == "products/b.jpg"] == [("products/b.jpg", "image/jpeg", "false")]
+    assert bucket.objects["products/c.jpg"] == b"c.jpg"
+    assert set(json.loads(manifest_path.read_text())["objects"]) == {"products/a.jpg", "products/c.jpg"}
+
+    # The next run only retries what failed
+    bucket.calls.clear()
+    stats = upload_images(FakeClient(bucket), images, Manifest(manifest_path, "t").load())
+    assert (stats.uploaded, stats.skipped, stats.failed) == (1, 2, 0)
+    assert bucket.calls == [("products/b.jpg", "image/jpeg", "false")]
+
+
+def test_renders_and_uploads_variants_once(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    if not setup_storage.variants_supported():
+        pytest.skip("Pillow built without AVIF/WebP")
+    images = tmp_path / "images"
+    images.mkdir()
+    Image.new("RGB", (700, 700), (255, 200, 0)).save(images / "a.jpg")
+    manifest_path = tmp_path / "manifest.json"
+    bucket = FakeBucket()
+
+    def run():
+        manifest = Manifest(manifest_path, "t").load()
+        return upload_images(FakeClient(bucket), images, manifest, variants_dir=tmp_path / "variants", processes=1)
+
+    stats = run()
+    assert stats.uploaded == 1 + len(setup_storage.variant_paths("products/a.jpg"))
+    assert ("products/variants/a-320w.avif", "image/avif", "false") in bucket.calls
+
+    bucket.calls.clear()
+    assert run().uploaded == 0
+    assert bucket.calls == []
+    assert setup_storage.uploaded_formats(images, Manifest(manifest_path, "t").load()) == ["avif", "webp"]
+
+
+def test_variant_formats_are_reported_only_when_fully_uploaded(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    (images / "a.jpg").write_bytes(b"jpeg")
+    manifest = Manifest(tmp_path / "manifest.json", "t")
+    for path in setup_storage.variant_paths("products/a.jpg"):
+        if not path.endswith("-960w.avif"):
+            manifest.entries[path] = {}
+    assert setup_storage.uploaded_formats(images, manifest) == ["webp"]
+
+
+def test_existing_bucket_allows_variant_types():
+    class Storage:
+        def __init__(self):
+            self.updated = None
+
+        def list_buckets(self):
+            return [type("Bucket", (), {"name": setup_storage.BUCKET_NAME})()]
+
+        def update_bucket(self, name, options):
+            self.updated = (name, options)
+
+    client = type("Client", (), {"storage": Storage()})()
+    assert setup_storage.create_bucket(client)
+    name, options = client.storage.updated
+    assert name == setup_storage.BUCKET_NAME
+    assert {"image/avif", "image/webp", "image/jpeg"} <= set(options["allowed_mime_types"])
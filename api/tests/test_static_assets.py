@@ -0,0 +1,87 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from static_assets import IMMUTABLE_CACHE_CONTROL, StaticAssets, negotiate, precompress
+
+CSS = b"body { color: #ffcc00; }\n" * 100
+
+
+def make_client(directory):
+    assets = StaticAssets(directory=str(directory))
+    app = FastAPI()
+    app.mount("/static", assets)
+    return TestClient(app), assets
+
+
+def test_fingerprinted_urls_are_immutable(tmp_path):
+    (tmp_path / "img").mkdir()
+    (tmp_path / "img" / "a.jpg").write_bytes(b"jpeg bytes")
+    client, assets = make_client(tmp_path)
+
+    manifest = client.get("/static/asset-manifest.json").json()
+    url = manifest["img/a.jpg"]
+    assert url.startswith("/static/img/a.") and url.endswith(".jpg") and url == assets.url_for("img/a.jpg")
+
+    fingerprinted = client.get(url)
+    assert fingerprinted.content == b"jpeg bytes"
+    assert fingerprinted.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert fingerprinted.headers["content-type"] == "image/jpeg"
+
+    plain = client.get("/static/img/a.jpg")
+    assert plain.headers["cache-control"] != IMMUTABLE_CACHE_CONTROL
+    assert plain.headers["etag"] == fingerprinted.headers["etag"]
+
+    not_modified = client.get(url, headers={"If-None-Match": fingerprinted.headers["etag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+    # Added after the manifest was built: still served, just not fingerprinted
+    (tmp_path / "img" / "b.jpg").write_bytes(b"new")
+    assert client.get("/static/img/b.jpg").content == b"new"
+    assert client.get("/static/img/missing.jpg").status_code == 404
+
+
+def test_files_changed_after_startup_lose_their_fingerprint(tmp_path):
+    (tmp_path / "a.css").write_bytes(b"old")
+    client, assets = make_client(tmp_path)
+    url = client.get("/static/asset-manifest.json").json()["a.css"]
+    assert client.get(url).content == b"old"
+
+    (tmp_path / "a.css").write_bytes(b"changed")
+    assert client.get(url).status_code == 404
+    plain = client.get("/static/a.css")
+    assert plain.content == b"changed"
+    assert "immutable" not in plain.headers.get("cache-control", "")
+
+
+def test_serves_precompressed_siblings_and_ranges(tmp_path):
+    (tmp_path / "site.css").write_bytes(CSS)
+    assert precompress(str(tmp_path)) >= 1
+    assert gzip.decompress((tmp_path / "site.css.gz").read_bytes()) == CSS
+    client, _ = make_client(tmp_path)
+
+    compressed = client.get("/static/site.css", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["vary"] == "Accept-Encoding"
+    assert int(compressed.headers["content-length"]) < len(CSS)
+    assert compressed.content == CSS  # decoded by the client
+
+    identity = client.get("/static/site.css", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["etag"] != compressed.headers["etag"]
+
+    partial = client.get("/static/site.css", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-3"})
+    assert partial.status_code == 206
+    assert partial.content == CSS[:4]
+    assert "content-encoding" not in partial.headers
+
+
+def test_negotiates_by_preference_and_q_values():
+    available = {"br": None, "gzip": None}
+    assert negotiate("gzip, deflate, br", available) == "br"
+    assert negotiate("br;q=0, gzip;q=0.5", available) == "gzip"
+    assert negotiate("*", {"gzip": None}) == "gzip"
+    assert negotiate("identity", available) is None
+    assert negotiate("", available) is None
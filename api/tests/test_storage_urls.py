@@ -0,0 +1,25 @@
+from supabase import create_client
+
+from storage_urls import PRODUCT_IMAGES_BUCKET, PublicUrlResolver, product_image_urls
+
+SUPABASE_URL = "https://project.supabase.co"
+
+
+def test_matches_storage_client_urls():
+    client = create_client(SUPABASE_URL, "header.payload.signature")
+    resolve = PublicUrlResolver(SUPABASE_URL, PRODUCT_IMAGES_BUCKET)
+
+    for path in ["products/pineapple.jpg", "products/pineapple hat.png"]:
+        expected = client.storage.from_(PRODUCT_IMAGES_BUCKET).get_public_url(path)
+        assert resolve(path) == expected
+
+
+def test_urls_are_memoized():
+    resolve = PublicUrlResolver(SUPABASE_URL, PRODUCT_IMAGES_BUCKET)
+    assert resolve("products/a.jpg") is resolve("products/a.jpg")
+
+
+def test_cdn_override(monkeypatch):
+    monkeypatch.setenv("STORAGE_CDN_URL", "https://cdn.example.com/")
+    resolve = product_image_urls(SUPABASE_URL)
+    assert resolve("products/a.jpg") == "https://cdn.example.com/product-images/products/a.jpg"
@@ -0,0 +1,138 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+import sentry_sdk
+
+from metrics import Registry
+from supabase_tracing import ROW_BUCKETS, InstrumentedClient, SupabaseTracer
+
+
+class FakeBuilder:
+    """Chainable stand-in for a PostgREST request builder."""
+
+    def __init__(self, rows, calls):
+        self.rows = rows
+        self.calls = calls
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args))
+            return self
+
+        return call
+
+    @property
+    def not_(self):
+        self.calls.append(("not_", ()))
+        return self
+
+    def execute(self):
+        if isinstance(self.rows, Exception):
+            raise self.rows
+        return SimpleNamespace(data=self.rows)
+
+
+class FakeBucket:
+    def upload(self, path, file):
+        return {"Key": path}
+
+    def get_public_url(self, path):
+        return f"https://example.supabase.co/{path}"
+
+
+class FakeClient:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.calls = []
+        self.storage = SimpleNamespace(from_=lambda bucket: FakeBucket(), list_buckets=lambda: ["product-images"])
+        self.auth = "auth"
+
+    def table(self, name):
+        return FakeBuilder(self.rows, self.calls)
+
+    def rpc(self, fn, params=None, **kwargs):
+        return FakeBuilder(self.rows, self.calls)
+
+
+def make_client(rows=()):
+    registry = Registry()
+    latency = registry.histogram("latency", "", ("service", "target", "operation", "outcome"))
+    row_counts = registry.histogram("rows", "", ("table", "operation"), buckets=ROW_BUCKETS)
+    fake = FakeClient(rows)
+    return InstrumentedClient(fake, SupabaseTracer(latency, row_counts)), fake, latency, row_counts
+
+
+def test_queries_are_timed_with_table_operation_and_rows():
+    client, fake, latency, rows = make_client([{"id": 1}, {"id": 2}])
+
+    response = client.table("products").select("id,name").gt("id", "3").not_.is_("name", "null").limit(2).execute()
+    assert response.data == [{"id": 1}, {"id": 2}]
+    assert [name for name, _ in fake.calls] == ["select", "gt", "not_", "is_", "limit"]
+    assert latency.count("db", "products", "select", "ok") == 1
+    assert rows.count("products", "select") == 1
+    assert "rows_sum{table=\"products\",operation=\"select\"} 2" in "\n".join(rows.render())
+
+    client.rpc("take_rate_limit_token", {"p_key": "k"}).execute()
+    assert latency.count("db", "take_rate_limit_token", "rpc", "ok") == 1
+
+
+def test_failures_storage_and_passthrough():
+    client, fake, latency, _ = make_client()
+    fake.rows = RuntimeError("boom")
+    with pytest.raises(RuntimeError):
+        client.table("orders").insert({"user_id": "u"}).execute()
+    assert latency.count("db", "orders", "insert", "error") == 1
+
+    bucket = client.storage.from_("product-images")
+    assert bucket.upload("products/a.jpg", b"...") == {"Key": "products/a.jpg"}
+    assert latency.count("storage", "product-images", "upload", "ok") == 1
+    # Local URL building is not a Supabase call
+    assert bucket.get_public_url("products/a.jpg").endswith("products/a.jpg")
+    assert client.storage.list_buckets() == ["product-images"]
+    assert client.auth == "auth"
+    assert latency.count("storage", "product-images", "get_public_url", "ok") == 0
+
+
+@pytest.fixture
+def transactions():
+    captured = []
+
+    def capture(event, hint):
+        captured.append(event)
+        return None
+
+    sentry_sdk.init(
+        dsn="https://key@example.invalid/1",
+        traces_sample_rate=1.0,
+        default_integrations=False,
+        before_send_transaction=capture,
+    )
+    try:
+        yield captured
+    finally:
+        sentry_sdk.init()
+
+
+def test_sampled_queries_record_spans_from_pool_threads(transactions):
+    client, _, latency, _ = make_client([{"id": 1}])
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def query():
+        return client.table("products").select("*").ilike("name", "%secret%").order("id").execute()
+
+    with sentry_sdk.start_transaction(name="GET /products"):
+        executor.submit(contextvars.copy_context().run, query).result()
+    # Not sampled: timed only
+    executor.submit(query).result()
+
+    assert latency.count("db", "products", "select", "ok") == 2
+    (spans,) = [event["spans"] for event in transactions]
+    assert len(spans) == 1
+    span = spans[0]
+    assert span["op"] == "db"
+    assert span["description"] == "select products"
+    assert span["data"]["db.query"] == "select(*).ilike(name).order(id)"
+    assert span["data"]["db.rows"] == 1
+    assert "secret" not in str(span)
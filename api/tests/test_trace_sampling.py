@@ -0,0 +1,67 @@
+from trace_sampling import TraceSampler
+
+
+def context(path, parent_sampled=None):
+    return {"asgi_scope": {"type": "http", "path": path}, "parent_sampled": parent_sampled}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_sampler(**options):
+    sampler = TraceSampler(**options)
+    sampler._clock = Clock()
+    return sampler
+
+
+def test_static_and_health_routes_are_dropped_up_front():
+    sampler = make_sampler(default_rate=1.0)
+    for path in ["/static/images/products/pineapple.jpg", "/healthcheck", "/favicon.ico"]:
+        assert sampler(context(path, parent_sampled=True)) == 0.0
+
+
+def test_per_route_rates_and_parent_decision():
+    sampler = make_sampler(default_rate=0.5, route_rates="/tunnel=0.01,/products=0.1")
+    assert sampler(context("/tunnel")) == 0.01
+    assert sampler(context("/products")) == 0.1
+    assert sampler(context("/orders")) == 0.5
+    assert sampler(context("/orders", parent_sampled=True)) == 1.0
+    assert sampler(context("/orders", parent_sampled=False)) == 0.0
+
+
+def test_errors_and_slow_responses_boost_route():
+    sampler = make_sampler(default_rate=0.0, slow_seconds=1.0, boost_seconds=30)
+    sampler.record_outcome("/orders", 201, 0.1)
+    assert sampler(context("/orders")) == 0.0
+
+    sampler.record_outcome("/orders", 503, 0.1)
+    sampler.record_outcome("/products", 200, 1.5)
+    assert sampler(context("/orders")) == 1.0
+    assert sampler(context("/products")) == 1.0
+
+    sampler._clock.now += 31
+    assert sampler(context("/orders")) == 0.0
+
+
+def test_adaptive_mode_targets_transactions_per_second():
+    sampler = make_sampler(default_rate=1.0, target_tps=10)
+    for _ in range(200):
+        sampler(context("/products"))
+    sampler._clock.now += 1
+    # 200 requests in the last window at rate 1.0 -> scale to 10 tps
+    assert sampler(context("/products")) == 10 / 200
+
+
+def test_adaptive_mode_scales_by_route_rate():
+    sampler = make_sampler(default_rate=1.0, route_rates="/tunnel=0.01", target_tps=10)
+    for _ in range(500):
+        sampler(context("/tunnel"))
+    sampler._clock.now += 1
+    # 500 requests at the /tunnel rate -> 5 expected tps, under the target
+    assert sampler(context("/tunnel")) == 0.01
+
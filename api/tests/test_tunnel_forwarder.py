@@ -0,0 +1,162 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from tunnel_forwarder import EnvelopeForwarder, EnvelopeReader, EnvelopeTooLarge, InvalidEnvelope
+
+
+async def start_fake_sentry(statuses):
+    """Fake ingest endpoint answering with `statuses` in turn, then 200."""
+    received = []
+
+    async def envelope(request):
+        received.append(await request.read())
+        return web.Response(status=statuses.pop(0) if statuses else 200)
+
+    app = web.Application()
+    app.router.add_post("/api/1/envelope/", envelope)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/api/1/envelope/", received
+
+
+def run_with_forwarder(scenario, statuses=(), **options):
+    async def run():
+        runner, url, received = await start_fake_sentry(list(statuses))
+        session = aiohttp.ClientSession()
+        forwarder = EnvelopeForwarder(lambda: session, retry_backoff=0.01, **options)
+        try:
+            await scenario(forwarder, url)
+            await forwarder.stop()
+        finally:
+            await session.close()
+            await runner.cleanup()
+        return forwarder, received
+
+    return asyncio.run(run())
+
+
+def test_envelopes_are_forwarded_in_background():
+    async def scenario(forwarder, url):
+        for i in range(5):
+            assert forwarder.submit(url, b'{"dsn":"x"}\n' + str(i).encode())
+
+    forwarder, received = run_with_forwarder(scenario)
+    assert sorted(received) == [b'{"dsn":"x"}\n' + str(i).encode() for i in range(5)]
+    assert forwarder.stats["forwarded"] == 5
+
+
+def test_transient_errors_are_retried():
+    async def scenario(forwarder, url):
+        forwarder.submit(url, b"envelope")
+
+    forwarder, received = run_with_forwarder(scenario, statuses=[503, 429])
+    assert len(received) == 3
+    assert forwarder.stats["retried"] == 2
+    assert forwarder.stats["forwarded"] == 1
+
+
+def test_client_errors_are_not_retried():
+    async def scenario(forwarder, url):
+        forwarder.submit(url, b"envelope")
+
+    forwarder, received = run_with_forwarder(scenario, statuses=[400])
+    assert len(received) == 1
+    assert forwarder.stats["failed"] == 1
+
+
+def test_sheds_when_queue_is_full():
+    async def scenario(forwarder, url):
+        accepted = [forwarder.submit(url, b"envelope") for _ in range(5)]
+        assert accepted == [True, True, False, False, False]
+
+    forwarder, received = run_with_forwarder(scenario, max_queue=2)
+    assert forwarder.stats["shed"] == 3
+    assert len(received) == 2
+
+
+def test_unexpected_errors_drop_the_envelope_not_the_worker():
+    async def run():
+        session = aiohttp.ClientSession()
+        calls = []
+
+        def session_getter():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("session closed")
+            return session
+
+        runner, url, received = await start_fake_sentry([])
+        forwarder = EnvelopeForwarder(session_getter, workers=1, retry_backoff=0.01)
+        try:
+            forwarder.submit(url, b"first")
+            await asyncio.sleep(0.05)
+            forwarder.submit(url, b"second")
+            await forwarder.stop()
+        finally:
+            await session.close()
+            await runner.cleanup()
+        return forwarder, received
+
+    forwarder, received = asyncio.run(run())
+    assert received == [b"second"]
+    assert forwarder.stats["failed"] == 1
+    assert forwarder.depth == 0
+
+def test_large_envelopes_are_streamed_once():
+    async def chunks():
+        for i in range(4):
+            yield str(i).encode() * 1000
+
+    async def scenario(forwarder, url):
+        assert await forwarder.forward_stream(url, chunks()) == 200
+
+    forwarder, received = run_with_forwarder(scenario)
+    assert received == [b"".join(str(i).encode() * 1000 for i in range(4))]
+    assert forwarder.stats["streamed"] == 1
+
+
+def read_with(chunks, max_bytes=1000):
+    async def stream():
+        for chunk in chunks:
+            if chunk is None:
+                pytest.fail("read past the header")
+            yield chunk
+
+    return EnvelopeReader(stream(), max_bytes=max_bytes)
+
+
+def test_reader_parses_header_without_reading_the_rest():
+    async def run():
+        reader = read_with([b'{"dsn":', b'"x"}\n{"ty', None])
+        assert await reader.read_header() == b'{"dsn":"x"}'
+        assert reader.buffer == b'{"dsn":"x"}\n{"ty'
+
+        reader = read_with([b'{"dsn":"x"}\n', b"item\n", b"payload"])
+        await reader.read_header()
+        assert await reader.buffer_up_to(100)
+        assert [chunk async for chunk in reader.body()] == [b'{"dsn":"x"}\nitem\npayload']
+
+        assert await read_with([b'{"dsn":"x"}']).read_header() == b'{"dsn":"x"}'
+
+    asyncio.run(run())
+
+
+def test_reader_enforces_limits():
+    async def run():
+        with pytest.raises(InvalidEnvelope):
+            await read_with([b"x" * 100] * 5, max_bytes=10000).read_header(max_header=200)
+
+        reader = read_with([b'{"dsn":"x"}\n', b"a" * 50, b"b" * 50, b"c" * 50], max_bytes=120)
+        await reader.read_header()
+        assert not await reader.buffer_up_to(40)
+        with pytest.raises(EnvelopeTooLarge):
+            _ = [chunk async for chunk in reader.body()]
+        assert reader.too_large
+
+    asyncio.run(run())
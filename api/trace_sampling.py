@@ -0,0 +1,121 @@
+"""
+Sentry trace sampling for the API.
+
+Replaces the fixed traces_sample_rate with a traces_sampler that decides up
+front, before any spans are recorded:
+
+- static files, images and health checks are never traced;
+- each route has its own rate (SENTRY_TRACES_ROUTE_RATES, e.g.
+  "/products=0.1,/tunnel=0.01"), falling back to SENTRY_TRACES_SAMPLE_RATE;
+- after a route returns a server error or responds slower than
+  SENTRY_TRACES_SLOW_SECONDS, it is fully sampled for
+  SENTRY_TRACES_BOOST_SECONDS so the problem shows up in traces;
+- with SENTRY_TRACES_TARGET_TPS set, rates are scaled down so the process
+  sends roughly that many transactions per second at most.
+
+Profiling is relative to sampled transactions and set with
+SENTRY_PROFILES_SAMPLE_RATE.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from request_logging import parse_route_rates
+
+DEFAULT_TRACES_SAMPLE_RATE = float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", "0.1"))
+DEFAULT_PROFILES_SAMPLE_RATE = float(os.getenv("SENTRY_PROFILES_SAMPLE_RATE", "0.1"))
+DEFAULT_ROUTE_RATES = os.getenv("SENTRY_TRACES_ROUTE_RATES", "")
+DEFAULT_TARGET_TPS = float(os.getenv("SENTRY_TRACES_TARGET_TPS", "0")) or None
+DEFAULT_SLOW_SECONDS = float(os.getenv("SENTRY_TRACES_SLOW_SECONDS", "2.0"))
+DEFAULT_BOOST_SECONDS = float(os.getenv("SENTRY_TRACES_BOOST_SECONDS", "60"))
+
+# Never traced
+DROPPED_PREFIXES = ("/static",)
+DROPPED_PATHS = ("/healthcheck", "/favicon.ico", "/metrics")
+DROPPED_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".avif", ".ico")
+
+# Routes remembered for boosting; bounds memory when clients send arbitrary paths
+MAX_BOOSTED_ROUTES = 256
+
+
+def is_dropped(path: str) -> bool:
+    return path.startswith(DROPPED_PREFIXES) or path in DROPPED_PATHS or path.endswith(DROPPED_SUFFIXES)
+
+
+class TraceSampler:
+    """Callable usable as `traces_sampler` in sentry_sdk.init."""
+
+    def __init__(
+        self,
+        default_rate: float = DEFAULT_TRACES_SAMPLE_RATE,
+        route_rates: str = DEFAULT_ROUTE_RATES,
+        target_tps: Optional[float] = DEFAULT_TARGET_TPS,
+        slow_seconds: float = DEFAULT_SLOW_SECONDS,
+        boost_seconds: float = DEFAULT_BOOST_SECONDS,
+    ):
+        self.default_rate = default_rate
+        self.route_rates = parse_route_rates(route_rates)
+        self.target_tps = target_tps
+        self.slow_seconds = slow_seconds
+        self.boost_seconds = boost_seconds
+        self._boosted: "OrderedDict[str, float]" = OrderedDict()
+        self._clock = time.monotonic
+        # Adaptive mode: transactions the route rates would sample in the current one-second window
+        self._window_start = 0.0
+        self._window_expected = 0.0
+        self._scale = 1.0
+
+    def rate_for(self, path: str) -> float:
+        for prefix, rate in self.route_rates:
+            if path.startswith(prefix):
+                return rate
+        return self.default_rate
+
+    def _is_boosted(self, path: str, now: float) -> bool:
+        until = self._boosted.get(path)
+        if until is None:
+            return False
+        if until <= now:
+            del self._boosted[path]
+            return False
+        return True
+
+    def _adaptive_scale(self, rate: float, now: float) -> float:
+        """Scale factor keeping sampled transactions near target_tps, given this request's unscaled rate."""
+        if now - self._window_start >= 1.0:
+            expected = self._window_expected / max(now - self._window_start, 1.0)
+            self._scale = min(1.0, self.target_tps / expected) if expected > 0 else 1.0
+            self._window_start = now
+            self._window_expected = 0.0
+        self._window_expected += rate
+        return self._scale
+
+    def __call__(self, sampling_context: Dict[str, Any]) -> float:
+        scope = sampling_context.get("asgi_scope") or {}
+        path = scope.get("path", "")
+
+        if path and is_dropped(path):
+            return 0.0
+
+        now = self._clock()
+        if self._is_boosted(path, now):
+            return 1.0
+
+        # Continue the decision of an upstream (e.g. browser) trace
+        parent_sampled = sampling_context.get("parent_sampled")
+        rate = float(parent_sampled) if parent_sampled is not None else self.rate_for(path)
+
+        if self.target_tps and rate > 0:
+            rate *= self._adaptive_scale(rate, now)
+        return rate
+
+    def record_outcome(self, path: str, status_code: int, duration: float):
+        """Boost sampling for a route that just failed or was slow."""
+        if status_code < 500 and duration < self.slow_seconds:
+            return
+        self._boosted[path] = self._clock() + self.boost_seconds
+        self._boosted.move_to_end(path)
+        while len(self._boosted) > MAX_BOOSTED_ROUTES:
+            self._boosted.popitem(last=False)
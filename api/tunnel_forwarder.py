@@ -0,0 +1,248 @@
+"""
+Background forwarding of Sentry envelopes received on /tunnel.
+
+The tunnel handler reads the request body incrementally (EnvelopeReader):
+only the header line is parsed, so a bad DSN is rejected before the rest of
+the body is read, and bodies over SENTRY_TUNNEL_MAX_BYTES are refused.
+
+Envelopes up to SENTRY_TUNNEL_QUEUE_MAX_BYTES are buffered and queued, and
+the browser is answered straight away. A small pool of workers drains the
+bounded queue in batches and posts each envelope upstream over the shared
+keep-alive session, retrying transient failures. When the queue is full new
+envelopes are shed instead of piling up in memory.
+
+Larger envelopes (replays, attachments) are streamed upstream chunk by chunk
+while they arrive, so memory per request stays bounded by the chunk size;
+they cannot be replayed, so they are sent once, without retries.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterable, AsyncIterator, Callable, List, Optional, Tuple, Union
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = int(os.getenv("SENTRY_TUNNEL_QUEUE_SIZE", "1000"))
+DEFAULT_WORKERS = int(os.getenv("SENTRY_TUNNEL_WORKERS", "4"))
+DEFAULT_BATCH_SIZE = int(os.getenv("SENTRY_TUNNEL_BATCH_SIZE", "10"))
+DEFAULT_MAX_RETRIES = int(os.getenv("SENTRY_TUNNEL_MAX_RETRIES", "3"))
+# Seconds shutdown waits for queued envelopes to be forwarded
+DEFAULT_DRAIN_TIMEOUT = float(os.getenv("SENTRY_TUNNEL_DRAIN_SECONDS", "5"))
+# Largest envelope accepted at all, and largest one buffered for the queue
+DEFAULT_MAX_ENVELOPE_BYTES = int(os.getenv("SENTRY_TUNNEL_MAX_BYTES", str(20 * 1024 * 1024)))
+DEFAULT_MAX_QUEUED_BYTES = int(os.getenv("SENTRY_TUNNEL_QUEUE_MAX_BYTES", str(256 * 1024)))
+MAX_HEADER_BYTES = 64 * 1024
+
+ENVELOPE_HEADERS = {"Content-Type": "application/x-sentry-envelope"}
+
+Envelope = Tuple[str, bytes]
+
+
+class InvalidEnvelope(Exception):
+    """The envelope header is missing or malformed."""
+
+
+class EnvelopeTooLarge(Exception):
+    """The request body exceeds the configured maximum."""
+
+
+class EnvelopeReader:
+    """Incremental reader over a request body stream that enforces a size limit."""
+
+    def __init__(self, chunks: AsyncIterable[bytes], max_bytes: int = DEFAULT_MAX_ENVELOPE_BYTES):
+        self._chunks = chunks.__aiter__()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.done = False
+        self.too_large = False
+        # Bytes read but not yet handed on: the header and whatever came with it
+        self.buffer = bytearray()
+
+    async def _next_chunk(self) -> Optional[bytes]:
+        if self.done:
+            return None
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self.done = True
+            return None
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            self.too_large = True
+            raise EnvelopeTooLarge(self.size)
+        return chunk
+
+    async def read_header(self, max_header: int = MAX_HEADER_BYTES) -> bytes:
+        """Read until the end of the first line and return it; the rest stays unread."""
+        scanned = 0
+        while True:
+            end = self.buffer.find(b"\n", scanned)
+            if end != -1:
+                return bytes(self.buffer[:end])
+            scanned = len(self.buffer)
+            if scanned > max_header:
+                raise InvalidEnvelope("Envelope header too long")
+            chunk = await self._next_chunk()
+            if chunk is None:
+                # Header-only envelope
+                return bytes(self.buffer)
+            self.buffer += chunk
+
+    async def buffer_up_to(self, limit: int) -> bool:
+        """Buffer more of the body, up to about `limit` bytes; True if all of it fit."""
+        while len(self.buffer) <= limit:
+            chunk = await self._next_chunk()
+            if chunk is None:
+                return True
+            self.buffer += chunk
+        return False
+
+    async def body(self) -> AsyncIterator[bytes]:
+        """The buffered bytes, then the rest of the body as it arrives."""
+        if self.buffer:
+            buffered, self.buffer = bytes(self.buffer), bytearray()
+            yield buffered
+        while True:
+            chunk = await self._next_chunk()
+            if chunk is None:
+                return
+            yield chunk
+
+
+class EnvelopeForwarder:
+    """Bounded queue of envelopes drained by background workers."""
+
+    def __init__(
+        self,
+        session_getter: Callable[[], aiohttp.ClientSession],
+        max_queue: int = DEFAULT_QUEUE_SIZE,
+        workers: int = DEFAULT_WORKERS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_backoff: float = 0.5,
+        latency=None,
+    ):
+        self._session_getter = session_getter
+        self.max_queue = max_queue
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # Optional histogram observed per attempt as (seconds, outcome)
+        self.latency = latency
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"queued": 0, "forwarded": 0, "streamed": 0, "retried": 0, "failed": 0, "shed": 0}
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def start(self):
+        self._ensure_started()
+
+    def submit(self, url: str, envelope: bytes) -> bool:
+        """Queue an envelope for forwarding. Returns False when it was shed."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((url, envelope))
+        except asyncio.QueueFull:
+            self.stats["shed"] += 1
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    async def _worker(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            await asyncio.gather(*(self._forward_one(queue, url, body) for url, body in batch))
+
+    async def _forward_one(self, queue: asyncio.Queue, url: str, body: bytes):
+        # An unexpected error drops this envelope only; the worker keeps draining the queue
+        try:
+            await self._forward(url, body)
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error("Dropping Sentry envelope after unexpected error", extra={
+                "upstream_url": url,
+                "envelope_size": len(body),
+                "error": str(e),
+                "error_type": type(e).__name__
+            })
+        finally:
+            queue.task_done()
+
+    async def _forward(self, url: str, body: bytes):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retried"] += 1
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            started = time.perf_counter()
+            try:
+                async with self._session_getter().post(url, data=body, headers=ENVELOPE_HEADERS) as resp:
+                    status = resp.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = type(e).__name__
+            if self.latency is not None:
+                self.latency.observe(time.perf_counter() - started, "ok" if status == 200 else "error")
+            if status == 200:
+                self.stats["forwarded"] += 1
+                return
+            # Client errors other than rate limiting will not succeed on retry
+            if isinstance(status, int) and status < 500 and status != 429:
+                break
+            logger.debug("Sentry envelope forward attempt failed", extra={
+                "attempt": attempt + 1,
+                "status": status
+            })
+        self.stats["failed"] += 1
+        logger.warning("Dropping Sentry envelope after failed forward", extra={
+            "upstream_url": url,
+            "envelope_size": len(body)
+        })
+
+    async def forward_stream(self, url: str, body: AsyncIterable[bytes]) -> Union[int, str]:
+        """Stream one envelope upstream as it is read; returns the status (or error name)."""
+        started = time.perf_counter()
+        try:
+            async with self._session_getter().post(url, data=body, headers=ENVELOPE_HEADERS) as resp:
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = type(e).__name__
+        if self.latency is not None:
+            self.latency.observe(time.perf_counter() - started, "ok" if status == 200 else "error")
+        self.stats["streamed" if status == 200 else "failed"] += 1
+        return status
+
+    async def stop(self, timeout: float = DEFAULT_DRAIN_TIMEOUT):
+        """Drain queued envelopes (up to `timeout` seconds) and stop the workers."""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Sentry tunnel queue not drained before shutdown", extra={
+                "pending": self._queue.qsize()
+            })
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._loop = None